@@ -46,6 +46,70 @@ async function translateText(text) {
     }
 }
 
+// Function to translate text with a streamed response, calling onDelta with the text so far
+async function translateTextStreaming(text, onDelta) {
+    try {
+        const currentUser = await getCurrentUser();
+        const response = await fetch('http://localhost:8000/translate/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                text: text,
+                user_id: currentUser ? currentUser.user_id : null
+            })
+        });
+        
+        if (!response.ok || !response.body) {
+            console.error('Streaming translation failed:', response.status, response.statusText);
+            return null;
+        }
+        
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let translated = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Server-Sent Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let eventType = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event:')) eventType = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                if (!data) continue;
+                const payload = JSON.parse(data);
+                
+                if (eventType === 'message' && payload.delta) {
+                    translated += payload.delta;
+                    onDelta(translated);
+                } else if (eventType === 'done') {
+                    console.log(`Streamed translation finished (first token after ${payload.ttft_ms} ms)`);
+                    return payload.translated_text;
+                } else if (eventType === 'error') {
+                    console.error('Streaming translation error:', payload.detail);
+                    return null;
+                }
+            }
+        }
+        return translated || null;
+    } catch (error) {
+        console.error('Error streaming translation:', error);
+        return null;
+    }
+}
+
 // Function to create and show popup animation
 async function showHighlightPopup(selectedText) {
     // Remove any existing popups
@@ -143,8 +207,13 @@ async function showHighlightPopup(selectedText) {
         popup: popup
     };
     
-    // Get translation
-    const translatedResult = await translateText(selectedText);
+    // Get translation, showing partial text as it streams in
+    let translatedResult = await translateTextStreaming(selectedText, (partial) => {
+        translatedText.textContent = partial;
+    });
+    if (!translatedResult) {
+        translatedResult = await translateText(selectedText);
+    }
     if (translatedResult) {
         translatedText.textContent = translatedResult;
         translatedText.style.color = '#2c5aa0';
@@ -196,14 +265,11 @@ async function sendHighlightToServer(highlightedText) {
             const result = await response.json();
             console.log('Successfully sent to server:', result);
             
-            // Log user data if available
-            if (result.user_data) {
-                console.log('User data updated:', {
-                    source_language: result.user_data.source_language,
-                    target_language: result.user_data.target_language,
-                    word_count: result.user_data.highlighted_words ? result.user_data.highlighted_words.length : 0
-                });
-            }
+            // Log the change to the user's word list
+            console.log('User data updated:', {
+                added: result.added,
+                word_count: result.word_count
+            });
             
             // Log Letta response if available
             if (result.letta_response) {
@@ -230,7 +230,7 @@ async function loadUserData() {
     if (!currentUser) return;
     
     try {
-        const response = await fetch(`http://localhost:8000/users/${currentUser.user_id}`);
+        const response = await fetch(`http://localhost:8000/users/${currentUser.user_id}?include_words=false`);
         if (response.ok) {
             const result = await response.json();
             const userData = result.data;
@@ -239,7 +239,7 @@ async function loadUserData() {
             document.getElementById('user-display-name').textContent = currentUser.user_id;
             
             // Update words count
-            document.getElementById('words-count').textContent = userData.highlighted_words.length;
+            document.getElementById('words-count').textContent = userData.word_count;
             
             // Update language selectors
             updateLanguageSelectors(userData.source_language, userData.target_language);
@@ -0,0 +1,181 @@
+import asyncio
+import struct
+from typing import Optional
+
+import numpy as np
+
+# Whisper expects 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# Raw PCM sample formats a client can announce with a config message
+PCM_FORMATS = {
+    "pcm_s16le": (np.dtype("<i2"), 32768.0),
+    "pcm_s32le": (np.dtype("<i4"), 2147483648.0),
+    "pcm_f32le": (np.dtype("<f4"), 1.0)
+}
+
+class AudioDecodeError(Exception):
+    """A frame could not be decoded."""
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """Vectorized linear-interpolation resampling of a mono float32 signal."""
+    if src_rate == dst_rate or len(audio) == 0:
+        return audio
+    n_out = int(round(len(audio) * dst_rate / src_rate))
+    positions = np.arange(n_out, dtype=np.float64) * (src_rate / dst_rate)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+def pcm_to_float32(data, dtype: np.dtype, scale: float, channels: int = 1, offset: int = 0,
+                   count: int = -1) -> np.ndarray:
+    """
+    View interleaved PCM bytes with np.frombuffer (no copy) and convert to mono
+    float32 in [-1, 1]; the conversion is the only allocation.
+    """
+    samples = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+    if channels > 1:
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+    if dtype.kind == "f" and scale == 1.0:
+        return samples.astype(np.float32, copy=False)
+    return samples.astype(np.float32) / np.float32(scale)
+
+def decode_wav(data: bytes) -> np.ndarray:
+    """Parse a RIFF/WAVE buffer in place and return 16 kHz mono float32 samples."""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise AudioDecodeError("not a WAV file")
+    view = memoryview(data)
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(data):
+        chunk_id = bytes(view[pos:pos + 4])
+        chunk_size = struct.unpack_from("<I", data, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+            if audio_format == 0xFFFE and chunk_size >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: the real format is the first two bytes of the sub-format GUID
+                audio_format = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (audio_format, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise AudioDecodeError("WAV data chunk before fmt chunk")
+            audio_format, channels, sample_rate, bits = fmt
+            # Streamed WAVs may carry a placeholder size; clamp to what we actually received
+            size = min(chunk_size, len(data) - body)
+            if audio_format == 1 and bits == 16:
+                dtype, scale = np.dtype("<i2"), 32768.0
+            elif audio_format == 1 and bits == 32:
+                dtype, scale = np.dtype("<i4"), 2147483648.0
+            elif audio_format == 3 and bits == 32:
+                dtype, scale = np.dtype("<f4"), 1.0
+            elif audio_format == 1 and bits == 8:
+                samples = (np.frombuffer(data, dtype=np.uint8, count=size, offset=body).astype(np.float32) - 128.0) / 128.0
+                if channels > 1:
+                    samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+                return resample(samples, sample_rate)
+            else:
+                raise AudioDecodeError(f"unsupported WAV encoding (format {audio_format}, {bits} bits)")
+            count = size // dtype.itemsize
+            return resample(pcm_to_float32(data, dtype, scale, channels, offset=body, count=count), sample_rate)
+        # Chunks are word-aligned
+        pos = body + chunk_size + (chunk_size & 1)
+    raise AudioDecodeError("WAV file has no data chunk")
+
+class PipeDecoder:
+    """
+    One long-lived ffmpeg process per connection for compressed streams
+    (webm/opus, ogg). Container chunks are written to its stdin as they arrive
+    and 16 kHz s16le PCM is collected from its stdout, so continuation chunks
+    that have no header of their own decode correctly and nothing touches disk.
+    """
+
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._pcm = bytearray()
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        self._reader = asyncio.create_task(self._read_stdout())
+
+    async def _read_stdout(self) -> None:
+        while True:
+            chunk = await self.process.stdout.read(65536)
+            if not chunk:
+                return
+            self._pcm.extend(chunk)
+
+    def _take(self) -> np.ndarray:
+        usable = len(self._pcm) - len(self._pcm) % 2
+        if usable == 0:
+            return np.zeros(0, dtype=np.float32)
+        audio = pcm_to_float32(self._pcm, np.dtype("<i2"), 32768.0, count=usable // 2)
+        del self._pcm[:usable]
+        return audio
+
+    async def feed(self, data: bytes) -> np.ndarray:
+        """Write a chunk and return whatever PCM ffmpeg has produced so far."""
+        if self.process is None:
+            await self.start()
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+        # Let the reader pick up output produced for earlier chunks
+        await asyncio.sleep(0)
+        return self._take()
+
+    async def close(self) -> np.ndarray:
+        """Close stdin, wait for ffmpeg to drain and return the remaining PCM."""
+        if self.process is None:
+            return np.zeros(0, dtype=np.float32)
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self._reader, timeout=5.0)
+            await asyncio.wait_for(self.process.wait(), timeout=5.0)
+        except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+            self.process.kill()
+        return self._take()
+
+class AudioDecoder:
+    """
+    Per-connection decoder. WAV frames and raw PCM (after a config message
+    announcing format, sample rate and channels) are decoded in memory with
+    NumPy; anything else is treated as one continuous compressed stream and
+    sent through a PipeDecoder.
+    """
+
+    def __init__(self):
+        self.pcm_format: Optional[str] = None
+        self.sample_rate = SAMPLE_RATE
+        self.channels = 1
+        self._pipe: Optional[PipeDecoder] = None
+
+    def configure(self, pcm_format: str, sample_rate: int = SAMPLE_RATE, channels: int = 1) -> None:
+        if pcm_format not in PCM_FORMATS:
+            raise AudioDecodeError(f"unsupported PCM format: {pcm_format}")
+        self.pcm_format = pcm_format
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    async def decode(self, data: bytes) -> np.ndarray:
+        if data[:4] == b"RIFF":
+            return decode_wav(data)
+        if self.pcm_format is not None:
+            dtype, scale = PCM_FORMATS[self.pcm_format]
+            usable = len(data) - len(data) % (dtype.itemsize * self.channels)
+            samples = pcm_to_float32(data, dtype, scale, self.channels, count=usable // dtype.itemsize)
+            return resample(samples, self.sample_rate)
+        if self._pipe is None:
+            self._pipe = PipeDecoder()
+        return await self._pipe.feed(data)
+
+    async def close(self) -> np.ndarray:
+        """Flush the compressed-stream decoder, if one was started."""
+        if self._pipe is None:
+            return np.zeros(0, dtype=np.float32)
+        pipe, self._pipe = self._pipe, None
+        return await pipe.close()
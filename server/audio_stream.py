@@ -0,0 +1,111 @@
+from collections import deque
+from typing import List, Optional, Tuple
+
+import numpy as np
+from audio_decode import SAMPLE_RATE
+
+class UtteranceSegmenter:
+    """
+    Per-connection rolling PCM buffer with energy-based voice activity detection.
+
+    Audio is fed in arbitrary-sized chunks and analysed in fixed frames. A run
+    of voiced frames opens an utterance (including a short pre-roll so the first
+    syllable is not clipped); `min_silence_ms` of quiet closes it. While an
+    utterance is open, a "partial" event with the audio so far is emitted every
+    `partial_interval` seconds for re-decoding, and a "final" event is emitted
+    when it closes or reaches `max_utterance_seconds`.
+
+    Memory is bounded: the utterance lives in a preallocated buffer of
+    `max_utterance_seconds` and the pre-roll is a fixed-length deque.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE, frame_ms: int = 30,
+                 energy_threshold: float = 0.01, min_speech_ms: int = 250,
+                 min_silence_ms: int = 700, preroll_ms: int = 300,
+                 partial_interval: float = 1.0, max_utterance_seconds: float = 30.0):
+        self.sample_rate = sample_rate
+        self.frame_len = sample_rate * frame_ms // 1000
+        self.energy_threshold = energy_threshold
+        self.min_speech_frames = max(1, min_speech_ms // frame_ms)
+        self.min_silence_frames = max(1, min_silence_ms // frame_ms)
+        self.partial_interval_samples = int(partial_interval * sample_rate)
+        self._utterance = np.zeros(int(max_utterance_seconds * sample_rate), dtype=np.float32)
+        self._length = 0
+        self._preroll: deque = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._in_speech = False
+        self._voiced_frames = 0
+        self._silent_frames = 0
+        self._since_partial = 0
+
+    def feed(self, samples: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+        """Add samples; return ("partial" | "final", audio) events in order."""
+        samples = np.concatenate((self._remainder, samples.astype(np.float32, copy=False)))
+        n_frames = len(samples) // self.frame_len
+        self._remainder = samples[n_frames * self.frame_len:].copy()
+        if n_frames == 0:
+            return []
+
+        frames = samples[:n_frames * self.frame_len].reshape(n_frames, self.frame_len)
+        voiced = np.sqrt(np.mean(frames * frames, axis=1)) >= self.energy_threshold
+
+        events = []
+        for frame, is_voiced in zip(frames, voiced):
+            if not self._in_speech:
+                if is_voiced:
+                    self._in_speech = True
+                    self._voiced_frames = 1
+                    self._silent_frames = 0
+                    self._since_partial = 0
+                    for pre in self._preroll:
+                        self._append(pre)
+                    self._preroll.clear()
+                    self._append(frame)
+                else:
+                    self._preroll.append(frame.copy())
+                continue
+
+            self._append(frame)
+            if is_voiced:
+                self._voiced_frames += 1
+                self._silent_frames = 0
+            else:
+                self._silent_frames += 1
+
+            if self._silent_frames >= self.min_silence_frames:
+                event = self._close()
+                if event is not None:
+                    events.append(event)
+            elif self._length >= len(self._utterance) - self.frame_len:
+                # Utterance buffer full: finalize what we have and keep listening
+                event = self._close()
+                if event is not None:
+                    events.append(event)
+            elif self._since_partial >= self.partial_interval_samples:
+                self._since_partial = 0
+                if self._voiced_frames >= self.min_speech_frames:
+                    events.append(("partial", self._utterance[:self._length].copy()))
+        return events
+
+    def flush(self) -> Optional[Tuple[str, np.ndarray]]:
+        """Finalize any open utterance (e.g. on idle timeout or disconnect)."""
+        if not self._in_speech:
+            return None
+        return self._close()
+
+    def _append(self, frame: np.ndarray) -> None:
+        end = self._length + len(frame)
+        self._utterance[self._length:end] = frame
+        self._length = end
+        self._since_partial += len(frame)
+
+    def _close(self) -> Optional[Tuple[str, np.ndarray]]:
+        event = None
+        if self._voiced_frames >= self.min_speech_frames:
+            event = ("final", self._utterance[:self._length].copy())
+        self._length = 0
+        self._in_speech = False
+        self._voiced_frames = 0
+        self._silent_frames = 0
+        self._since_partial = 0
+        return event
@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+Load-testing and micro-benchmark suite for the server.
+
+`api` drives /highlight, /translate, /users/* and /ws/audio at a fixed
+concurrency and reports p50/p95/p99 latency and throughput per scenario.
+With --spawn it starts its own stub LLM server and API server in a
+temporary directory, so runs are reproducible and never touch store.json.
+
+`store` times StateManager operations directly at growing store sizes.
+
+`phrases` builds a synthetic store where many users highlight the same
+popular words, phrases and multi-line snippets, and reports the JSON store's
+file size, memory and load time with the strings inline (the old layout)
+and in the shared phrase table.
+
+Both write their results as JSON (--output) and can print the change against
+an earlier results file (--compare).
+
+Usage: python benchmark.py api [--spawn] [--url http://localhost:8000] [--concurrency 16] [--requests 500]
+                               [--scenarios highlight,translate,users,audio] [--output results.json]
+       python benchmark.py store [--sizes 100,1000,10000] [--backend json|sharded|sqlite] [--iterations 2000]
+       python benchmark.py phrases [--users 5000] [--words-per-user 40] [--phrases 5000] [--snippet-share 0.2]
+       python benchmark.py compare new.json old.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_RATE = 16000
+API_SCENARIOS = ("highlight", "translate", "users", "audio")
+
+def summarize(latencies: List[float], errors: int, elapsed: float, first_error: Optional[str] = None) -> Dict:
+    """Latency percentiles in milliseconds plus throughput for one scenario."""
+    ordered = sorted(latencies)
+
+    def percentile(p: float) -> float:
+        if not ordered:
+            return 0.0
+        # Nearest-rank percentile
+        return round(ordered[max(0, int(round(p / 100 * len(ordered))) - 1)] * 1000, 4)
+
+    return {
+        "requests": len(ordered) + errors,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4) if ordered else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 4) if ordered else 0.0,
+        "first_error": first_error
+    }
+
+async def run_load(operation: Callable[[int], Awaitable[None]], requests: int, concurrency: int) -> Dict:
+    """Call `operation(i)` for i in range(requests) from `concurrency` workers."""
+    latencies: List[float] = []
+    errors = 0
+    first_error = None
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors, first_error
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                await operation(index)
+                latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors += 1
+                first_error = first_error or f"{type(e).__name__}: {e}"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started, first_error)
+
+def synthetic_wav(seconds: float, frequency: float = 440.0) -> bytes:
+    """A sine tone as 16-bit mono WAV, like test_websocket.py sends."""
+    t = np.linspace(0, seconds, int(SAMPLE_RATE * seconds), False)
+    samples = (0.5 * np.sin(2 * np.pi * frequency * t) * 32767).astype(np.int16)
+    with io.BytesIO() as buffer:
+        with wave.open(buffer, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(SAMPLE_RATE)
+            wav_file.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+def check(response: httpx.Response) -> None:
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+async def bench_api(args) -> Dict:
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=60.0) as client:
+        users = [f"bench-user-{i}" for i in range(args.users)]
+
+        async def highlight(i: int):
+            check(await client.post("/highlight", json={"highlight": f"word{i}", "user_id": users[i % len(users)]}))
+
+        async def translate(i: int):
+            # Unique texts measure the upstream path; --repeat-texts measures cache hits instead
+            text = f"benchmark sentence number {i % args.repeat_texts if args.repeat_texts else i}"
+            check(await client.post("/translate", json={"text": text, "user_id": users[i % len(users)]}))
+
+        async def users_mix(i: int):
+            user_id = users[i % len(users)]
+            kind = i % 3
+            if kind == 0:
+                check(await client.get(f"/users/{user_id}", params={"include_words": "false"}))
+            elif kind == 1:
+                check(await client.get(f"/users/{user_id}/words", params={"limit": 50}))
+            else:
+                language = ("French", "German", "Spanish")[i % 9 // 3]
+                check(await client.post("/users/languages", json={"user_id": user_id, "target_language": language}))
+
+        audio = synthetic_wav(args.audio_seconds)
+
+        async def audio_session(i: int):
+            import websockets
+            uri = args.url.replace("http", "ws", 1) + f"/ws/audio?user_id={users[i % len(users)]}"
+            async with websockets.connect(uri, max_size=None) as websocket:
+                await websocket.send(audio)
+                await websocket.send("flush")
+                while True:
+                    message = json.loads(await asyncio.wait_for(websocket.recv(), timeout=args.audio_timeout))
+                    if message["type"] == "ping":
+                        await websocket.send(json.dumps({"type": "pong"}))
+                    elif message["type"] in ("error", "busy"):
+                        raise RuntimeError(message.get("message"))
+                    elif message["type"] == "final":
+                        return
+
+        operations = {"highlight": highlight, "translate": translate, "users": users_mix, "audio": audio_session}
+        for scenario in args.scenarios.split(","):
+            requests = args.audio_sessions if scenario == "audio" else args.requests
+            concurrency = min(args.concurrency, args.audio_concurrency) if scenario == "audio" else args.concurrency
+            # A few untimed calls first so connection setup and lazy model loads are not measured
+            await run_load(operations[scenario], min(args.warmup, requests), concurrency)
+            results[scenario] = {"concurrency": concurrency, **await run_load(operations[scenario], requests, concurrency)}
+            print_result(scenario, results[scenario])
+        if "audio" in args.scenarios:
+            results["stt_stats"] = (await client.get("/stt/stats")).json()
+    return results
+
+def wait_until_up(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+def spawn_servers(args, workdir: str) -> List[subprocess.Popen]:
+    """Start the stub LLM server and the API server against it, with state kept in `workdir`."""
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    env = {
+        **os.environ,
+        "STUB_PORT": str(args.stub_port),
+        "STUB_LATENCY_MS": str(args.stub_latency_ms),
+        "GROQ_BASE_URL": stub_url,
+        "GROQ_API_KEY": "benchmark",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")
+    }
+    # The stub logs every request; keep that out of the report
+    stub = subprocess.Popen([sys.executable, os.path.join(SERVER_DIR, "stub_llm_server.py")], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f"{stub_url}/stats", 30)
+    port = int(args.url.rsplit(":", 1)[1])
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SERVER_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    wait_until_up(f"{args.url}/", 120)
+    return [stub, server]
+
+def bench_store(args) -> Dict:
+    sys.path.insert(0, SERVER_DIR)
+    from state_manager import StateManager
+    from storage import create_storage
+
+    results = {}
+    for size in (int(size) for size in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as workdir:
+            if args.backend == "sqlite":
+                storage = create_storage("sqlite", db_file=os.path.join(workdir, "store.db"))
+            elif args.backend == "sharded":
+                storage = create_storage("sharded", root_dir=os.path.join(workdir, "users"), cache_size=args.cache_users)
+            else:
+                storage = create_storage("json", store_file=os.path.join(workdir, "store.json"))
+            state = StateManager(storage)
+            for i in range(size):
+                state.create_user(f"user-{i}")
+                for j in range(args.words_per_user):
+                    state.add_highlighted_word(f"user-{i}", f"word-{j}")
+
+            def user(i: int) -> str:
+                return f"user-{(i * 7919) % size}"
+
+            operations = {
+                "get_user": lambda i: state.get_user(user(i), include_words=False),
+                "get_user_with_words": lambda i: state.get_user(user(i)),
+                "add_highlighted_word": lambda i: state.add_highlighted_word(user(i), f"new-{i}"),
+                "get_highlighted_words_page": lambda i: state.get_highlighted_words_page(user(i), limit=50),
+                "update_user_languages": lambda i: state.update_user_languages(user(i), target_language="French"),
+                "create_user": lambda i: state.create_user(f"fresh-{i}"),
+                "get_store_stats": lambda i: state.get_store_stats()
+            }
+            results[str(size)] = {}
+            for name, operation in operations.items():
+                # Whole-store operations get fewer iterations so large sizes finish in reasonable time
+                iterations = max(1, args.iterations // 100) if name == "get_store_stats" else args.iterations
+                latencies = []
+                started = time.perf_counter()
+                for i in range(iterations):
+                    op_started = time.perf_counter()
+                    operation(i)
+                    latencies.append(time.perf_counter() - op_started)
+                results[str(size)][name] = summarize(latencies, 0, time.perf_counter() - started)
+                print_result(f"{size:>7} users {name}", results[str(size)][name])
+            state.close()
+    return results
+
+def synthetic_phrases(rng: random.Random, count: int, snippet_share: float) -> List[str]:
+    """Distinct single words, short phrases and multi-line snippets, in random order."""
+    syllables = ["ca", "sa", "to", "me", "ri", "lo", "pa", "ne", "du", "vi", "ga", "ro", "te", "mu", "sol", "len"]
+
+    def word() -> str:
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(1, 4)))
+
+    phrases = set()
+    while len(phrases) < count:
+        roll = rng.random()
+        if roll < snippet_share:
+            # A pasted paragraph: a few lines of 8-16 words
+            phrases.add("\n".join(" ".join(word() for _ in range(rng.randint(8, 16))) for _ in range(rng.randint(2, 8))))
+        elif roll < snippet_share + (1 - snippet_share) / 2:
+            phrases.add(" ".join(word() for _ in range(rng.randint(2, 6))))
+        else:
+            phrases.add(word())
+    phrases = list(phrases)
+    rng.shuffle(phrases)
+    return phrases
+
+def bench_phrases(args) -> Dict:
+    sys.path.insert(0, SERVER_DIR)
+    import gc
+    import tracemalloc
+    from highlight_set import HighlightSet
+    from phrase_table import PhraseTable
+    from storage import JsonStorage, load_users
+
+    rng = random.Random(args.seed)
+    pool = synthetic_phrases(rng, args.phrases, args.snippet_share)
+    # Zipf popularity: a few phrases are highlighted by most users
+    weights = [1 / (rank + 1) ** args.zipf for rank in range(len(pool))]
+    users = {}
+    for i in range(args.users):
+        words = rng.choices(pool, weights, k=args.words_per_user)
+        # Some highlights are nobody else's
+        words += [f"note {i}-{j}: " + rng.choice(pool) for j in range(int(args.words_per_user * args.unique_share))]
+        users[f"user-{i}"] = {
+            "source_language": "auto",
+            "target_language": "Spanish",
+            "highlighted_words": HighlightSet(words).to_list(),
+            "version": 1
+        }
+
+    def measure(load: Callable[[], object]) -> Dict:
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        loaded = load()
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del loaded
+        return {"memory_bytes": current, "peak_memory_bytes": peak, "load_seconds": round(elapsed, 3)}
+
+    def load_file(path: str, phrases: Optional[PhraseTable]):
+        with open(path, 'r', encoding='utf-8') as f:
+            return load_users(json.load(f), phrases), phrases
+
+    with tempfile.TemporaryDirectory() as workdir:
+        before_file = os.path.join(workdir, "before.json")
+        after_file = os.path.join(workdir, "after.json")
+        # The old layout, written the way JsonStorage used to write snapshots
+        with open(before_file, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"users": users, "journal_seq": 0}, indent=2, ensure_ascii=False))
+        shutil.copy(before_file, after_file)
+        del users
+        # Opening the old layout converts it; closing writes the new snapshot
+        storage = JsonStorage(store_file=after_file)
+        counts = {**storage.get_stats()}
+        storage.close()
+        del storage
+
+        before = {"file_bytes": os.path.getsize(before_file), **measure(lambda: load_file(before_file, None))}
+        after = {"file_bytes": os.path.getsize(after_file), **measure(lambda: load_file(after_file, PhraseTable()))}
+
+    result = {
+        "users": counts["total_users"],
+        "highlighted_words": counts["total_highlighted_words"],
+        "unique_phrases": counts["unique_phrases"],
+        "before": before,
+        "after": after,
+        "file_reduction_percent": round((1 - after["file_bytes"] / before["file_bytes"]) * 100, 1),
+        "memory_reduction_percent": round((1 - after["memory_bytes"] / before["memory_bytes"]) * 100, 1)
+    }
+    print(f"{result['users']} users, {result['highlighted_words']} highlighted words, "
+          f"{result['unique_phrases']} distinct phrases")
+    print(f"{'':<16}{'file':>14}{'memory':>14}{'peak memory':>14}{'load':>10}")
+    for label, row in (("inline strings", before), ("phrase table", after)):
+        print(f"{label:<16}{row['file_bytes'] / 2**20:>11.1f} MB{row['memory_bytes'] / 2**20:>11.1f} MB"
+              f"{row['peak_memory_bytes'] / 2**20:>11.1f} MB{row['load_seconds']:>9.2f}s")
+    print(f"file {result['file_reduction_percent']}% smaller, memory {result['memory_reduction_percent']}% smaller")
+    return result
+
+def print_result(label: str, result: Dict) -> None:
+    print(f"{label:<40} {result['throughput_per_second']:>10.1f}/s  p50 {result['p50_ms']:>9.3f} ms  "
+          f"p95 {result['p95_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  errors {result['errors']}")
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(new: Dict, old: Dict) -> None:
+    """Print p50/p95/p99 and throughput changes for every scenario present in both result files."""
+    print(f"Comparing {new.get('commit')} ({new.get('started_at')}) with {old.get('commit')} ({old.get('started_at')})")
+    for section in ("api", "store"):
+        new_section, old_section = new.get(section) or {}, old.get(section) or {}
+        rows = []
+        for key, result in new_section.items():
+            if section == "store":
+                rows.extend((f"{key} users {name}", value, old_section.get(key, {}).get(name))
+                            for name, value in result.items())
+            elif "p50_ms" in result:
+                rows.append((key, result, old_section.get(key)))
+        for label, result, previous in rows:
+            if not previous:
+                continue
+            changes = []
+            for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_per_second"):
+                before, after = previous[metric], result[metric]
+                change = (after - before) / before * 100 if before else 0.0
+                changes.append(f"{metric} {before:g} -> {after:g} ({change:+.1f}%)")
+            print(f"{label:<40} " + "  ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    api = commands.add_parser("api", help="load-test the HTTP and WebSocket endpoints")
+    api.add_argument("--url", default="http://127.0.0.1:8000")
+    api.add_argument("--spawn", action="store_true", help="start a stub LLM server and the API server")
+    api.add_argument("--stub-port", type=int, default=8001)
+    api.add_argument("--stub-latency-ms", type=float, default=0.0, help="simulated Groq latency with --spawn")
+    api.add_argument("--scenarios", default=",".join(API_SCENARIOS))
+    api.add_argument("--concurrency", type=int, default=16)
+    api.add_argument("--requests", type=int, default=500, help="requests per HTTP scenario")
+    api.add_argument("--warmup", type=int, default=20, help="untimed requests before each scenario")
+    api.add_argument("--users", type=int, default=50, help="distinct user ids the load is spread over")
+    api.add_argument("--repeat-texts", type=int, default=0, help="cycle /translate over this many texts (0: unique)")
+    api.add_argument("--audio-sessions", type=int, default=16)
+    api.add_argument("--audio-concurrency", type=int, default=4)
+    api.add_argument("--audio-seconds", type=float, default=2.0)
+    api.add_argument("--audio-timeout", type=float, default=120.0)
+    api.add_argument("--output", help="write results as JSON")
+    api.add_argument("--compare", help="earlier results JSON to compare against")
+
+    store = commands.add_parser("store", help="micro-benchmark StateManager operations")
+    store.add_argument("--sizes", default="100,1000,10000", help="users in the store for each run")
+    store.add_argument("--backend", default="json", help="json, sharded or sqlite")
+    store.add_argument("--cache-users", type=int, default=1000, help="LRU size for the sharded backend")
+    store.add_argument("--words-per-user", type=int, default=20)
+    store.add_argument("--iterations", type=int, default=2000)
+    store.add_argument("--output", help="write results as JSON")
+    store.add_argument("--compare", help="earlier results JSON to compare against")
+
+    phrases = commands.add_parser("phrases", help="JSON store size and memory with and without the phrase table")
+    phrases.add_argument("--users", type=int, default=5000)
+    phrases.add_argument("--words-per-user", type=int, default=40, help="highlights drawn from the shared phrases")
+    phrases.add_argument("--phrases", type=int, default=5000, help="distinct shared phrases")
+    phrases.add_argument("--snippet-share", type=float, default=0.2, help="fraction of phrases that are multi-line snippets")
+    phrases.add_argument("--unique-share", type=float, default=0.1, help="extra per-user highlights, as a fraction")
+    phrases.add_argument("--zipf", type=float, default=1.0, help="skew of phrase popularity")
+    phrases.add_argument("--seed", type=int, default=1)
+    phrases.add_argument("--output", help="write results as JSON")
+
+    diff = commands.add_parser("compare", help="compare two results files")
+    diff.add_argument("new")
+    diff.add_argument("old")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        with open(args.new) as new_file, open(args.old) as old_file:
+            compare(json.load(new_file), json.load(old_file))
+        return
+
+    report = {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    }
+    if args.command == "api":
+        processes = []
+        with tempfile.TemporaryDirectory() as workdir:
+            try:
+                if args.spawn:
+                    processes = spawn_servers(args, workdir)
+                report["api"] = asyncio.run(bench_api(args))
+            finally:
+                for process in processes:
+                    process.terminate()
+                    process.wait()
+    elif args.command == "phrases":
+        report["phrases"] = bench_phrases(args)
+    else:
+        report["store"] = bench_store(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    if getattr(args, "compare", None):
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
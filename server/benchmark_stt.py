@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for batched Whisper inference.
+
+Simulates many connections finalizing utterances at once and reports
+throughput and latency for each batch size.
+
+Usage: python benchmark_stt.py [audio.wav] [--jobs 32] [--batch-sizes 1,2,4,8] [--window-ms 50]
+                               [--backend whisper|whisper-int8]
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from audio_decode import SAMPLE_RATE, decode_wav
+from stt_worker import InferenceExecutor
+
+def load_audio(path: str, seconds: float) -> np.ndarray:
+    if path:
+        with open(path, "rb") as f:
+            return decode_wav(f.read())
+    # Amplitude-modulated tone: timing is what matters here, not the transcript
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.3 * np.sin(2 * np.pi * 220 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))).astype(np.float32)
+
+async def run(model_name: str, backend: str, audio: np.ndarray, jobs: int, batch_size: int, window: float,
+              workers: int):
+    executor = InferenceExecutor(model_name, workers=workers, max_queue=jobs, job_timeout=600.0,
+                                 max_batch_size=batch_size, batch_window=window, backend=backend)
+    executor.start()
+    await executor.load()
+
+    latencies = []
+
+    async def one():
+        started = time.perf_counter()
+        await executor.transcribe(audio, fp16=False, temperature=0.0, condition_on_previous_text=False)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(jobs)))
+    elapsed = time.perf_counter() - started
+    stats = executor.get_stats()
+    executor.shutdown()
+
+    latencies.sort()
+    print(f"batch {batch_size:>2}: {jobs / elapsed:6.2f} utt/s  "
+          f"audio x{jobs * len(audio) / SAMPLE_RATE / elapsed:6.1f} realtime  "
+          f"p50 {latencies[len(latencies) // 2] * 1000:7.0f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.0f} ms  "
+          f"avg batch {stats['avg_batch_size']}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("audio", nargs="?", default="", help="16-bit WAV file (default: synthetic tone)")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--backend", default="whisper", help="whisper or whisper-int8")
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of the synthetic utterance")
+    parser.add_argument("--jobs", type=int, default=32, help="concurrent utterances per run")
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--window-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    audio = load_audio(args.audio, args.seconds)
+    print(f"Model {args.model} ({args.backend}), {args.jobs} utterances of {len(audio) / SAMPLE_RATE:.1f}s, {args.workers} worker(s)")
+    for batch_size in (int(size) for size in args.batch_sizes.split(",")):
+        asyncio.run(run(args.model, args.backend, audio, args.jobs, batch_size, args.window_ms / 1000, args.workers))
+
+if __name__ == "__main__":
+    main()
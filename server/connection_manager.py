@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, Optional, Set
+
+from fastapi import WebSocket
+from coordination import Coordinator
+
+logger = logging.getLogger(__name__)
+
+class Connection:
+    """One registered socket: its user, outgoing queue and sender task."""
+
+    def __init__(self, websocket: WebSocket, user_id: Optional[str], queue_size: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.sender: Optional[asyncio.Task] = None
+        self.last_received = time.monotonic()
+        self.last_sent = time.monotonic()
+
+class ConnectionManager:
+    """
+    Registry of open WebSockets keyed by socket and by user.
+
+    Messages are never sent inline: each connection has a bounded queue drained
+    by its own sender task, so fan-out is a non-blocking enqueue per socket and
+    one slow client cannot hold up the others. A connection whose queue fills
+    up, or whose send takes longer than `send_timeout`, is evicted. A heartbeat
+    pings connections that have been quiet for `heartbeat_interval` seconds and
+    closes those that have sent nothing for `idle_timeout` seconds.
+
+    `broadcast` and `send_to_user` go through the coordination backend so they
+    reach sockets held by every server process.
+    """
+
+    def __init__(self, coordinator: Coordinator, queue_size: int = 256, send_timeout: float = 10.0,
+                 heartbeat_interval: float = 20.0, idle_timeout: float = 120.0):
+        self.coordinator = coordinator
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.idle_timeout = idle_timeout
+        self.connections: Dict[WebSocket, Connection] = {}
+        self.by_user: Dict[str, Set[WebSocket]] = {}
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.evicted_slow = 0
+        self.evicted_idle = 0
+        coordinator.subscribe("broadcast", self._deliver_broadcast)
+        coordinator.subscribe("user", self._deliver_user)
+
+    def start(self) -> None:
+        if self.heartbeat_interval > 0:
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+
+    async def close(self) -> None:
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        for websocket in list(self.connections):
+            self.disconnect(websocket)
+
+    async def connect(self, websocket: WebSocket, user_id: Optional[str] = None) -> None:
+        await websocket.accept()
+        connection = Connection(websocket, user_id, self.queue_size)
+        connection.sender = asyncio.create_task(self._run_sender(connection))
+        self.connections[websocket] = connection
+        if user_id:
+            self.by_user.setdefault(user_id, set()).add(websocket)
+        logger.info("WebSocket connected. Total connections: %d", len(self.connections))
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        """Unregister a socket; safe to call more than once."""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        self._unbind(connection)
+        if connection.sender is not None and connection.sender is not asyncio.current_task():
+            connection.sender.cancel()
+        logger.info("WebSocket disconnected. Total connections: %d", len(self.connections))
+
+    def bind_user(self, websocket: WebSocket, user_id: Optional[str]) -> None:
+        """Associate a socket with a user (e.g. once its first message names one)."""
+        connection = self.connections.get(websocket)
+        if connection is None or not user_id or connection.user_id == user_id:
+            return
+        self._unbind(connection)
+        connection.user_id = user_id
+        self.by_user.setdefault(user_id, set()).add(websocket)
+
+    def _unbind(self, connection: Connection) -> None:
+        sockets = self.by_user.get(connection.user_id)
+        if sockets is not None:
+            sockets.discard(connection.websocket)
+            if not sockets:
+                del self.by_user[connection.user_id]
+
+    def touch(self, websocket: WebSocket) -> None:
+        """Record inbound activity so the heartbeat does not treat the socket as dead."""
+        connection = self.connections.get(websocket)
+        if connection is not None:
+            connection.last_received = time.monotonic()
+
+    def send_text(self, websocket: WebSocket, message: str) -> bool:
+        """Queue a message for one socket; False if it is gone or was evicted as too slow."""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return False
+        try:
+            connection.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            self.evicted_slow += 1
+            logger.warning("Evicting slow WebSocket consumer (%d messages queued)", connection.queue.qsize())
+            self._evict(connection, 1013)
+            return False
+
+    def send_json(self, websocket: WebSocket, data: Dict) -> bool:
+        return self.send_text(websocket, json.dumps(data, ensure_ascii=False))
+
+    async def send_personal_message(self, message: str, websocket: WebSocket):
+        self.send_text(websocket, message)
+
+    async def broadcast(self, message: str):
+        """Send to every connection on every server process."""
+        await self.coordinator.publish("broadcast", {"message": message})
+
+    async def send_to_user(self, user_id: str, message: str):
+        """Send to every connection of `user_id` on every server process."""
+        await self.coordinator.publish("user", {"user_id": user_id, "message": message})
+
+    async def _deliver_broadcast(self, payload: Dict) -> None:
+        for websocket in list(self.connections):
+            self.send_text(websocket, payload["message"])
+
+    async def _deliver_user(self, payload: Dict) -> None:
+        for websocket in list(self.by_user.get(payload["user_id"], ())):
+            self.send_text(websocket, payload["message"])
+
+    def _evict(self, connection: Connection, code: int) -> None:
+        self.disconnect(connection.websocket)
+        asyncio.create_task(self._close_quietly(connection.websocket, code))
+
+    async def _close_quietly(self, websocket: WebSocket, code: int) -> None:
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def _run_sender(self, connection: Connection) -> None:
+        while True:
+            message = await connection.queue.get()
+            try:
+                await asyncio.wait_for(connection.websocket.send_text(message), timeout=self.send_timeout)
+                connection.last_sent = time.monotonic()
+            except asyncio.TimeoutError:
+                self.evicted_slow += 1
+                logger.warning("Evicting WebSocket consumer that stopped reading")
+                self._evict(connection, 1013)
+                return
+            except Exception:
+                # Socket already closed; the endpoint's receive loop will notice too
+                self.disconnect(connection.websocket)
+                return
+
+    async def _run_heartbeat(self) -> None:
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            for connection in list(self.connections.values()):
+                if now - connection.last_received > self.idle_timeout:
+                    self.evicted_idle += 1
+                    logger.info("Closing idle WebSocket")
+                    self._evict(connection, 1001)
+                elif now - max(connection.last_sent, connection.last_received) >= self.heartbeat_interval:
+                    self.send_text(connection.websocket, ping)
+
+    def get_stats(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "users": len(self.by_user),
+            "queued_messages": sum(connection.queue.qsize() for connection in self.connections.values()),
+            "evicted_slow": self.evicted_slow,
+            "evicted_idle": self.evicted_idle
+        }
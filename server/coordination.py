@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict], Awaitable[None]]
+
+class Coordinator:
+    """
+    Message fan-out and shared key-value cache between server processes.
+
+    `publish` delivers a JSON-serializable message to every process subscribed
+    to the channel (including the publisher); subscribe before `start`.
+    `kv_get`/`kv_set` are a shared string cache with expiry; `shared` is False
+    when nothing is shared, so callers can skip it.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, channel: str, handler: Handler) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def _dispatch(self, channel: str, message: Dict) -> None:
+        for handler in self._handlers.get(channel, []):
+            try:
+                await handler(message)
+            except Exception as e:
+                logger.error("Error handling %r message: %s", channel, e)
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def publish(self, channel: str, message: Dict) -> None:
+        raise NotImplementedError
+
+    def kv_get(self, key: str) -> Optional[str]:
+        return None
+
+    def kv_set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    def get_stats(self) -> Dict:
+        return {"backend": "local", "shared": self.shared}
+
+class LocalCoordinator(Coordinator):
+    """Single-process default: messages go straight to this process's handlers."""
+
+    async def publish(self, channel: str, message: Dict) -> None:
+        await self._dispatch(channel, message)
+
+class SQLiteCoordinator(Coordinator):
+    """
+    Coordination through a WAL-mode SQLite file, for several workers on one
+    host (and for tests). Each process polls the messages table every
+    `poll_interval` seconds for rows newer than the last one it saw; rows older
+    than `retention` seconds are pruned.
+    """
+
+    shared = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS kv (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, db_file: str = "coordination.db", poll_interval: float = 0.05, retention: float = 60.0):
+        super().__init__()
+        self.db_file = db_file
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.SCHEMA)
+        self._last_id = 0
+        self._next_prune = 0.0
+        self._poller: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self) -> None:
+        # Only messages published from now on are delivered to this process
+        with self._lock:
+            self._last_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        self._poller = asyncio.create_task(self._poll())
+        logger.info("SQLite coordination started at %s", self.db_file)
+
+    async def close(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        with self._lock:
+            self.conn.close()
+
+    async def publish(self, channel: str, message: Dict) -> None:
+        payload = json.dumps(message, ensure_ascii=False)
+        await asyncio.to_thread(self._insert, channel, payload)
+        self.published += 1
+
+    def _insert(self, channel: str, payload: str) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO messages (channel, payload, created_at) VALUES (?, ?, ?)",
+                (channel, payload, time.time())
+            )
+
+    def _fetch(self) -> List:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, channel, payload FROM messages WHERE id > ? ORDER BY id", (self._last_id,)
+            ).fetchall()
+            now = time.time()
+            if now >= self._next_prune:
+                # Drop what every process has long since read, and expired cache entries
+                self._next_prune = now + self.retention
+                self.conn.execute("DELETE FROM messages WHERE created_at < ?", (now - self.retention,))
+                self.conn.execute("DELETE FROM kv WHERE expires_at < ?", (now,))
+        return rows
+
+    async def _poll(self) -> None:
+        while True:
+            try:
+                rows = await asyncio.to_thread(self._fetch)
+            except sqlite3.Error as e:
+                logger.error("Coordination poll failed: %s", e)
+                rows = []
+            for row_id, channel, payload in rows:
+                self._last_id = row_id
+                self.delivered += 1
+                await self._dispatch(channel, json.loads(payload))
+            await asyncio.sleep(self.poll_interval)
+
+    def kv_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+    def kv_set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (key, value, time.time() + ttl))
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": "sqlite",
+            "shared": self.shared,
+            "db_file": self.db_file,
+            "published": self.published,
+            "delivered": self.delivered
+        }
+
+class RedisCoordinator(Coordinator):
+    """
+    Coordination through Redis (or any server speaking its protocol) for
+    workers spread across hosts: channels map to Redis pub/sub and the
+    key-value cache to SET with an expiry. Requires the `redis` package.
+    """
+
+    shared = True
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "highlight:"):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise RuntimeError("COORDINATION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.async_client = redis.asyncio.Redis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self) -> None:
+        self._pubsub = self.async_client.pubsub()
+        await self._pubsub.subscribe(*(self.prefix + channel for channel in self._handlers))
+        self._listener = asyncio.create_task(self._listen())
+        logger.info("Redis coordination started at %s", self.url)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.close()
+        await self.async_client.close()
+        self.client.close()
+
+    async def _listen(self) -> None:
+        async for item in self._pubsub.listen():
+            if item["type"] != "message":
+                continue
+            self.delivered += 1
+            await self._dispatch(item["channel"][len(self.prefix):], json.loads(item["data"]))
+
+    async def publish(self, channel: str, message: Dict) -> None:
+        await self.async_client.publish(self.prefix + channel, json.dumps(message, ensure_ascii=False))
+        self.published += 1
+
+    def kv_get(self, key: str) -> Optional[str]:
+        return self.client.get(self.prefix + key)
+
+    def kv_set(self, key: str, value: str, ttl: float) -> None:
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def get_stats(self) -> Dict:
+        return {
+            "backend": "redis",
+            "shared": self.shared,
+            "url": self.url,
+            "published": self.published,
+            "delivered": self.delivered
+        }
+
+def create_coordinator(backend: str = "local", **options) -> Coordinator:
+    """Build a coordination backend by name ("local", "sqlite" or "redis")."""
+    if backend == "local":
+        return LocalCoordinator()
+    if backend == "sqlite":
+        return SQLiteCoordinator(**options)
+    if backend == "redis":
+        return RedisCoordinator(**options)
+    raise ValueError(f"Unknown coordination backend: {backend}")
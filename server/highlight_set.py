@@ -0,0 +1,121 @@
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from phrase_table import PhraseTable
+
+def normalize_word(word: str) -> str:
+    """Dedup key for a highlight: case-folded with runs of whitespace collapsed."""
+    return " ".join(word.split()).casefold()
+
+class HighlightSet:
+    """
+    Insertion-ordered set of highlighted words with O(1) add, contains and remove.
+
+    Words are keyed by `normalize_word`, so "Hello", "hello " and "HELLO"
+    count as one entry; the first spelling seen is the one kept. Every entry
+    gets an increasing sequence number that serves as a pagination cursor.
+    Removals leave a tombstone that is compacted away once tombstones make up
+    half of the slots.
+
+    With a PhraseTable, the set holds phrase IDs instead of strings and
+    resolves them when words are read, so a phrase many users highlighted
+    is stored once. Call `clear` before dropping such a set to release its
+    references.
+    """
+
+    def __init__(self, words: Optional[Iterable[str]] = None, phrases: Optional["PhraseTable"] = None):
+        self._phrases = phrases
+        self._index: Dict[str, int] = {}
+        self._seqs: List[int] = []
+        self._values: List[Optional[str]] = []
+        self._next_seq = 1
+        self._tombstones = 0
+        if words:
+            for word in words:
+                self.add(word)
+
+    def add(self, word: str) -> bool:
+        """Add a word; return False if an equivalent word is already present."""
+        key = normalize_word(word)
+        if key in self._index:
+            return False
+        value = word
+        if self._phrases is not None:
+            value = self._phrases.acquire(word)
+            # The table's copy of the key is shared by every user holding the phrase
+            key = self._phrases.key(value)
+        self._index[key] = len(self._values)
+        self._seqs.append(self._next_seq)
+        self._values.append(value)
+        self._next_seq += 1
+        return True
+
+    def discard(self, word: str) -> bool:
+        """Remove the word equivalent to `word`; return False if absent."""
+        pos = self._index.pop(normalize_word(word), None)
+        if pos is None:
+            return False
+        if self._phrases is not None:
+            self._phrases.release(self._values[pos])
+        self._values[pos] = None
+        self._tombstones += 1
+        if self._tombstones * 2 > len(self._values):
+            self._compact()
+        return True
+
+    def clear(self) -> None:
+        """Remove every word, releasing phrase references."""
+        if self._phrases is not None:
+            for value in self._values:
+                if value is not None:
+                    self._phrases.release(value)
+        self._index = {}
+        self._seqs = []
+        self._values = []
+        self._tombstones = 0
+
+    def _key(self, value: str) -> str:
+        return normalize_word(value) if self._phrases is None else self._phrases.key(value)
+
+    def _text(self, value: str) -> str:
+        return value if self._phrases is None else self._phrases.text(value)
+
+    def _compact(self) -> None:
+        live = [(seq, value) for seq, value in zip(self._seqs, self._values) if value is not None]
+        self._seqs = [seq for seq, _ in live]
+        self._values = [value for _, value in live]
+        self._index = {self._key(value): pos for pos, value in enumerate(self._values)}
+        self._tombstones = 0
+
+    def page(self, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        """
+        Return up to `limit` words inserted after cursor `after`, and the cursor
+        for the next page (None once the end is reached).
+        """
+        words = []
+        pos = bisect_right(self._seqs, after)
+        while pos < len(self._values) and len(words) < limit:
+            if self._values[pos] is not None:
+                words.append(self._text(self._values[pos]))
+            pos += 1
+        while pos < len(self._values) and self._values[pos] is None:
+            pos += 1
+        next_cursor = self._seqs[pos - 1] if pos < len(self._values) else None
+        return words, next_cursor
+
+    def __contains__(self, word: str) -> bool:
+        return normalize_word(word) in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._text(value) for value in self._values if value is not None)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def to_list(self) -> List[str]:
+        return [self._text(value) for value in self._values if value is not None]
+
+    def stored_values(self) -> List[str]:
+        """The words as stored: phrase IDs with a PhraseTable, otherwise the strings themselves."""
+        return [value for value in self._values if value is not None]
@@ -0,0 +1,317 @@
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set, Tuple
+
+import httpx
+from highlight_set import normalize_word
+from llm_client import RETRYABLE_STATUS_CODES, parse_retry_after
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+EVENTS = REGISTRY.counter("letta_outbox_events_total", "Vocabulary events for the Letta agent by outcome", ["outcome"])
+DELIVERY_SECONDS = REGISTRY.histogram("letta_delivery_seconds", "Letta messages API call latency", ["status"])
+PENDING = REGISTRY.gauge("letta_outbox_pending", "Undelivered events in the Letta outbox")
+
+MESSAGE_PREAMBLE = "Vocabulary update. Keep vocab_log in sync with the changes in this JSON:"
+
+# (user_id, kind, word, created_at)
+Event = Tuple[str, str, str, float]
+
+class Batch:
+    """Events of one user sent as one message; `key` is reused on every retry."""
+
+    def __init__(self, key: str, user_id: str, rows: List[Tuple[int, str, str, int]]):
+        self.key = key
+        self.user_id = user_id
+        # (id, kind, word, attempts)
+        self.rows = rows
+
+    @property
+    def attempts(self) -> int:
+        return max(row[3] for row in self.rows)
+
+class LettaOutbox:
+    """
+    Durable queue of vocabulary events ("add" / "remove" a word) for the Letta
+    agent, so highlights reach the agent's `vocab_log` memory without the
+    request waiting on the Letta API.
+
+    `enqueue` only appends to an in-memory buffer. A background task writes
+    the buffer to SQLite every `flush_interval` seconds, then groups each
+    user's pending events, up to `batch_size` at a time, into one message for
+    the agent's messages API. A user has at most one batch outstanding so
+    their events arrive in order, and at most `max_concurrency` batches are in
+    flight.
+
+    A batch keeps its idempotency key across retries. Claiming a batch leases
+    it for `lease` seconds, so several server processes can share one outbox
+    file without sending the same batch twice. Retryable failures back off
+    exponentially (honouring Retry-After). After `max_attempts`, or on any
+    other error response, the batch is kept as dead and no longer sent.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        word TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        batch_key TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        dead INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_outbox_user ON outbox (user_id, id);
+    CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox (batch_key, next_attempt_at);
+    """
+
+    def __init__(self, base_url: str, api_key: str, agent_id: str, db_file: str = "letta_outbox.db",
+                 batch_size: int = 50, max_concurrency: int = 4, max_attempts: int = 8,
+                 flush_interval: float = 0.5, request_timeout: float = 30.0, lease: float = 120.0,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.agent_id = agent_id
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.request_timeout = request_timeout
+        # Longer than one request, so a batch is never claimed again while it is being sent
+        self.lease = max(lease, 2 * request_timeout)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buffer: List[Event] = []
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+        # Database work running in threads, which close() waits for before closing the connection
+        self._writes: Set[asyncio.Future] = set()
+        self.pending = 0
+        self.enqueued = 0
+        self.delivered = 0
+        self.retries = 0
+        self.dead = 0
+        PENDING.set_function(lambda: self.pending + len(self._buffer))
+
+    def enqueue(self, user_id: str, kind: str, word: str) -> None:
+        """Queue an "add" or "remove" of `word` for `user_id`; never blocks."""
+        self._buffer.append((user_id, kind, word, time.time()))
+        self.enqueued += 1
+        EVENTS.inc(outcome="enqueued")
+
+    async def start(self) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=httpx.Timeout(self.request_timeout),
+            limits=httpx.Limits(max_connections=self.max_concurrency),
+            headers={"Authorization": f"Bearer {self.api_key}"}
+        )
+        self._task = asyncio.create_task(self._run())
+        logger.info("Letta outbox started (%s, agent %s)", self.db_file, self.agent_id)
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """
+        Persist buffered events and give in-flight deliveries `timeout` seconds
+        to finish. Deliveries still waiting on Letta after that are cancelled
+        and their batches released, to be sent again on the next start.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=timeout)
+            for task in self._in_flight:
+                task.cancel()
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._writes:
+            await asyncio.wait(self._writes)
+        await asyncio.to_thread(self._persist)
+        if self._client is not None:
+            await self._client.aclose()
+        with self._db_lock:
+            self._db.close()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._in_thread(self._persist)
+                free = self.max_concurrency - len(self._in_flight)
+                if free > 0:
+                    for batch in await self._in_thread(self._claim, free):
+                        task = asyncio.create_task(self._deliver(batch))
+                        self._in_flight.add(task)
+                        task.add_done_callback(self._in_flight.discard)
+            except sqlite3.Error as e:
+                logger.error("Letta outbox error: %s", e)
+
+    async def _in_thread(self, function, *args):
+        """
+        Run database work in a thread. Shielded, so a cancelled caller leaves it
+        to finish and close() can wait for it instead of closing the connection
+        under it.
+        """
+        future = asyncio.ensure_future(asyncio.to_thread(function, *args))
+        self._writes.add(future)
+        future.add_done_callback(self._writes.discard)
+        return await asyncio.shield(future)
+
+    def _persist(self) -> None:
+        """Write buffered events to the outbox in one transaction."""
+        events, self._buffer = self._buffer, []
+        if not events:
+            return
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO outbox (user_id, kind, word, created_at) VALUES (?, ?, ?, ?)", events)
+            self._db.execute("COMMIT")
+
+    def _claim(self, limit: int) -> List[Batch]:
+        """Lease up to `limit` due batches: retries first, then new batches for users with none outstanding."""
+        now = time.time()
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                keys = [row[0] for row in self._db.execute(
+                    "SELECT DISTINCT batch_key FROM outbox WHERE batch_key IS NOT NULL AND dead = 0 "
+                    "AND next_attempt_at <= ? LIMIT ?", (now, limit)
+                )]
+                users = [row[0] for row in self._db.execute(
+                    "SELECT DISTINCT user_id FROM outbox WHERE batch_key IS NULL AND user_id NOT IN "
+                    "(SELECT user_id FROM outbox WHERE batch_key IS NOT NULL AND dead = 0) LIMIT ?",
+                    (limit - len(keys),)
+                )]
+                for user_id in users:
+                    key = uuid.uuid4().hex
+                    self._db.execute(
+                        "UPDATE outbox SET batch_key = ? WHERE id IN "
+                        "(SELECT id FROM outbox WHERE user_id = ? AND batch_key IS NULL ORDER BY id LIMIT ?)",
+                        (key, user_id, self.batch_size)
+                    )
+                    keys.append(key)
+                batches = []
+                for key in keys:
+                    self._db.execute("UPDATE outbox SET next_attempt_at = ? WHERE batch_key = ?", (now + self.lease, key))
+                    rows = self._db.execute(
+                        "SELECT id, user_id, kind, word, attempts FROM outbox WHERE batch_key = ? ORDER BY id", (key,)
+                    ).fetchall()
+                    batches.append(Batch(key, rows[0][1], [(row[0], row[2], row[3], row[4]) for row in rows]))
+                self.pending = self._db.execute("SELECT COUNT(*) FROM outbox WHERE dead = 0").fetchone()[0]
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+        return batches
+
+    def _message(self, batch: Batch) -> str:
+        """
+        Instructions for the agent followed by the changes as one line of JSON,
+        so highlights containing newlines or separators reach it unchanged.
+        """
+        # Only the last event for each word matters
+        latest: Dict[str, Tuple[str, str]] = {}
+        for _, kind, word, _ in batch.rows:
+            latest.pop(normalize_word(word), None)
+            latest[normalize_word(word)] = (kind, word)
+        changes = {
+            "user_id": batch.user_id,
+            "highlighted": [word for kind, word in latest.values() if kind == "add"],
+            "removed": [word for kind, word in latest.values() if kind == "remove"]
+        }
+        # json.dumps escapes newlines inside strings, so the JSON stays on one line
+        return MESSAGE_PREAMBLE + "\n" + json.dumps(changes, ensure_ascii=False)
+
+    async def _deliver(self, batch: Batch) -> None:
+        started_at = time.monotonic()
+        retry_after = None
+        try:
+            try:
+                response = await self._client.post(
+                    f"/agents/{self.agent_id}/messages",
+                    json={"messages": [{"role": "user", "content": self._message(batch)}]},
+                    headers={"Idempotency-Key": batch.key}
+                )
+            except asyncio.CancelledError:
+                # Shutting down: make the batch due again now rather than when its lease runs out.
+                # It may have reached Letta already; the idempotency key covers the resend.
+                await self._in_thread(self._release, batch)
+                raise
+            status = response.status_code
+            DELIVERY_SECONDS.observe(time.monotonic() - started_at, status=str(status))
+            if status < 300:
+                await self._in_thread(self._finish, batch)
+                return
+            error = f"HTTP {status}: {response.text[:200]}"
+            retryable = status in RETRYABLE_STATUS_CODES or status in (408, 409)
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        except httpx.HTTPError as e:
+            DELIVERY_SECONDS.observe(time.monotonic() - started_at, status="error")
+            error, retryable = f"{type(e).__name__}: {e}", True
+        await self._in_thread(self._fail, batch, error, retryable, retry_after)
+
+    def _release(self, batch: Batch) -> None:
+        with self._db_lock:
+            self._db.execute("UPDATE outbox SET next_attempt_at = ? WHERE batch_key = ?", (time.time(), batch.key))
+
+    def _finish(self, batch: Batch) -> None:
+        with self._db_lock:
+            self._db.execute("DELETE FROM outbox WHERE batch_key = ?", (batch.key,))
+        self.delivered += len(batch.rows)
+        EVENTS.inc(len(batch.rows), outcome="delivered")
+        logger.debug("Delivered %d events for user %s to Letta", len(batch.rows), batch.user_id)
+
+    def _fail(self, batch: Batch, error: str, retryable: bool, retry_after: Optional[float]) -> None:
+        attempts = batch.attempts + 1
+        if retryable and attempts < self.max_attempts:
+            # Full jitter, as in LLMClient
+            delay = retry_after if retry_after is not None else random.uniform(
+                0, min(self.backoff_max, self.backoff_base * (2 ** attempts))
+            )
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE batch_key = ?",
+                    (attempts, time.time() + delay, error, batch.key)
+                )
+            self.retries += 1
+            EVENTS.inc(len(batch.rows), outcome="retried")
+            logger.warning("Letta delivery for user %s failed (%s), retrying in %.1fs", batch.user_id, error, delay)
+            return
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE outbox SET attempts = ?, dead = 1, last_error = ? WHERE batch_key = ?",
+                (attempts, error, batch.key)
+            )
+        self.dead += len(batch.rows)
+        EVENTS.inc(len(batch.rows), outcome="dead")
+        logger.error("Giving up on %d Letta events for user %s after %d attempts: %s",
+                     len(batch.rows), batch.user_id, attempts, error)
+
+    def get_stats(self) -> Dict:
+        return {
+            "buffered": len(self._buffer),
+            "pending": self.pending,
+            "in_flight": len(self._in_flight),
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "retries": self.retries,
+            "dead": self.dead
+        }
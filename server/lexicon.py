@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Local bilingual lexicon: answers short translations without an LLM call.
+
+Each language pair is an immutable file of entries sorted by key and read
+through mmap, so a lookup is a binary search over the page cache. Entries are
+learned from successful upstream translations and can be imported from a
+tab-separated dictionary file.
+
+Usage: python lexicon.py import dictionary.tsv --source English --target Spanish [--dir lexicon]
+       python lexicon.py lookup casa --source auto --target Spanish [--dir lexicon] [--prefix]
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, unquote
+from highlight_set import normalize_word
+from metrics import REGISTRY
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: merges are then only serialized within one process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = REGISTRY.counter("lexicon_lookups_total", "Translations looked up in the local lexicon by result", ["result"])
+
+LanguagePair = Tuple[str, str]
+# (translation, times learned, from a dictionary)
+Entry = Tuple[str, int, bool]
+
+MAGIC = b"LEX1"
+# Record header: key bytes, translation bytes, flags, count
+RECORD = struct.Struct("<HHBI")
+FLAG_DICTIONARY = 1
+MAX_FIELD_BYTES = 0xFFFF
+
+class LexiconTable:
+    """
+    One language pair's entries, memory-mapped read-only.
+
+    Layout: MAGIC, uint32 entry count, one uint32 record offset per entry in
+    key order, then the records (RECORD header, UTF-8 key, UTF-8 translation).
+    Keys are compared as UTF-8 bytes, which sorts the same as code points, so
+    a prefix is a contiguous run found by binary search.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:4] != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a lexicon file: {path}")
+        self.count = struct.unpack_from("<I", self._map, 4)[0]
+
+    def _offset(self, index: int) -> int:
+        return struct.unpack_from("<I", self._map, 8 + 4 * index)[0]
+
+    def _key(self, index: int) -> bytes:
+        offset = self._offset(index)
+        key_length = struct.unpack_from("<H", self._map, offset)[0]
+        start = offset + RECORD.size
+        return self._map[start:start + key_length]
+
+    def _record(self, index: int) -> Tuple[str, Entry]:
+        offset = self._offset(index)
+        key_length, value_length, flags, count = RECORD.unpack_from(self._map, offset)
+        start = offset + RECORD.size
+        key = self._map[start:start + key_length].decode("utf-8")
+        value = self._map[start + key_length:start + key_length + value_length].decode("utf-8")
+        return key, (value, count, bool(flags & FLAG_DICTIONARY))
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, key: str) -> Optional[Entry]:
+        encoded = key.encode("utf-8")
+        index = self._lower_bound(encoded)
+        if index < self.count and self._key(index) == encoded:
+            return self._record(index)[1]
+        return None
+
+    def prefix(self, prefix: str, limit: int = 20) -> List[Tuple[str, Entry]]:
+        """Entries whose key starts with `prefix`, in key order."""
+        encoded = prefix.encode("utf-8")
+        results = []
+        index = self._lower_bound(encoded)
+        while index < self.count and len(results) < limit and self._key(index).startswith(encoded):
+            results.append(self._record(index))
+            index += 1
+        return results
+
+    def items(self) -> Iterable[Tuple[str, Entry]]:
+        for index in range(self.count):
+            yield self._record(index)
+
+    def close(self) -> None:
+        self._map.close()
+
+    @staticmethod
+    def write(path: str, entries: Dict[str, Entry]) -> None:
+        """Write entries as a new table file, replacing `path` atomically."""
+        records = []
+        for key in sorted(entries):
+            value, count, dictionary = entries[key]
+            key_bytes, value_bytes = key.encode("utf-8"), value.encode("utf-8")
+            if len(key_bytes) > MAX_FIELD_BYTES or len(value_bytes) > MAX_FIELD_BYTES:
+                continue
+            flags = FLAG_DICTIONARY if dictionary else 0
+            records.append(RECORD.pack(len(key_bytes), len(value_bytes), flags, min(count, 0xFFFFFFFF)) + key_bytes + value_bytes)
+        offsets, position = [], 8 + 4 * len(records)
+        for record in records:
+            offsets.append(position)
+            position += len(record)
+        # Unique per process, so workers merging the same pair do not write to one temp file
+        tmp_file = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(MAGIC + struct.pack("<I", len(records)))
+            f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+            for record in records:
+                f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+class Lexicon:
+    """
+    Per-language-pair lexicon of short texts (at most `max_words` words and
+    `max_chars` characters), keyed case- and whitespace-insensitively.
+
+    A learned entry is trusted once the same translation has been served
+    `min_count` times in a row, whether fresh from upstream or again from the
+    translation cache, so a reply asked for only once is never served from
+    here on its own; dictionary entries are always trusted and are never replaced
+    by learned ones. Source "auto" is a pair of its own: the upstream prompt
+    translates in either direction, so entries learned for a known source
+    language may be in the wrong language for an auto-detected one.
+
+    Newly learned entries are served from memory and written into the table
+    files by `merge()` once `merge_every` of them are pending, and on close.
+    """
+
+    def __init__(self, directory: str = "lexicon", max_words: int = 3, max_chars: int = 48,
+                 min_count: int = 2, merge_every: int = 200):
+        self.directory = directory
+        self.max_words = max_words
+        self.max_chars = max_chars
+        self.min_count = max(1, min_count)
+        self.merge_every = merge_every
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Serializes file rewrites; lookups only need `_lock`
+        self._merge_lock = threading.Lock()
+        self._tables: Dict[LanguagePair, LexiconTable] = {}
+        self._pending: Dict[LanguagePair, Dict[str, Entry]] = {}
+        self._pending_count = 0
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.merges = 0
+        for name in os.listdir(directory):
+            pair = _pair_from_name(name)
+            if pair is not None:
+                self._tables[pair] = LexiconTable(os.path.join(directory, name))
+
+    @property
+    def empty(self) -> bool:
+        return not self._tables and not self._pending
+
+    @property
+    def needs_merge(self) -> bool:
+        return self._pending_count >= self.merge_every
+
+    def eligible(self, text: str) -> bool:
+        """Whether a text is short enough to be answered from the lexicon."""
+        return 0 < len(text) <= self.max_chars and len(text.split()) <= self.max_words
+
+    def _entry(self, pair: LanguagePair, key: str) -> Optional[Entry]:
+        entry = self._pending.get(pair, {}).get(key)
+        if entry is None and pair in self._tables:
+            entry = self._tables[pair].get(key)
+        return entry
+
+    def _trusted(self, entry: Optional[Entry]) -> bool:
+        return entry is not None and (entry[2] or entry[1] >= self.min_count)
+
+    def lookup(self, text: str, source_language: str, target_language: str) -> Optional[str]:
+        """Return a trusted translation of `text`, or None to fall through to upstream."""
+        if not self.eligible(text):
+            self.skipped += 1
+            LOOKUPS.inc(result="skipped")
+            return None
+        key = normalize_word(text)
+        with self._lock:
+            entry = self._entry((source_language, target_language), key)
+            translation = entry[0] if self._trusted(entry) else None
+        if translation is None:
+            self.misses += 1
+            LOOKUPS.inc(result="miss")
+            return None
+        self.hits += 1
+        LOOKUPS.inc(result="hit")
+        return translation
+
+    def learn(self, text: str, translation: str, source_language: str, target_language: str) -> None:
+        """Record a successful upstream translation of a short text."""
+        translation = translation.strip()
+        if not self.eligible(text) or not translation or len(translation) > 4 * self.max_chars:
+            return
+        pair, key = (source_language, target_language), normalize_word(text)
+        with self._lock:
+            entry = self._entry(pair, key)
+            if entry is not None and entry[2]:
+                return
+            count = entry[1] + 1 if entry is not None and entry[0] == translation else 1
+            pending = self._pending.setdefault(pair, {})
+            if key not in pending:
+                self._pending_count += 1
+            pending[key] = (translation, count, False)
+
+    def merge(self) -> None:
+        """Write pending entries into the table files."""
+        with self._lock:
+            snapshot = {pair: dict(entries) for pair, entries in self._pending.items()}
+        for pair, entries in snapshot.items():
+            self._write(pair, entries)
+
+    def _write(self, pair: LanguagePair, entries: Dict[str, Entry], replace_dictionary: bool = False) -> None:
+        path = os.path.join(self.directory, _pair_file_name(pair))
+        with self._merge_lock, _file_lock(f"{path}.lock"):
+            merged: Dict[str, Entry] = {}
+            # Read the file rather than our mapping so merges by other processes are kept
+            if os.path.exists(path):
+                current = LexiconTable(path)
+                merged.update(current.items())
+                current.close()
+            for key, entry in entries.items():
+                existing = merged.get(key)
+                if existing is None or replace_dictionary or not existing[2]:
+                    merged[key] = entry
+            LexiconTable.write(path, merged)
+            table = LexiconTable(path)
+        with self._lock:
+            old = self._tables.get(pair)
+            self._tables[pair] = table
+            pending = self._pending.get(pair, {})
+            for key, entry in entries.items():
+                # Keep anything learned again while the file was being written
+                if pending.get(key) is entry:
+                    del pending[key]
+                    self._pending_count -= 1
+            if not pending:
+                self._pending.pop(pair, None)
+            if old is not None:
+                old.close()
+            self.merges += 1
+
+    def import_dictionary(self, path: str, source_language: str, target_language: str) -> int:
+        """Import "term<TAB>translation" lines for one pair; returns the number of entries."""
+        entries: Dict[str, Entry] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith("#") or "\t" not in line:
+                    continue
+                term, translation = line.rstrip("\n").split("\t", 1)
+                if self.eligible(term.strip()) and translation.strip():
+                    entries[normalize_word(term)] = (translation.strip(), 0, True)
+        self._write((source_language, target_language), entries, replace_dictionary=True)
+        logger.info("Imported %d lexicon entries for %s -> %s", len(entries), source_language, target_language)
+        return len(entries)
+
+    def seed(self, translations: Iterable[Tuple[str, str, str, str]]) -> None:
+        """Learn from (text, source, target, translation) rows, e.g. the translation cache's disk tier."""
+        rows = 0
+        for text, source_language, target_language, translation in translations:
+            self.learn(text, translation, source_language, target_language)
+            rows += 1
+        if rows:
+            self.merge()
+            logger.info("Seeded lexicon from %d cached translations (%d entries)", rows, self.get_stats()["lexicon_entries"])
+
+    def search(self, prefix: str, source_language: str, target_language: str, limit: int = 20) -> List[Dict]:
+        """Entries of one pair whose key starts with `prefix`."""
+        key, pair = normalize_word(prefix), (source_language, target_language)
+        with self._lock:
+            table = self._tables.get(pair)
+            found = dict(table.prefix(key, limit)) if table is not None else {}
+            for pending_key, entry in self._pending.get(pair, {}).items():
+                if pending_key.startswith(key):
+                    found[pending_key] = entry
+        return [
+            {"text": text, "translation": entry[0], "count": entry[1], "dictionary": entry[2],
+             "trusted": self._trusted(entry)}
+            for text, entry in sorted(found.items())[:limit]
+        ]
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = sum(table.count for table in self._tables.values())
+            return {
+                "lexicon_pairs": len(self._tables),
+                "lexicon_entries": entries,
+                "lexicon_pending": self._pending_count,
+                "lexicon_hits": self.hits,
+                "lexicon_misses": self.misses,
+                "lexicon_skipped": self.skipped,
+                "lexicon_hit_rate": self.hits / lookups if lookups else 0.0,
+                "lexicon_merges": self.merges
+            }
+
+    def close(self) -> None:
+        """Write pending entries and unmap the tables."""
+        self.merge()
+        with self._lock:
+            for table in self._tables.values():
+                table.close()
+            self._tables.clear()
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive lock shared with other processes (advisory, via flock) while a table file is rewritten."""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _pair_file_name(pair: LanguagePair) -> str:
+    return f"{quote(pair[0], safe='')}+{quote(pair[1], safe='')}.lex"
+
+def _pair_from_name(name: str) -> Optional[LanguagePair]:
+    if not name.endswith(".lex") or "+" not in name:
+        return None
+    source, target = name[:-len(".lex")].split("+", 1)
+    return unquote(source), unquote(target)
+
+def main():
+    from translation import expand_language_code
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["import", "lookup"])
+    parser.add_argument("value", help="dictionary file to import, or text to look up")
+    parser.add_argument("--source", required=True, help="source language code or name (as in user preferences)")
+    parser.add_argument("--target", required=True, help="target language code or name")
+    parser.add_argument("--dir", default=os.getenv("LEXICON_DIR", "lexicon"))
+    parser.add_argument("--prefix", action="store_true", help="list entries starting with the text")
+    args = parser.parse_args()
+
+    lexicon = Lexicon(args.dir)
+    source, target = expand_language_code(args.source), expand_language_code(args.target)
+    if args.command == "import":
+        print(f"Imported {lexicon.import_dictionary(args.value, source, target)} entries for {source} -> {target}")
+    elif args.prefix:
+        for row in lexicon.search(args.value, source, target):
+            print(f"{row['text']}\t{row['translation']}\t{'dictionary' if row['dictionary'] else row['count']}")
+    else:
+        print(lexicon.lookup(args.value, source, target))
+    lexicon.close()
+
+if __name__ == "__main__":
+    main()
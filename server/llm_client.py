@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    "llm_upstream_request_seconds", "Groq API attempt latency (streams: until the last chunk)", ["call", "status"]
+)
+UPSTREAM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "llm_upstream_first_token_seconds", "Time from starting a streamed Groq call to its first content delta"
+)
+UPSTREAM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by the Groq API usage field", ["kind"])
+UPSTREAM_RETRIES = REGISTRY.counter("llm_retries_total", "Groq API attempts retried after a failure", ["call"])
+
+def record_usage(usage: Optional[Dict]) -> None:
+    """Count prompt/completion tokens from an OpenAI-style `usage` object."""
+    if not usage:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage.get(kind):
+            UPSTREAM_TOKENS.inc(usage[kind], kind=kind[:-len("_tokens")])
+
+# Upstream statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """Upstream call failed; `status_code` is what the API endpoint should return."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds, then lets a single trial call through (half-open).
+    A trial that is cancelled or fails unexpectedly counts as a failure, so the
+    breaker never waits on a trial that will not report back.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def abandon(self) -> None:
+        """The half-open trial ended with neither outcome (cancelled, or an unexpected error): count it as a failure."""
+        if self._trial_in_flight:
+            self.record_failure()
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class LLMClient:
+    """
+    App-lifetime pooled client for an OpenAI-compatible chat-completions API.
+
+    One httpx.AsyncClient is shared by every request so connections (and
+    HTTP/2 streams when `h2` is installed) are reused. Calls are retried on
+    429/5xx and transport errors with jittered exponential backoff, honoring
+    Retry-After, within both a per-attempt and a total deadline.
+    """
+
+    def __init__(self, base_url: str, api_key: Optional[str], model: str = "llama-3.3-70b-versatile",
+                 max_connections: int = 100, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0, attempt_timeout: float = 30.0,
+                 total_timeout: float = 60.0, max_retries: int = 3, backoff_base: float = 0.25,
+                 backoff_max: float = 8.0, breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 http2: bool = True):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.attempt_timeout = attempt_timeout
+        self.total_timeout = total_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http2 = http2
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def start(self) -> None:
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=self.limits,
+            timeout=httpx.Timeout(self.attempt_timeout),
+            http2=http2,
+            headers={"Authorization": f"Bearer {self.api_key}"} if self.api_key else None
+        )
+        logger.info("LLM client pool started for %s (http2=%s)", self.base_url, http2)
+
+    async def close(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Full jitter: uniform in [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def chat_completion(self, messages: List[Dict], **params) -> Dict:
+        """POST /chat/completions and return the decoded JSON body."""
+        if self.client is None:
+            raise LLMError(503, "LLM client not started")
+        # No await before allow(), so a half-open state here means this call is the trial
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise LLMError(503, "Upstream LLM temporarily unavailable (circuit open)")
+        try:
+            return await self._chat_completion(messages, **params)
+        except BaseException:
+            if trial:
+                self.breaker.abandon()
+            raise
+
+    async def _chat_completion(self, messages: List[Dict], **params) -> Dict:
+        payload = {"model": self.model, "messages": messages, **params}
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            retry_after = None
+            started_at = time.monotonic()
+            try:
+                response = await self.client.post(
+                    "/chat/completions",
+                    json=payload,
+                    timeout=min(self.attempt_timeout, max(remaining, 0.001))
+                )
+                UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="chat", status=response.status_code)
+                if response.status_code == 200:
+                    # Parsed first, so a malformed body is not counted as a success
+                    try:
+                        body = response.json()
+                    except ValueError:
+                        self.breaker.record_failure()
+                        raise LLMError(502, "Groq API returned a malformed response body")
+                    self.breaker.record_success()
+                    record_usage(body.get("usage"))
+                    return body
+                error = LLMError(response.status_code, f"Groq API error: {response.text}")
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    # Client errors are the caller's fault, not an upstream outage
+                    self.breaker.record_success()
+                    raise error
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except httpx.TimeoutException:
+                UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="chat", status="timeout")
+                error = LLMError(504, "Groq API timed out")
+            except httpx.TransportError as e:
+                UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="chat", status="error")
+                error = LLMError(502, f"Groq API connection error: {e}")
+
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            if attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                self.breaker.record_failure()
+                raise error
+            UPSTREAM_RETRIES.inc(call="chat")
+            logger.warning("Retrying Groq call in %.2fs after: %s", delay, error.detail[:200])
+            await asyncio.sleep(delay)
+
+    async def stream_chat_completion(self, messages: List[Dict], **params) -> AsyncIterator[str]:
+        """
+        POST /chat/completions with `stream: true` and yield content deltas as
+        they arrive. Retries only happen before the first delta is yielded;
+        closing the generator closes the upstream response. `total_timeout`
+        also bounds the stream itself: it is checked as each line arrives, so
+        a stream can overrun it by at most one read timeout.
+        """
+        if self.client is None:
+            raise LLMError(503, "LLM client not started")
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise LLMError(503, "Upstream LLM temporarily unavailable (circuit open)")
+        stream = self._stream_chat_completion(messages, **params)
+        try:
+            async for delta in stream:
+                yield delta
+        except BaseException:
+            if trial:
+                self.breaker.abandon()
+            raise
+        finally:
+            await stream.aclose()
+
+    async def _stream_chat_completion(self, messages: List[Dict], **params) -> AsyncIterator[str]:
+        payload = {"model": self.model, "messages": messages, "stream": True, **params}
+        deadline = time.monotonic() + self.total_timeout
+        attempt = 0
+        started = False
+        while True:
+            remaining = deadline - time.monotonic()
+            retry_after = None
+            started_at = time.monotonic()
+            try:
+                async with self.client.stream(
+                    "POST",
+                    "/chat/completions",
+                    json=payload,
+                    timeout=min(self.attempt_timeout, max(remaining, 0.001))
+                ) as response:
+                    if response.status_code == 200:
+                        self.breaker.record_success()
+                        try:
+                            async for line in response.aiter_lines():
+                                if time.monotonic() >= deadline:
+                                    # A slow drip of deltas, each within the read timeout
+                                    self.breaker.record_failure()
+                                    raise LLMError(504, "Groq API stream exceeded the total timeout")
+                                if not line.startswith("data:"):
+                                    continue
+                                data = line[len("data:"):].strip()
+                                if data == "[DONE]":
+                                    return
+                                chunk = json.loads(data)
+                                # Groq reports usage on the last chunk under x_groq; OpenAI under usage
+                                record_usage(chunk.get("usage") or chunk.get("x_groq", {}).get("usage"))
+                                choices = chunk.get("choices") or [{}]
+                                delta = choices[0].get("delta", {}).get("content")
+                                if delta:
+                                    if not started:
+                                        UPSTREAM_FIRST_TOKEN_SECONDS.observe(time.monotonic() - started_at)
+                                    started = True
+                                    yield delta
+                            return
+                        finally:
+                            UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="stream", status=200)
+                    UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="stream", status=response.status_code)
+                    body = (await response.aread()).decode("utf-8", "replace")
+                    error = LLMError(response.status_code, f"Groq API error: {body}")
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        self.breaker.record_success()
+                        raise error
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            except httpx.TimeoutException:
+                if not started:
+                    UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="stream", status="timeout")
+                error = LLMError(504, "Groq API timed out")
+            except httpx.TransportError as e:
+                if not started:
+                    UPSTREAM_SECONDS.observe(time.monotonic() - started_at, call="stream", status="error")
+                error = LLMError(502, f"Groq API connection error: {e}")
+
+            delay = self._backoff(attempt, retry_after)
+            attempt += 1
+            # Text already relayed to the client cannot be replayed, so only retry before the first delta
+            if started or attempt > self.max_retries or time.monotonic() + delay >= deadline:
+                self.breaker.record_failure()
+                raise error
+            UPSTREAM_RETRIES.inc(call="stream")
+            logger.warning("Retrying Groq stream in %.2fs after: %s", delay, error.detail[:200])
+            await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict:
+        return {
+            "base_url": self.base_url,
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures
+        }
@@ -1,22 +1,74 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
+import asyncio
+import logging
 import os
-import httpx
-import whisper
-import tempfile
 import io
+import json
+import time
 import wave
 import numpy as np
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
-from state_manager import StateManager
+from connection_manager import ConnectionManager
+from coordination import create_coordinator
+from letta_outbox import LettaOutbox
+from lexicon import Lexicon
+from llm_client import LLMClient, LLMError
+from logging_config import configure_logging
+from metrics import CONTENT_TYPE, REGISTRY
+from state_manager import AsyncStateManager, StateManager
+from storage import create_storage
+from stt_worker import InferenceExecutor, QueueFullError
+from audio_decode import SAMPLE_RATE, AudioDecoder
+from audio_stream import UtteranceSegmenter
+from translation import Translator, expand_language_code
+from translation_cache import TranslationCache
 
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="Highlight Logger API", version="1.0.0")
+# LOG_LEVEL=DEBUG also logs per-request details; LOG_FORMAT=json for log shippers
+configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+logger = logging.getLogger("highlight")
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"]
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared upstream clients on startup and flush state on shutdown."""
+    await coordinator.start()
+    manager.start()
+    await llm_client.start()
+    stt_executor.start()
+    if letta_outbox is not None:
+        await letta_outbox.start()
+    if STT_PRELOAD:
+        # Otherwise the model loads on the first audio connection
+        logger.info("Loading Whisper model...")
+        await stt_executor.load()
+    yield
+    stt_executor.shutdown()
+    await manager.close()
+    await llm_client.close()
+    if letta_outbox is not None:
+        # Undelivered events stay in the outbox file for the next start
+        await letta_outbox.close()
+    # Flush the store journal and write a final snapshot
+    await state.close()
+    translation_cache.close()
+    if lexicon is not None:
+        # Write entries learned since the last merge
+        lexicon.close()
+    await coordinator.close()
+
+app = FastAPI(title="Highlight Logger API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware to allow requests from Chrome extensions
 app.add_middleware(
@@ -25,84 +77,178 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag"],  # So extension code can read it for If-None-Match
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Observe every HTTP request in http_request_duration_seconds, labeled by route template."""
+    started_at = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # The matched route template ("/users/{user_id}") keeps label cardinality bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started_at,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status
+        )
+
 # Environment variables for APIs
 LETTA_API_KEY = os.getenv("LETTA_API_KEY")
 LETTA_AGENT_ID = os.getenv("LETTA_AGENT_ID")
-LETTA_BASE_URL = "https://api.letta.ai/v1"
+LETTA_BASE_URL = os.getenv("LETTA_BASE_URL", "https://api.letta.ai/v1")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-# Initialize state manager
-state_manager = StateManager()
+# Server processes started by `python main.py`; more than one needs shared state
+WORKERS = int(os.getenv("WORKERS", "1"))
 
-# Initialize Whisper model
-print("Loading Whisper model...")
-whisper_model = whisper.load_model("base")
-print("Whisper model loaded successfully!")
+# Initialize state manager with the configured storage backend
+STORE_BACKEND = os.getenv("STORE_BACKEND", "json")
+# Distinct words tracked for /store/analytics by the json and sharded backends
+STORE_TOP_WORDS_CAPACITY = int(os.getenv("STORE_TOP_WORDS_CAPACITY", "1000"))
+if WORKERS > 1 and STORE_BACKEND in ("json", "sharded"):
+    raise RuntimeError(f"STORE_BACKEND={STORE_BACKEND} keeps users in one process; use sqlite or redis with WORKERS > 1")
+if STORE_BACKEND == "redis":
+    storage = create_storage("redis", url=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+elif STORE_BACKEND == "sqlite":
+    storage = create_storage(
+        "sqlite",
+        db_file=os.getenv("STORE_SQLITE_PATH", "store.db"),
+        import_file="store.json"
+    )
+elif STORE_BACKEND == "sharded":
+    storage = create_storage(
+        "sharded",
+        root_dir=os.getenv("STORE_SHARDED_PATH", "store_users"),
+        cache_size=int(os.getenv("STORE_CACHE_USERS", "10000")),
+        import_file="store.json",
+        flush_interval=float(os.getenv("STORE_FLUSH_INTERVAL_MS", "50")) / 1000,
+        flush_batch_size=int(os.getenv("STORE_FLUSH_BATCH_SIZE", "256")),
+        compact_every=int(os.getenv("STORE_COMPACT_EVERY", "5000")),
+        top_capacity=STORE_TOP_WORDS_CAPACITY
+    )
+else:
+    storage = create_storage(
+        "json",
+        store_file="store.json",
+        flush_interval=float(os.getenv("STORE_FLUSH_INTERVAL_MS", "50")) / 1000,
+        flush_batch_size=int(os.getenv("STORE_FLUSH_BATCH_SIZE", "256")),
+        compact_every=int(os.getenv("STORE_COMPACT_EVERY", "5000")),
+        top_capacity=STORE_TOP_WORDS_CAPACITY
+    )
+state_manager = StateManager(storage, search_index_users=int(os.getenv("SEARCH_INDEX_USERS", "1000")))
+# Handlers go through the async facade: per-user lock striping, blocking I/O kept off the loop
+state = AsyncStateManager(state_manager, stripes=int(os.getenv("STATE_LOCK_STRIPES", "64")))
 
-# WebSocket connection manager
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self.is_listening = False
+# Cross-process message fan-out and shared cache ("local" when running one process)
+COORDINATION_BACKEND = os.getenv("COORDINATION_BACKEND", "local" if WORKERS == 1 else "sqlite")
+if COORDINATION_BACKEND == "redis":
+    coordinator = create_coordinator("redis", url=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+elif COORDINATION_BACKEND == "sqlite":
+    coordinator = create_coordinator("sqlite", db_file=os.getenv("COORDINATION_SQLITE_PATH", "coordination.db"))
+else:
+    coordinator = create_coordinator("local")
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+# Translation cache (memory LRU + TTL, optional on-disk tier, shared tier across processes)
+translation_cache = TranslationCache(
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TRANSLATION_CACHE_TTL", "86400")),
+    disk_file=os.getenv("TRANSLATION_CACHE_FILE", "translation_cache.db") or None,
+    shared=coordinator
+)
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+# Local lexicon answering short translations without an upstream call (LEXICON_DIR= disables it)
+LEXICON_DIR = os.getenv("LEXICON_DIR", "lexicon")
+lexicon = Lexicon(
+    LEXICON_DIR,
+    max_words=int(os.getenv("LEXICON_MAX_WORDS", "3")),
+    min_count=int(os.getenv("LEXICON_MIN_COUNT", "2"))
+) if LEXICON_DIR else None
+if lexicon is not None and lexicon.empty:
+    # First start: learn from the translations already in the cache's disk tier
+    lexicon.seed(translation_cache.disk_entries())
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        await websocket.send_text(message)
+# Durable queue forwarding vocabulary changes to the Letta agent's vocab_log memory
+letta_outbox = LettaOutbox(
+    LETTA_BASE_URL,
+    LETTA_API_KEY,
+    LETTA_AGENT_ID,
+    db_file=os.getenv("LETTA_OUTBOX_FILE", "letta_outbox.db"),
+    batch_size=int(os.getenv("LETTA_BATCH_SIZE", "50")),
+    max_concurrency=int(os.getenv("LETTA_MAX_CONCURRENCY", "4")),
+    max_attempts=int(os.getenv("LETTA_MAX_ATTEMPTS", "8"))
+) if LETTA_API_KEY and LETTA_AGENT_ID else None
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                # Remove broken connections
-                self.active_connections.remove(connection)
-
-manager = ConnectionManager()
-
-# Language code to full name mapping
-LANGUAGE_MAP = {
-    'en': 'English',
-    'es': 'Spanish',
-    'fr': 'French',
-    'de': 'German',
-    'it': 'Italian',
-    'pt': 'Portuguese',
-    'ja': 'Japanese',
-    'zh': 'Chinese',
-    'ko': 'Korean',
-    'ru': 'Russian',
-    'ar': 'Arabic',
-    'hi': 'Hindi',
-    'auto': 'auto'
-}
-
-def expand_language_code(language_code: str) -> str:
-    """
-    Expand a language code to its full name.
-    If the code is not found, return the original code.
-    """
-    if not language_code:
-        return "auto"
-    
-    # Convert to lowercase for case-insensitive matching
-    code_lower = language_code.lower()
-    
-    # Check if it's already a full name (capitalized)
-    if language_code[0].isupper():
-        return language_code
-    
-    # Look up in the language map
-    return LANGUAGE_MAP.get(code_lower, language_code)
+# Shared connection pool for Groq (OpenAI-compatible) chat completions
+llm_client = LLMClient(
+    base_url=os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1"),
+    api_key=GROQ_API_KEY,
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30")),
+    attempt_timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30")),
+    total_timeout=float(os.getenv("LLM_TOTAL_TIMEOUT", "60")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    breaker_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+    breaker_reset=float(os.getenv("LLM_BREAKER_RESET", "30"))
+)
+
+# Translation service: packs batches into single LLM calls and coalesces
+# concurrent /translate requests arriving within the micro-batch window
+translator = Translator(
+    llm_client,
+    translation_cache,
+    max_batch_items=int(os.getenv("TRANSLATE_BATCH_MAX_ITEMS", "20")),
+    max_batch_chars=int(os.getenv("TRANSLATE_BATCH_MAX_CHARS", "6000")),
+    microbatch_window=float(os.getenv("TRANSLATE_MICROBATCH_MS", "5")) / 1000,
+    lexicon=lexicon
+)
+
+# Upper bound on items accepted by /translate/batch
+MAX_BATCH_TRANSLATE_ITEMS = 100
+
+# Whisper runs in a worker pool so transcription never blocks the event loop
+stt_executor = InferenceExecutor(
+    model_name=os.getenv("WHISPER_MODEL", "base"),
+    mode=os.getenv("STT_POOL_MODE", "thread"),
+    workers=int(os.getenv("STT_WORKERS", "1")),
+    max_queue=int(os.getenv("STT_MAX_QUEUE", "8")),
+    job_timeout=float(os.getenv("STT_JOB_TIMEOUT", "60")),
+    max_batch_size=int(os.getenv("STT_BATCH_SIZE", "4")),
+    batch_window=float(os.getenv("STT_BATCH_WINDOW_MS", "50")) / 1000,
+    backend=os.getenv("STT_BACKEND", "whisper"),
+    share_model=os.getenv("STT_SHARE_MODEL", "true").lower() == "true"
+)
+
+# Load and warm up the model at startup instead of on the first audio connection
+STT_PRELOAD = os.getenv("STT_PRELOAD", "false").lower() == "true"
+
+# Seconds without audio after which an open utterance is finalized
+STT_IDLE_FLUSH = float(os.getenv("STT_IDLE_FLUSH", "1.5"))
+
+# Registry of open WebSockets with per-socket send queues and heartbeats
+manager = ConnectionManager(
+    coordinator,
+    queue_size=int(os.getenv("WS_SEND_QUEUE_SIZE", "256")),
+    send_timeout=float(os.getenv("WS_SEND_TIMEOUT", "10")),
+    heartbeat_interval=float(os.getenv("WS_HEARTBEAT_INTERVAL", "20")),
+    idle_timeout=float(os.getenv("WS_IDLE_TIMEOUT", "120"))
+)
+
+# Point-in-time values read when /metrics is scraped
+REGISTRY.gauge("websocket_connections", "Open WebSocket connections in this process").set_function(
+    lambda: len(manager.connections)
+)
+REGISTRY.gauge("stt_queue_depth", "Transcriptions queued or running").set_function(lambda: stt_executor.depth)
+REGISTRY.gauge("translation_cache_entries", "Entries in the in-memory translation cache").set_function(
+    lambda: translation_cache.get_stats()["entries"]
+)
 
 class HighlightRequest(BaseModel):
     highlight: str
@@ -112,6 +258,16 @@ class TranslateRequest(BaseModel):
     text: str
     user_id: Optional[str] = None
 
+class BatchTranslateItem(BaseModel):
+    text: str
+    user_id: Optional[str] = None
+    source_language: Optional[str] = None
+    target_language: Optional[str] = None
+
+class BatchTranslateRequest(BaseModel):
+    items: List[BatchTranslateItem]
+    user_id: Optional[str] = None
+
 class UserLanguageRequest(BaseModel):
     user_id: str
     source_language: Optional[str] = None
@@ -132,12 +288,75 @@ async def root():
 @app.get("/store/stats")
 async def get_store_stats():
     """Get statistics about the store."""
-    return state_manager.get_store_stats()
+    return await state.get_store_stats()
+
+# Upper bound on /store/analytics?top=
+MAX_ANALYTICS_TOP = 100
+
+@app.get("/store/analytics")
+async def get_store_analytics(top: int = 10):
+    """Get the most highlighted words across users and the users per language pair."""
+    return await state.get_store_analytics(max(1, min(top, MAX_ANALYTICS_TOP)))
+
+# Page size bounds for word listings
+DEFAULT_WORDS_PAGE_SIZE = 100
+MAX_WORDS_PAGE_SIZE = 1000
+
+def user_etag(version: int) -> str:
+    return f'"{version}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match lists `etag` (or is "*")."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    # If-None-Match uses the weak comparison, so a W/ prefix still matches
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    # Browsers keep the response but revalidate it on every use
+    response.headers["Cache-Control"] = "no-cache"
+
+def not_modified(etag: str) -> Response:
+    response = Response(status_code=304)
+    set_etag(response, etag)
+    return response
+
+@app.get("/coordination/stats")
+async def get_coordination_stats():
+    """Get the coordination backend and its message counters."""
+    return {**coordinator.get_stats(), "workers": WORKERS}
+
+@app.get("/connections/stats")
+async def get_connection_stats():
+    """Get open WebSocket counts, queued messages and evictions for this process."""
+    return manager.get_stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this process: request, Groq, Whisper and store latencies."""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/stt/stats")
+async def get_stt_stats():
+    """Get speech-to-text queue depth and latency counters."""
+    return stt_executor.get_stats()
 
 @app.get("/users/{user_id}")
-async def get_user_data(user_id: str):
-    """Get user data including languages and highlighted words."""
-    user_data = state_manager.get_user(user_id)
+async def get_user_data(user_id: str, request: Request, response: Response, include_words: bool = True):
+    """
+    Get user data including languages and highlighted words.
+    With include_words=false only a word_count is returned instead of the full list.
+    Answers 304 when If-None-Match holds the ETag of the current version.
+    """
+    # Read before the data, so a change landing in between makes the ETag stale rather than the data
+    version = await state.get_user_version(user_id)
+    if version is not None and etag_matches(request, user_etag(version)):
+        return not_modified(user_etag(version))
+    user_data = await state.get_user(user_id, include_words=include_words)
+    set_etag(response, user_etag(user_data["version"] if version is None else version))
     return {
         "user_id": user_id,
         "data": user_data
@@ -147,23 +366,13 @@ async def get_user_data(user_id: str):
 async def register_user(request: RegisterRequest):
     """Register a new user with hashed password."""
     try:
-        # Check if user already exists
-        if request.user_id in state_manager.store["users"]:
+        # Create new user with hashed password, unless the user already exists
+        user_data = await state.register_user(request.user_id, request.password)
+        if user_data is None:
             raise HTTPException(status_code=400, detail="User already exists")
-        
-        # Create new user with hashed password
-        state_manager.store["users"][request.user_id] = {
-            "source_language": "auto",
-            "target_language": "Spanish",
-            "highlighted_words": [],
-            "password": request.password  # Store hashed password
-        }
-        
-        # Save to store
-        state_manager.save_store()
+        user_data = user_data.copy()
         
         # Return user data (without password)
-        user_data = state_manager.get_user(request.user_id)
         user_data.pop("password", None)  # Remove password from response
         
         return {
@@ -175,7 +384,7 @@ async def register_user(request: RegisterRequest):
             }
         }
     except Exception as e:
-        print(f"Error registering user: {e}")
+        logger.error("Error registering user: %s", e)
         raise HTTPException(status_code=500, detail="Registration failed")
 
 @app.post("/users/login")
@@ -183,10 +392,10 @@ async def login_user(request: LoginRequest):
     """Login user with password verification."""
     try:
         # Check if user exists
-        if request.user_id not in state_manager.store["users"]:
+        if not await state.user_exists(request.user_id):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        user_data = state_manager.store["users"][request.user_id]
+        user_data = await state.get_user(request.user_id)
         stored_password = user_data.get("password", "")
         
         # Verify password
@@ -208,48 +417,171 @@ async def login_user(request: LoginRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error logging in user: {e}")
+        logger.error("Error logging in user: %s", e)
         raise HTTPException(status_code=500, detail="Login failed")
 
 @app.post("/users/languages")
 async def update_user_languages(request: UserLanguageRequest):
     """Update user's language preferences."""
-    success = state_manager.update_user_languages(
+    user_data = await state.update_user_languages(
         request.user_id, 
         request.source_language, 
         request.target_language
     )
-    if success:
+    if user_data is not None:
         return {
             "status": "success",
             "message": "User languages updated",
             "user_id": request.user_id,
-            "data": state_manager.get_user(request.user_id)
+            "data": user_data
         }
     else:
         raise HTTPException(status_code=500, detail="Failed to update user languages")
 
 @app.get("/users/{user_id}/words")
-async def get_user_words(user_id: str):
-    """Get user's highlighted words."""
-    words = state_manager.get_highlighted_words(user_id)
+async def get_user_words(
+    user_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_WORDS_PAGE_SIZE),
+    after: int = Query(0, ge=0)
+):
+    """
+    Get user's highlighted words.
+    Pass `limit` (and `after` from the previous response's `next_cursor`) to page
+    through the list; without `limit` the whole list is returned.
+    Answers 304 when If-None-Match holds the ETag of the current version.
+    """
+    version = await state.get_user_version(user_id)
+    if version is not None:
+        if etag_matches(request, user_etag(version)):
+            return not_modified(user_etag(version))
+        set_etag(response, user_etag(version))
+    if limit is None and after == 0:
+        words = await state.get_highlighted_words(user_id)
+        return {
+            "user_id": user_id,
+            "highlighted_words": words,
+            "count": len(words)
+        }
+    
+    words, next_cursor = await state.get_highlighted_words_page(
+        user_id, after=after, limit=limit or DEFAULT_WORDS_PAGE_SIZE
+    )
     return {
         "user_id": user_id,
         "highlighted_words": words,
-        "count": len(words)
+        "count": len(words),
+        "total": await state.count_highlighted_words(user_id),
+        "next_cursor": next_cursor
+    }
+
+@app.get("/users/{user_id}/words/changes")
+async def get_user_word_changes(user_id: str, since: int = Query(..., ge=0)):
+    """
+    Get the words added and removed since version `since` (the ETag or
+    `version` of an earlier response). When the server no longer has the
+    changes in between it returns `"full": true` with the whole list instead.
+    """
+    return {"user_id": user_id, **await state.get_word_changes(user_id, since)}
+
+# Page size bounds for /users/{user_id}/words/search
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+
+@app.get("/users/{user_id}/words/search")
+async def search_user_words(
+    user_id: str,
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    fuzzy: bool = True,
+    limit: int = Query(DEFAULT_SEARCH_PAGE_SIZE, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    after: int = Query(0, ge=0)
+):
+    """
+    Search a user's highlighted words, ignoring case. Results are ranked:
+    `exact` matches, then `prefix` (a token starts with `q`), `substring`,
+    and with `fuzzy` (the default) words within a few typos. Pass `after` from
+    the previous response's `next_cursor` for the next page.
+    Answers 304 when If-None-Match holds the ETag of the current version.
+    """
+    version = await state.get_user_version(user_id)
+    if version is not None and etag_matches(request, user_etag(version)):
+        return not_modified(user_etag(version))
+    version, matches = await state.search_words(user_id, q, fuzzy)
+    set_etag(response, user_etag(version))
+    page = matches[after:after + limit]
+    return {
+        "user_id": user_id,
+        "query": q,
+        "results": page,
+        "count": len(page),
+        "total": len(matches),
+        "next_cursor": after + limit if after + limit < len(matches) else None
     }
 
+@app.get("/users/{user_id}/words/export")
+async def export_user_words(user_id: str):
+    """Stream all of a user's highlighted words as NDJSON, one {"word": ...} object per line."""
+    async def generate():
+        after = 0
+        while True:
+            words, after = await state.get_highlighted_words_page(
+                user_id, after=after, limit=MAX_WORDS_PAGE_SIZE
+            )
+            if words:
+                yield "".join(json.dumps({"word": word}, ensure_ascii=False) + "\n" for word in words)
+            if after is None:
+                break
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @app.delete("/users/{user_id}/words/{word}")
 async def remove_user_word(user_id: str, word: str):
     """Remove a word from user's highlighted words."""
-    success = state_manager.remove_highlighted_word(user_id, word)
-    if success:
-        return {
-            "status": "success",
-            "message": f"Word '{word}' removed for user {user_id}"
-        }
-    else:
+    try:
+        removed = await state.record_removal(user_id, word)
+    except Exception as e:
+        logger.error("Error removing word: %s", e)
         raise HTTPException(status_code=500, detail="Failed to remove word")
+    # Only words that were highlighted are news to the Letta agent
+    if removed and letta_outbox is not None:
+        letta_outbox.enqueue(user_id, "remove", word)
+    return {
+        "status": "success",
+        "message": f"Word '{word}' removed for user {user_id}",
+        "removed": removed
+    }
+
+@app.get("/translate/cache/stats")
+async def get_translation_cache_stats():
+    """Get hit/miss counters for the translation cache and batching."""
+    return {**translation_cache.get_stats(), **translator.get_stats()}
+
+# Upper bound on /translate/lexicon?limit=
+MAX_LEXICON_RESULTS = 100
+
+@app.get("/translate/lexicon")
+async def search_lexicon(prefix: str, user_id: Optional[str] = None, limit: int = Query(20, ge=1, le=MAX_LEXICON_RESULTS)):
+    """List lexicon entries starting with `prefix` for the user's language pair."""
+    if lexicon is None:
+        raise HTTPException(status_code=404, detail="Lexicon is disabled")
+    source_language, target_language = await get_user_languages(user_id)
+    source_language_full = expand_language_code(source_language)
+    target_language_full = expand_language_code(target_language)
+    return {
+        "source_language": source_language_full,
+        "target_language": target_language_full,
+        "entries": lexicon.search(prefix, source_language_full, target_language_full, limit)
+    }
+
+async def get_user_languages(user_id: Optional[str]) -> Tuple[str, str]:
+    """Return (source_language, target_language) preferences for a user, with defaults."""
+    if not user_id:
+        return "auto", "Spanish"
+    user_data = await state.get_user(user_id, include_words=False)
+    return user_data.get("source_language", "auto"), user_data.get("target_language", "Spanish")
 
 @app.post("/translate")
 async def translate_endpoint(request: TranslateRequest):
@@ -261,175 +593,354 @@ async def translate_endpoint(request: TranslateRequest):
         if not GROQ_API_KEY:
             raise HTTPException(status_code=500, detail="Groq API key not configured")
         
-        print(f"Received translation request: {request.text}")
-        print(f"Text length: {len(request.text)}")
-        print(f"User ID: {request.user_id}")
-        print("-" * 50)
+        logger.debug("Received translation request", extra={"chars": len(request.text), "user_id": request.user_id})
         
         # Get user's language preferences
-        source_language = "auto"
-        target_language = "Spanish"
-        
-        if request.user_id:
-            user_data = state_manager.get_user(request.user_id)
-            print(f"User data: {user_data}")
-            source_language = user_data.get("source_language", "auto")
-            target_language = user_data.get("target_language", "Spanish")
+        source_language, target_language = await get_user_languages(request.user_id)
         
         # Expand language codes to full names
         source_language_full = expand_language_code(source_language)
         target_language_full = expand_language_code(target_language)
         
-        # Prepare the request for Groq API
-        groq_url = "https://api.groq.com/openai/v1/chat/completions"
-        print(f"Source language: {source_language} -> {source_language_full}")
-        print(f"Target language: {target_language} -> {target_language_full}")
-        
-        # Create dynamic system prompt based on user's language preferences
-        if source_language == "auto":
-            # If source is auto, just translate to target language
-            system_prompt = f"You are a professional translator. Translate the given text to {target_language_full}. Only return the translated text, nothing else."
-        else:
-            # If source is specified, check if text is in source or target language and translate accordingly
-            system_prompt = f"""You are a professional translator. 
-If the text is in {source_language_full}, translate it to {target_language_full}.
-If the text is in {target_language_full}, translate it to {source_language_full}.
-Only return the translated text, nothing else."""
+        # Short texts may come from the lexicon, repeats from the cache; identical concurrent requests share one call
+        try:
+            translated_text, served_by = await translator.translate(request.text, source_language_full, target_language_full)
+        except LLMError as e:
+            logger.warning("Groq API error: %s - %s", e.status_code, e.detail)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        logger.debug("Translated %s -> %s", source_language_full, target_language_full, extra={"served_by": served_by})
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                groq_url,
-                headers={
-                    "Authorization": f"Bearer {GROQ_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "llama-3.3-70b-versatile",
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": system_prompt
-                        },
-                        {
-                            "role": "user",
-                            "content": request.text
-                        }
-                    ],
-                    "temperature": 0.1,
-                    "max_tokens": 1000
-                },
-                timeout=30.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                translated_text = result["choices"][0]["message"]["content"].strip()
-                print(f"Successfully translated: {translated_text}")
-                
-                return {
-                    "status": "success",
-                    "message": "Text translated successfully",
-                    "original_text": request.text,
-                    "translated_text": translated_text,
-                    "source_language": source_language_full,
-                    "target_language": target_language_full
-                }
-            else:
-                print(f"Groq API error: {response.status_code} - {response.text}")
-                raise HTTPException(status_code=response.status_code, detail=f"Groq API error: {response.text}")
+        return {
+            "status": "success",
+            "message": "Text translated successfully",
+            "original_text": request.text,
+            "translated_text": translated_text,
+            "source_language": source_language_full,
+            "target_language": target_language_full,
+            "cached": served_by != "upstream",
+            "served_by": served_by
+        }
                 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error translating text: {e}")
+        logger.error("Error translating text: %s", e)
         raise HTTPException(status_code=500, detail=f"Translation error: {str(e)}")
 
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    """Encode one Server-Sent Events message."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/translate/stream")
+async def translate_stream_endpoint(request: TranslateRequest, http_request: Request):
+    """
+    Streams a translation as Server-Sent Events: a "meta" event with the language
+    pair, one data event per {"delta": ...} chunk, then a "done" event carrying the
+    full text, whether it was cached and the time to first token. The upstream
+    call is cancelled if the client disconnects.
+    """
+    if not GROQ_API_KEY:
+        raise HTTPException(status_code=500, detail="Groq API key not configured")
+    
+    source_language, target_language = await get_user_languages(request.user_id)
+    source_language_full = expand_language_code(source_language)
+    target_language_full = expand_language_code(target_language)
+    
+    async def event_stream():
+        yield format_sse({"source_language": source_language_full, "target_language": target_language_full}, "meta")
+        stream = translator.translate_stream(request.text, source_language_full, target_language_full)
+        try:
+            async for event in stream:
+                if await http_request.is_disconnected():
+                    logger.info("Translation stream client disconnected")
+                    break
+                if event.get("done"):
+                    yield format_sse(event, "done")
+                else:
+                    yield format_sse(event)
+        except LLMError as e:
+            logger.warning("Groq API error: %s - %s", e.status_code, e.detail)
+            yield format_sse({"status_code": e.status_code, "detail": e.detail}, "error")
+        finally:
+            await stream.aclose()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/translate")
+async def websocket_translate_endpoint(websocket: WebSocket):
+    """
+    WebSocket variant of /translate/stream. Each client message is
+    {"text": ..., "user_id": ...}; the server replies with {"type": "delta"},
+    then {"type": "done"} or {"type": "error"} messages. A new message or
+    {"type": "cancel"} aborts the translation in progress.
+    """
+    await manager.connect(websocket)
+    current: Optional[asyncio.Task] = None
+    
+    async def relay(message: dict):
+        source_language, target_language = await get_user_languages(message.get("user_id"))
+        source_language_full = expand_language_code(source_language)
+        target_language_full = expand_language_code(target_language)
+        stream = translator.translate_stream(message["text"], source_language_full, target_language_full)
+        try:
+            async for event in stream:
+                if event.get("done"):
+                    manager.send_json(websocket, {"type": "done", **event})
+                else:
+                    manager.send_json(websocket, {"type": "delta", **event})
+        except LLMError as e:
+            manager.send_json(websocket, {"type": "error", "status_code": e.status_code, "detail": e.detail})
+        finally:
+            await stream.aclose()
+    
+    try:
+        while True:
+            message = await websocket.receive_json()
+            manager.touch(websocket)
+            if message.get("type") == "pong":
+                continue
+            manager.bind_user(websocket, message.get("user_id"))
+            if current is not None and not current.done():
+                current.cancel()
+            if message.get("type") == "cancel" or not message.get("text"):
+                continue
+            current = asyncio.create_task(relay(message))
+    except WebSocketDisconnect:
+        logger.info("Translation WebSocket disconnected")
+    finally:
+        manager.disconnect(websocket)
+        if current is not None and not current.done():
+            current.cancel()
+
+@app.post("/translate/batch")
+async def translate_batch_endpoint(request: BatchTranslateRequest):
+    """
+    Translates many texts at once. Items are grouped by language pair and each
+    group is packed into a single Groq call; per-item languages override the
+    user's preferences. Failed items carry an "error" instead of a translation.
+    """
+    if not GROQ_API_KEY:
+        raise HTTPException(status_code=500, detail="Groq API key not configured")
+    if len(request.items) > MAX_BATCH_TRANSLATE_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_TRANSLATE_ITEMS} items per batch")
+    
+    logger.debug("Received batch translation request", extra={"items": len(request.items)})
+    
+    user_languages = {}
+    items = []
+    for item in request.items:
+        user_id = item.user_id or request.user_id
+        if user_id not in user_languages:
+            user_languages[user_id] = await get_user_languages(user_id)
+        source_language, target_language = user_languages[user_id]
+        items.append((
+            item.text,
+            expand_language_code(item.source_language or source_language),
+            expand_language_code(item.target_language or target_language)
+        ))
+    
+    results = await translator.translate_batch(items)
+    
+    return {
+        "status": "success",
+        "message": "Batch translated",
+        "results": [
+            {
+                "original_text": text,
+                "source_language": source_full,
+                "target_language": target_full,
+                **result
+            }
+            for (text, source_full, target_full), result in zip(items, results)
+        ]
+    }
+
 @app.post("/highlight")
-async def highlight_endpoint(request: HighlightRequest):
+async def highlight_endpoint(request: HighlightRequest, full: bool = False):
     """
-    Receives a JSON object with a 'highlight' key and prints the value.
-    Also forwards the request to Letta server and saves to store.
+    Receives a JSON object with a 'highlight' key and saves it to the store.
+    Newly added words are queued for the Letta agent when it is configured.
+    Only the change is returned unless `full=true` asks for the whole user document.
     """
     try:
-        # Print the highlighted text to console
-        print(f"Received highlight: {request.highlight}")
-        print(f"Highlight length: {len(request.highlight)}")
-        print(f"User ID: {request.user_id}")
-        print("-" * 50)
+        logger.debug("Received highlight %r", request.highlight, extra={"user_id": request.user_id})
         
         # Save to store
-        state_manager.add_highlighted_word(request.user_id, request.highlight)
-        
-        # Get updated user data
-        user_data = state_manager.get_user(request.user_id)
+        added, word_count = await state.record_highlight(request.user_id, request.highlight)
+        if added and letta_outbox is not None:
+            letta_outbox.enqueue(request.user_id, "add", request.highlight)
         
         # Return a success response
-        return {
+        response = {
             "status": "success",
             "message": "Highlight received and logged",
             "highlight": request.highlight,
             "length": len(request.highlight),
             "user_id": request.user_id,
-            "user_data": user_data
+            "added": added,
+            "word_count": word_count
         }
+        if full:
+            response["user_data"] = await state.get_user(request.user_id)
+        return response
     except Exception as e:
-        print(f"Error processing highlight: {e}")
+        logger.error("Error processing highlight: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.get("/letta/outbox/stats")
+async def get_letta_outbox_stats():
+    """Get delivery counters for the queue of vocabulary updates sent to the Letta agent."""
+    if letta_outbox is None:
+        raise HTTPException(status_code=404, detail="Letta is not configured")
+    return letta_outbox.get_stats()
+
+async def transcribe_segment(websocket: WebSocket, kind: str, audio: np.ndarray, segment_id: int,
+                             after: Optional[asyncio.Task] = None):
+    """
+    Transcribe a partial or final utterance and send the result as JSON. With
+    `after`, the result is sent only once that earlier task has finished, so
+    finals transcribed concurrently still reach the client in order.
+    """
+    partial = kind == "partial"
+    error = None
+    try:
+        result = await stt_executor.transcribe(
+            audio,
+            fp16=False,
+            temperature=0.0,
+            condition_on_previous_text=False
+        )
+    except QueueFullError:
+        # Partials are best-effort; only tell the client when a final is dropped
+        if partial:
+            return
+        logger.warning("Transcription queue full, dropping utterance")
+        error = {"type": "busy", "segment_id": segment_id, "message": "transcription queue full, utterance dropped"}
+    except asyncio.TimeoutError:
+        error = {"type": "error", "segment_id": segment_id, "message": "transcription timed out"}
+    except Exception as e:
+        logger.error("Error transcribing audio: %s", e)
+        error = {"type": "error", "segment_id": segment_id, "message": str(e)}
+    if after is not None:
+        await asyncio.wait([after])
+    if error is not None:
+        manager.send_json(websocket, error)
+        return
+    
+    transcribed_text = result["text"]
+    if transcribed_text:
+        if not partial:
+            logger.debug("Transcribed audio: %s", transcribed_text)
+        manager.send_json(websocket, {
+            "type": kind,
+            "segment_id": segment_id,
+            "text": transcribed_text,
+            "duration": round(len(audio) / SAMPLE_RATE, 2)
+        })
+
 @app.websocket("/ws/audio")
 async def websocket_audio_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for receiving audio streams and performing speech-to-text."""
-    await manager.connect(websocket)
+    """
+    WebSocket endpoint for receiving audio streams and performing speech-to-text.
+    
+    Binary frames are decoded in memory (WAV and announced raw PCM directly,
+    compressed streams through a per-connection ffmpeg pipe) and appended to a
+    per-connection buffer that is split into utterances by voice activity
+    detection. The server sends {"type": "partial"} messages while someone is
+    speaking and a {"type": "final"} message when the utterance ends; both are
+    transcribed in tasks, so frames keep being read during inference. Sending
+    the text message "flush" (or pausing for STT_IDLE_FLUSH seconds) finalizes
+    the current utterance. A text message
+    {"type": "config", "format": "pcm_s16le", "sample_rate": 48000, "channels": 1}
+    declares that following binary frames are headerless PCM.
+    """
+    await manager.connect(websocket, user_id=websocket.query_params.get("user_id"))
+    # Start loading the model now so it is ready by the first utterance
+    stt_executor.load()
+    segmenter = UtteranceSegmenter(
+        energy_threshold=float(os.getenv("VAD_ENERGY_THRESHOLD", "0.01")),
+        min_silence_ms=int(os.getenv("VAD_MIN_SILENCE_MS", "700")),
+        partial_interval=float(os.getenv("STT_PARTIAL_INTERVAL", "1.0")),
+        max_utterance_seconds=float(os.getenv("STT_MAX_UTTERANCE_SECONDS", "30"))
+    )
+    decoder = AudioDecoder()
+    segment_id = 0
+    # Transcriptions run as tasks so the receive loop keeps reading frames (and segmenting) during inference
+    partial_task: Optional[asyncio.Task] = None
+    final_task: Optional[asyncio.Task] = None
     
     try:
-        print("Audio WebSocket connection established")
+        logger.info("Audio WebSocket connection established")
         
         while True:
-            # Receive audio data as bytes
-            audio_data = await websocket.receive_bytes()
+            try:
+                message = await asyncio.wait_for(websocket.receive(), timeout=STT_IDLE_FLUSH)
+            except asyncio.TimeoutError:
+                message = {"type": "websocket.receive", "text": "flush"}
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if "text" in message or "bytes" in message:
+                manager.touch(websocket)
             
-            if audio_data:
-                # Process the audio data with Whisper
-                try:
-                    # Convert audio data to format Whisper can process
-                    # Note: This is a simplified approach. In production, you might want to
-                    # accumulate audio chunks and process them in larger segments
-                    
-                    # Create a temporary file for the audio data
-                    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_file:
-                        temp_file.write(audio_data)
-                        temp_file_path = temp_file.name
-                    
-                    # Transcribe with Whisper
-                    result = whisper_model.transcribe(temp_file_path)
-                    transcribed_text = result["text"].strip()
-                    
-                    # Clean up temporary file
-                    os.unlink(temp_file_path)
-                    
-                    # Print transcribed text to console
-                    if transcribed_text:
-                        print(f"🎤 Transcribed Audio: {transcribed_text}")
-                        
-                        # Send confirmation back to client
-                        await manager.send_personal_message(
-                            f"Transcribed: {transcribed_text}", 
-                            websocket
-                        )
-                    
-                except Exception as e:
-                    print(f"Error processing audio: {e}")
-                    await manager.send_personal_message(
-                        f"Error processing audio: {str(e)}", 
-                        websocket
+            events = []
+            try:
+                text = message.get("text")
+                control = json.loads(text) if text and text.startswith("{") else {"type": text}
+                if message.get("bytes"):
+                    # Decode straight from the received bytes, then run voice activity detection
+                    samples = await decoder.decode(message["bytes"])
+                    events = segmenter.feed(samples)
+                elif control["type"] == "config":
+                    decoder.configure(
+                        control["format"],
+                        int(control.get("sample_rate", SAMPLE_RATE)),
+                        int(control.get("channels", 1))
                     )
+                elif control["type"] == "flush":
+                    final = segmenter.flush()
+                    events = [final] if final else []
+                
+                for kind, audio in events:
+                    if kind == "partial":
+                        # Partials are best-effort: skip one while the previous is still being decoded
+                        if partial_task is None or partial_task.done():
+                            partial_task = asyncio.create_task(transcribe_segment(websocket, kind, audio, segment_id))
+                        continue
+                    # A partial still running would arrive after its own final
+                    if partial_task is not None:
+                        partial_task.cancel()
+                        partial_task = None
+                    final_task = asyncio.create_task(
+                        transcribe_segment(websocket, kind, audio, segment_id, after=final_task)
+                    )
+                    segment_id += 1
+            
+            except Exception as e:
+                logger.error("Error processing audio: %s", e)
+                manager.send_json(websocket, {"type": "error", "segment_id": segment_id, "message": str(e)})
     
     except WebSocketDisconnect:
         manager.disconnect(websocket)
-        print("Audio WebSocket disconnected")
+        logger.info("Audio WebSocket disconnected")
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.error("WebSocket error: %s", e)
         manager.disconnect(websocket)
+    finally:
+        # Results can no longer be delivered once the socket is gone
+        for task in (partial_task, final_task):
+            if task is not None:
+                task.cancel()
+        # Stop the compressed-stream decoder so no ffmpeg process outlives the socket
+        await decoder.close()
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    if WORKERS > 1:
+        # Each worker process imports main and builds its own app around the shared backends
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,88 @@
+import hashlib
+from typing import Dict, List, Optional
+from highlight_set import normalize_word
+
+class PhraseTable:
+    """
+    Content-addressed, reference-counted table of highlighted strings shared
+    by every user of the JSON store.
+
+    A phrase's ID is derived from its text (a truncated BLAKE2b digest), so
+    the same string highlighted by many users is stored once and every user
+    holds only the ID. Each entry counts the users referencing it and is
+    dropped when the last one lets go. The normalized key of each phrase is
+    kept with it, so users' dedup indexes share one key string as well.
+    """
+
+    # 12 hex digits = 48 bits; a collision is resolved by rehashing with a salt
+    ID_CHARS = 12
+
+    def __init__(self):
+        # id -> [text, normalized key, references]
+        self._entries: Dict[str, List] = {}
+        self._ids: Dict[str, str] = {}
+        # Sum of every entry's references, kept current so stats need no scan
+        self.references = 0
+
+    @classmethod
+    def phrase_id(cls, text: str, attempt: int = 0) -> str:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=8, salt=attempt.to_bytes(8, "little"))
+        return digest.hexdigest()[:cls.ID_CHARS]
+
+    def acquire(self, text: str) -> str:
+        """Add a reference to `text`, storing it if new; returns its ID."""
+        phrase_id = self._ids.get(text)
+        if phrase_id is None:
+            attempt = 0
+            phrase_id = self.phrase_id(text)
+            while phrase_id in self._entries:
+                attempt += 1
+                phrase_id = self.phrase_id(text, attempt)
+            self._entries[phrase_id] = [text, normalize_word(text), 0]
+            self._ids[text] = phrase_id
+        self._entries[phrase_id][2] += 1
+        self.references += 1
+        return phrase_id
+
+    def release(self, phrase_id: str) -> None:
+        """Drop a reference; the phrase is removed with its last one."""
+        entry = self._entries[phrase_id]
+        entry[2] -= 1
+        self.references -= 1
+        if entry[2] <= 0:
+            del self._entries[phrase_id]
+            del self._ids[entry[0]]
+
+    def text(self, phrase_id: str) -> str:
+        return self._entries[phrase_id][0]
+
+    def key(self, phrase_id: str) -> str:
+        return self._entries[phrase_id][1]
+
+    def lookup(self, phrase_id: str) -> Optional[str]:
+        entry = self._entries.get(phrase_id)
+        return None if entry is None else entry[0]
+
+    def load(self, phrases: Dict[str, str]) -> None:
+        """
+        Register phrases read from a snapshot under their saved IDs, with no
+        references yet; `drop_unreferenced` removes any no user claims.
+        """
+        for phrase_id, text in phrases.items():
+            self._entries[phrase_id] = [text, normalize_word(text), 0]
+            self._ids[text] = phrase_id
+
+    def drop_unreferenced(self) -> int:
+        unused = [phrase_id for phrase_id, entry in self._entries.items() if entry[2] <= 0]
+        for phrase_id in unused:
+            del self._ids[self._entries.pop(phrase_id)[0]]
+        return len(unused)
+
+    def to_dict(self) -> Dict[str, str]:
+        return {phrase_id: entry[0] for phrase_id, entry in self._entries.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        return {"unique_phrases": len(self._entries), "phrase_references": self.references}
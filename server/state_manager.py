@@ -1,121 +1,345 @@
-import json
-import os
-from typing import Dict, List, Optional
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+from highlight_set import normalize_word
+from storage import JsonStorage, StorageBackend
+from word_index import WordIndex
+
+logger = logging.getLogger(__name__)
+
+# (version, "add_word" | "remove_word" | "set_languages", word or None)
+Change = Tuple[int, str, Optional[str]]
 
 class StateManager:
-    def __init__(self, store_file: str = "store.json"):
-        self.store_file = store_file
-        self.store = self.load_store()
-    
-    def load_store(self) -> Dict:
-        """Load the store from JSON file."""
-        try:
-            if os.path.exists(self.store_file):
-                with open(self.store_file, 'r', encoding='utf-8') as f:
-                    store = json.load(f)
-                    print(f"Store loaded from {self.store_file}")
-                    return store
+    """
+    Every change to a user bumps the user's version in storage, which clients
+    use as an ETag. The last `change_log_size` changes of up to
+    `change_log_users` recently changed users are also kept in memory so
+    `get_word_changes` can answer with a delta; anything it does not cover
+    (older versions, a restart, a change made by another process) falls back
+    to the full word list.
+
+    Word search uses a per-user WordIndex, built on a user's first search
+    and then updated with each change. Up to `search_index_users` recently
+    searched users keep their index. An index whose version no longer
+    matches the user's (a change made by another process) is rebuilt.
+    """
+
+    def __init__(self, storage: Optional[StorageBackend] = None, store_file: str = "store.json",
+                 change_log_size: int = 1000, change_log_users: int = 10000, search_index_users: int = 1000):
+        self.storage = storage if storage is not None else JsonStorage(store_file)
+        self.change_log_size = change_log_size
+        self.change_log_users = change_log_users
+        self._changes: "OrderedDict[str, Deque[Change]]" = OrderedDict()
+        self._changes_lock = threading.Lock()
+        self.search_index_users = search_index_users
+        self._indexes: "OrderedDict[str, WordIndex]" = OrderedDict()
+        self._indexes_lock = threading.Lock()
+
+    def _record_change(self, user_id: str, op: str, word: Optional[str] = None) -> int:
+        """Bump the user's version and log the change under it."""
+        version = self.storage.bump_version(user_id)
+        with self._changes_lock:
+            changes = self._changes.get(user_id)
+            if changes is None:
+                changes = self._changes[user_id] = deque(maxlen=self.change_log_size)
+                if len(self._changes) > self.change_log_users:
+                    self._changes.popitem(last=False)
             else:
-                # Create initial store structure
-                initial_store = {"users": {}}
-                self.save_store(initial_store)
-                print(f"Created new store file: {self.store_file}")
-                return initial_store
-        except Exception as e:
-            print(f"Error loading store: {e}")
-            # Return default structure if loading fails
-            return {"users": {}}
-    
-    def save_store(self, store: Optional[Dict] = None) -> bool:
-        """Save the store to JSON file."""
-        try:
-            store_to_save = store if store is not None else self.store
-            with open(self.store_file, 'w', encoding='utf-8') as f:
-                json.dump(store_to_save, f, indent=2, ensure_ascii=False)
-            print(f"Store saved to {self.store_file}")
-            return True
-        except Exception as e:
-            print(f"Error saving store: {e}")
-            return False
-    
-    def get_user(self, user_id: str) -> Dict:
+                self._changes.move_to_end(user_id)
+            changes.append((version, op, word))
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                if index.version != version - 1:
+                    # Missed a change; rebuilt on the next search
+                    del self._indexes[user_id]
+                else:
+                    index.version = version
+                    if op == "add_word":
+                        index.add(word)
+                    elif op == "remove_word":
+                        index.remove(word)
+        return version
+
+    def _forget_changes(self, user_id: str) -> None:
+        with self._changes_lock:
+            self._changes.pop(user_id, None)
+        with self._indexes_lock:
+            self._indexes.pop(user_id, None)
+
+    def close(self) -> None:
+        """Flush and close the storage backend."""
+        self.storage.close()
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Dict:
         """Get user data, create if doesn't exist."""
-        if user_id not in self.store["users"]:
-            self.store["users"][user_id] = {
-                "source_language": "auto",
-                "target_language": "Spanish",
-                "highlighted_words": []
-            }
-            self.save_store()
-        return self.store["users"][user_id]
-    
+        user = self.storage.get_user(user_id, include_words=include_words)
+        if user is None:
+            self.create_user(user_id)
+            user = self.storage.get_user(user_id, include_words=include_words)
+        return user
+
+    def user_exists(self, user_id: str) -> bool:
+        """Check whether a user has been created."""
+        return self.storage.user_exists(user_id)
+
+    def create_user(self, user_id: str, password: Optional[str] = None) -> Dict:
+        """Create a user with default language preferences."""
+        data = {
+            "source_language": "auto",
+            "target_language": "Spanish",
+            "highlighted_words": [],
+            # Start from the clock so a re-created user never repeats a version its predecessor handed out
+            "version": time.time_ns() // 1000
+        }
+        if password is not None:
+            data["password"] = password
+        self._forget_changes(user_id)
+        self.storage.create_user(user_id, data)
+        return self.storage.get_user(user_id)
+
     def update_user_languages(self, user_id: str, source_language: str = None, target_language: str = None) -> bool:
         """Update user's language preferences."""
         try:
-            user = self.get_user(user_id)
-            if source_language:
-                user["source_language"] = source_language
-            if target_language:
-                user["target_language"] = target_language
-            self.save_store()
+            self.get_user(user_id)
+            self.storage.update_languages(user_id, source_language, target_language)
+            self._record_change(user_id, "set_languages")
             return True
         except Exception as e:
-            print(f"Error updating user languages: {e}")
+            logger.error("Error updating user languages: %s", e)
             return False
-    
+
     def add_highlighted_word(self, user_id: str, word: str) -> bool:
         """Add a highlighted word to user's list."""
         try:
-            user = self.get_user(user_id)
-            if word not in user["highlighted_words"]:
-                user["highlighted_words"].append(word)
-                self.save_store()
-                print(f"Added word '{word}' for user {user_id}")
+            if not self.user_exists(user_id):
+                self.create_user(user_id)
+            if self.storage.add_word(user_id, word):
+                self._record_change(user_id, "add_word", word)
+                logger.debug("Added word %r for user %s", word, user_id)
             return True
         except Exception as e:
-            print(f"Error adding highlighted word: {e}")
+            logger.error("Error adding highlighted word: %s", e)
             return False
-    
+
+    def has_highlighted_word(self, user_id: str, word: str) -> bool:
+        """Check whether the user already highlighted an equivalent word."""
+        return self.user_exists(user_id) and self.storage.has_word(user_id, word)
+
     def get_highlighted_words(self, user_id: str) -> List[str]:
         """Get user's highlighted words list."""
-        user = self.get_user(user_id)
-        return user["highlighted_words"]
-    
+        if not self.user_exists(user_id):
+            self.create_user(user_id)
+        return self.storage.get_words(user_id)
+
+    def get_highlighted_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        """Get one page of user's highlighted words and the cursor for the next page."""
+        if not self.user_exists(user_id):
+            self.create_user(user_id)
+        return self.storage.get_words_page(user_id, after, limit)
+
+    def count_highlighted_words(self, user_id: str) -> int:
+        """Get the number of words the user has highlighted."""
+        if not self.user_exists(user_id):
+            return 0
+        return self.storage.count_words(user_id)
+
     def remove_highlighted_word(self, user_id: str, word: str) -> bool:
         """Remove a highlighted word from user's list."""
         try:
-            user = self.get_user(user_id)
-            if word in user["highlighted_words"]:
-                user["highlighted_words"].remove(word)
-                self.save_store()
-                print(f"Removed word '{word}' for user {user_id}")
+            if not self.user_exists(user_id):
+                self.create_user(user_id)
+            if self.storage.remove_word(user_id, word):
+                self._record_change(user_id, "remove_word", word)
+                logger.debug("Removed word %r for user %s", word, user_id)
             return True
         except Exception as e:
-            print(f"Error removing highlighted word: {e}")
+            logger.error("Error removing highlighted word: %s", e)
             return False
-    
+
+    def get_user_version(self, user_id: str) -> Optional[int]:
+        """Get the user's current version, or None if the user does not exist."""
+        return self.storage.get_version(user_id)
+
+    def get_word_changes(self, user_id: str, since: int) -> Dict:
+        """
+        Get the words added and removed after version `since`. Returns
+        {"version", "full": False, "added", "removed"}, or {"version", "full": True,
+        "highlighted_words"} with the whole list when the change log cannot
+        cover the range.
+        """
+        version = self.storage.get_version(user_id)
+        if version is None:
+            self.create_user(user_id)
+            version = self.storage.get_version(user_id)
+        with self._changes_lock:
+            changes = [change for change in self._changes.get(user_id, ()) if since < change[0] <= version]
+        # Logged versions only increase, so the log covers the range when none are missing from it.
+        # A `since` ahead of the version comes from an earlier user with the same ID.
+        if since > version or len(changes) != version - since:
+            return {"version": version, "full": True, "highlighted_words": self.storage.get_words(user_id)}
+        # Only the last change to each word counts
+        latest: Dict[str, Change] = {}
+        for change in changes:
+            if change[2] is not None:
+                latest.pop(normalize_word(change[2]), None)
+                latest[normalize_word(change[2])] = change
+        return {
+            "version": version,
+            "full": False,
+            "added": [word for _, op, word in latest.values() if op == "add_word"],
+            "removed": [word for _, op, word in latest.values() if op == "remove_word"]
+        }
+
+    def search_words(self, user_id: str, query: str, fuzzy: bool = True) -> Tuple[int, List[Dict]]:
+        """Search the user's highlighted words; returns (version, ranked matches)."""
+        version = self.storage.get_version(user_id)
+        if version is None:
+            self.create_user(user_id)
+            version = self.storage.get_version(user_id)
+        with self._indexes_lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(user_id)
+                return version, index.search(query, fuzzy)
+        index = WordIndex(version, self.storage.get_words(user_id))
+        logger.debug("Built search index of %d words for user %s", len(index), user_id)
+        with self._indexes_lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            if len(self._indexes) > self.search_index_users:
+                self._indexes.popitem(last=False)
+            return version, index.search(query, fuzzy)
+
     def get_all_users(self) -> Dict:
         """Get all users data."""
-        return self.store["users"]
-    
+        return self.storage.get_all_users()
+
     def delete_user(self, user_id: str) -> bool:
         """Delete a user and their data."""
         try:
-            if user_id in self.store["users"]:
-                del self.store["users"][user_id]
-                self.save_store()
-                print(f"Deleted user {user_id}")
+            if self.user_exists(user_id):
+                self.storage.delete_user(user_id)
+                self._forget_changes(user_id)
+                logger.info("Deleted user %s", user_id)
             return True
         except Exception as e:
-            print(f"Error deleting user: {e}")
+            logger.error("Error deleting user: %s", e)
             return False
-    
+
     def get_store_stats(self) -> Dict:
         """Get statistics about the store."""
-        total_users = len(self.store["users"])
-        total_words = sum(len(user["highlighted_words"]) for user in self.store["users"].values())
-        return {
-            "total_users": total_users,
-            "total_highlighted_words": total_words,
-            "users": list(self.store["users"].keys())
-        } 
\ No newline at end of file
+        return self.storage.get_stats()
+
+    def get_store_analytics(self, top_n: int = 10) -> Dict:
+        """Get the most highlighted words and the language pair counts."""
+        return self.storage.get_analytics(top_n)
+
+class AsyncStateManager:
+    """
+    Async facade over StateManager for use from request handlers.
+
+    Calls that create or change a user's data hold one of `stripes` asyncio
+    locks chosen by user ID, so concurrent requests for the same user run one
+    at a time while other users proceed in parallel. When the backend does
+    blocking disk I/O the call runs in a worker thread instead of on the
+    event loop.
+    """
+
+    def __init__(self, state_manager: StateManager, stripes: int = 64):
+        self.state_manager = state_manager
+        self.offload = state_manager.storage.blocking_io
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def _lock_for(self, user_id: str) -> asyncio.Lock:
+        return self._locks[hash(user_id) % len(self._locks)]
+
+    async def _call(self, func, *args, **kwargs):
+        if self.offload:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    async def _locked(self, user_id: str, func, *args, **kwargs):
+        async with self._lock_for(user_id):
+            return await self._call(func, *args, **kwargs)
+
+    async def close(self) -> None:
+        """Flush and close the storage backend off the event loop."""
+        await asyncio.to_thread(self.state_manager.close)
+
+    async def get_user(self, user_id: str, include_words: bool = True) -> Dict:
+        """Get user data, create if doesn't exist."""
+        return await self._locked(user_id, self.state_manager.get_user, user_id, include_words=include_words)
+
+    async def user_exists(self, user_id: str) -> bool:
+        return await self._call(self.state_manager.user_exists, user_id)
+
+    async def get_user_version(self, user_id: str) -> Optional[int]:
+        return await self._call(self.state_manager.get_user_version, user_id)
+
+    async def get_word_changes(self, user_id: str, since: int) -> Dict:
+        return await self._locked(user_id, self.state_manager.get_word_changes, user_id, since)
+
+    async def search_words(self, user_id: str, query: str, fuzzy: bool = True) -> Tuple[int, List[Dict]]:
+        return await self._locked(user_id, self.state_manager.search_words, user_id, query, fuzzy)
+
+    async def register_user(self, user_id: str, password: str) -> Optional[Dict]:
+        """Create a user with a password; None if the user already exists."""
+        def register():
+            if self.state_manager.user_exists(user_id):
+                return None
+            return self.state_manager.create_user(user_id, password=password)
+        return await self._locked(user_id, register)
+
+    async def update_user_languages(self, user_id: str, source_language: str = None,
+                                    target_language: str = None) -> Optional[Dict]:
+        """Update language preferences; returns the updated user, or None on failure."""
+        def update():
+            if not self.state_manager.update_user_languages(user_id, source_language, target_language):
+                return None
+            return self.state_manager.get_user(user_id)
+        return await self._locked(user_id, update)
+
+    async def record_highlight(self, user_id: str, word: str) -> Tuple[bool, int]:
+        """Add a highlighted word; returns (added, word_count) as one atomic step."""
+        def record():
+            added = not self.state_manager.has_highlighted_word(user_id, word)
+            if not self.state_manager.add_highlighted_word(user_id, word):
+                raise RuntimeError(f"Could not save highlight for user {user_id}")
+            return added, self.state_manager.count_highlighted_words(user_id)
+        return await self._locked(user_id, record)
+
+    async def get_highlighted_words(self, user_id: str) -> List[str]:
+        return await self._locked(user_id, self.state_manager.get_highlighted_words, user_id)
+
+    async def get_highlighted_words_page(self, user_id: str, after: int = 0,
+                                         limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        return await self._locked(user_id, self.state_manager.get_highlighted_words_page, user_id, after, limit)
+
+    async def count_highlighted_words(self, user_id: str) -> int:
+        return await self._call(self.state_manager.count_highlighted_words, user_id)
+
+    async def remove_highlighted_word(self, user_id: str, word: str) -> bool:
+        return await self._locked(user_id, self.state_manager.remove_highlighted_word, user_id, word)
+
+    async def record_removal(self, user_id: str, word: str) -> bool:
+        """Remove a highlighted word; returns whether it was there, as one atomic step."""
+        def record():
+            removed = self.state_manager.has_highlighted_word(user_id, word)
+            if not self.state_manager.remove_highlighted_word(user_id, word):
+                raise RuntimeError(f"Could not remove word for user {user_id}")
+            return removed
+        return await self._locked(user_id, record)
+
+    async def delete_user(self, user_id: str) -> bool:
+        return await self._locked(user_id, self.state_manager.delete_user, user_id)
+
+    async def get_store_stats(self) -> Dict:
+        return await self._call(self.state_manager.get_store_stats)
+
+    async def get_store_analytics(self, top_n: int = 10) -> Dict:
+        return await self._call(self.state_manager.get_store_analytics, top_n)
@@ -0,0 +1,1263 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from highlight_set import HighlightSet, normalize_word
+from metrics import REGISTRY
+from phrase_table import PhraseTable
+from store_journal import StoreJournal
+from store_stats import StoreStats, language_pair_rows
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SECONDS = REGISTRY.histogram("store_snapshot_seconds", "Time to serialize and write a JSON store snapshot")
+SNAPSHOT_BYTES = REGISTRY.gauge("store_snapshot_bytes", "Size of the last JSON store snapshot written")
+
+class StorageBackend:
+    """
+    Interface between StateManager and the underlying persistence engine.
+
+    User documents have the shape
+    {"source_language", "target_language", "highlighted_words", ["password"]}.
+    """
+
+    # True when calls do disk I/O on the calling thread and should be kept off the event loop
+    blocking_io = False
+
+    def user_exists(self, user_id: str) -> bool:
+        raise NotImplementedError
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Optional[Dict]:
+        """
+        Return the user document, or None if the user does not exist.
+        With include_words=False the word list is replaced by a "word_count".
+        """
+        raise NotImplementedError
+
+    def create_user(self, user_id: str, data: Dict) -> None:
+        raise NotImplementedError
+
+    def delete_user(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def update_languages(self, user_id: str, source_language: Optional[str], target_language: Optional[str]) -> None:
+        raise NotImplementedError
+
+    def add_word(self, user_id: str, word: str) -> bool:
+        """Append a word; return False if it was already present."""
+        raise NotImplementedError
+
+    def remove_word(self, user_id: str, word: str) -> bool:
+        """Remove a word; return False if it was not present."""
+        raise NotImplementedError
+
+    def has_word(self, user_id: str, word: str) -> bool:
+        raise NotImplementedError
+
+    def get_words(self, user_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def get_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        """Return words added after cursor `after` and the next cursor (None at the end)."""
+        raise NotImplementedError
+
+    def count_words(self, user_id: str) -> int:
+        raise NotImplementedError
+
+    def get_all_users(self) -> Dict:
+        raise NotImplementedError
+
+    def get_version(self, user_id: str) -> Optional[int]:
+        """Return the user's version, or None if the user does not exist."""
+        raise NotImplementedError
+
+    def bump_version(self, user_id: str) -> int:
+        """Increment the user's version and return the new value."""
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict:
+        """Return {"total_users", "total_highlighted_words"} from counters, without a scan."""
+        raise NotImplementedError
+
+    def get_analytics(self, top_n: int = 10) -> Dict:
+        """
+        Return {"top_words", "top_words_exact", "language_pairs"}: the words
+        highlighted by the most users and the number of users per language pair.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class JsonStorage(StorageBackend):
+    """
+    In-memory store mirrored to a JSON snapshot plus a write-ahead journal.
+
+    Highlighted strings live once in a shared PhraseTable. Each user's
+    HighlightSet holds phrase IDs, and the snapshot writes the table under
+    "phrases" with ID lists per user. A snapshot in the older layout, with
+    the strings inline, is converted on load and copied to
+    `<store_file>.v1` first.
+    """
+
+    def __init__(self, store_file: str = "store.json", journal_file: Optional[str] = None,
+                 flush_interval: float = 0.05, flush_batch_size: int = 256,
+                 compact_every: int = 5000, top_capacity: int = 1000):
+        self.store_file = store_file
+        self.journal = StoreJournal(
+            journal_file or f"{store_file}.journal",
+            flush_interval=flush_interval,
+            batch_size=flush_batch_size,
+            compact_every=compact_every
+        )
+        self._lock = threading.RLock()
+        self.phrases = PhraseTable()
+        self.store = self.load_store()
+        # Counted once at load, then kept current by every applied change
+        self.stats = StoreStats(top_capacity)
+        for user in self.store["users"].values():
+            self.stats.add_user(user)
+        self.journal.start(self.replay_journal(), self.save_store)
+
+    def load_store(self) -> Dict:
+        """Load the store from JSON file."""
+        try:
+            if os.path.exists(self.store_file):
+                with open(self.store_file, 'r', encoding='utf-8') as f:
+                    store = json.load(f)
+                if "phrases" not in store and store["users"]:
+                    # Older layout with the strings inline; rewritten with IDs by the next snapshot
+                    shutil.copy2(self.store_file, f"{self.store_file}.v1")
+                    logger.info("Converting %s to the phrase table layout (original kept as %s.v1)",
+                                self.store_file, self.store_file)
+                load_users(store, self.phrases)
+                logger.info("Store loaded from %s", self.store_file)
+                return store
+            else:
+                # Create initial store structure
+                self.save_store({"phrases": {}, "users": {}})
+                logger.info("Created new store file: %s", self.store_file)
+                return {"users": {}}
+        except Exception as e:
+            logger.error("Error loading store: %s", e)
+            # Return default structure if loading fails
+            return {"users": {}}
+
+    def replay_journal(self) -> int:
+        """Apply journal entries newer than the snapshot; return the last sequence seen."""
+        last_seq = self.store.get("journal_seq", 0)
+        entries = self.journal.read_entries(after_seq=last_seq)
+        for entry in entries:
+            self._apply(entry)
+            last_seq = entry["seq"]
+        if entries:
+            logger.info("Replayed %d journal entries from %s", len(entries), self.journal.journal_file)
+        return last_seq
+
+    def save_store(self, store: Optional[Dict] = None) -> bool:
+        """Write a compacted snapshot of the store and trim the journal it covers."""
+        started_at = time.perf_counter()
+        try:
+            if store is None:
+                # Copy under the lock, serialize outside it so mutations are not held up by json.dumps
+                with self._lock:
+                    snapshot_seq = self.journal.seq
+                    store_to_save = {
+                        "phrases": self.phrases.to_dict(),
+                        "users": {
+                            user_id: dict(user, highlighted_words=user["highlighted_words"].stored_values())
+                            for user_id, user in self.store["users"].items()
+                        },
+                        "journal_seq": snapshot_seq
+                    }
+            else:
+                store_to_save = store
+                snapshot_seq = store.get("journal_seq", 0)
+            data = json.dumps(store_to_save, indent=2, ensure_ascii=False)
+            # Write-then-rename so readers only ever see a complete snapshot
+            tmp_file = f"{self.store_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.store_file)
+            _fsync_dir(self.store_file)
+            if store is None:
+                self.journal.truncate(snapshot_seq)
+            SNAPSHOT_SECONDS.observe(time.perf_counter() - started_at)
+            SNAPSHOT_BYTES.set(os.path.getsize(self.store_file))
+            logger.debug("Store saved to %s", self.store_file)
+            return True
+        except Exception as e:
+            logger.error("Error saving store: %s", e)
+            return False
+
+    def close(self) -> None:
+        """Flush pending journal entries and write a final snapshot."""
+        self.journal.close()
+        self.save_store()
+
+    def _record(self, op: Dict) -> None:
+        """Apply a mutation in memory and queue it for the journal."""
+        with self._lock:
+            self._apply(op)
+            self.journal.append(op)
+
+    def _apply(self, op: Dict) -> None:
+        users = self.store["users"]
+        kind = op["op"]
+        if kind == "create_user":
+            existing = users.get(op["user_id"])
+            if existing is not None:
+                self.stats.remove_user(existing)
+                existing["highlighted_words"].clear()
+            # Copy so the queued journal entry is not mutated by later operations
+            users[op["user_id"]] = dict(
+                op["data"], highlighted_words=HighlightSet(op["data"]["highlighted_words"], self.phrases)
+            )
+            self.stats.add_user(users[op["user_id"]])
+        elif kind == "delete_user":
+            user = users.pop(op["user_id"], None)
+            if user is not None:
+                self.stats.remove_user(user)
+                user["highlighted_words"].clear()
+        elif kind == "set_languages":
+            user = users[op["user_id"]]
+            old_pair = (user["source_language"], user["target_language"])
+            if op.get("source_language"):
+                user["source_language"] = op["source_language"]
+            if op.get("target_language"):
+                user["target_language"] = op["target_language"]
+            self.stats.change_languages(old_pair, (user["source_language"], user["target_language"]))
+        elif kind == "add_word":
+            if users[op["user_id"]]["highlighted_words"].add(op["word"]):
+                self.stats.add_word(op["word"])
+        elif kind == "remove_word":
+            if users[op["user_id"]]["highlighted_words"].discard(op["word"]):
+                self.stats.remove_word(op["word"])
+        elif kind == "bump_version":
+            user = users[op["user_id"]]
+            user["version"] = user.get("version", 0) + 1
+
+    def user_exists(self, user_id: str) -> bool:
+        return user_id in self.store["users"]
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Optional[Dict]:
+        user = self.store["users"].get(user_id)
+        if user is None:
+            return None
+        user = dict(user)
+        user.setdefault("version", 0)
+        words = user.pop("highlighted_words")
+        if include_words:
+            user["highlighted_words"] = words.to_list()
+        else:
+            user["word_count"] = len(words)
+        return user
+
+    def get_version(self, user_id: str) -> Optional[int]:
+        user = self.store["users"].get(user_id)
+        return None if user is None else user.get("version", 0)
+
+    def bump_version(self, user_id: str) -> int:
+        with self._lock:
+            self._record({"op": "bump_version", "user_id": user_id})
+            return self.store["users"][user_id]["version"]
+
+    def create_user(self, user_id: str, data: Dict) -> None:
+        self._record({"op": "create_user", "user_id": user_id, "data": data})
+
+    def delete_user(self, user_id: str) -> None:
+        self._record({"op": "delete_user", "user_id": user_id})
+
+    def update_languages(self, user_id: str, source_language: Optional[str], target_language: Optional[str]) -> None:
+        self._record({
+            "op": "set_languages",
+            "user_id": user_id,
+            "source_language": source_language,
+            "target_language": target_language
+        })
+
+    def add_word(self, user_id: str, word: str) -> bool:
+        if word in self.store["users"][user_id]["highlighted_words"]:
+            return False
+        self._record({"op": "add_word", "user_id": user_id, "word": word})
+        return True
+
+    def remove_word(self, user_id: str, word: str) -> bool:
+        if word not in self.store["users"][user_id]["highlighted_words"]:
+            return False
+        self._record({"op": "remove_word", "user_id": user_id, "word": word})
+        return True
+
+    def has_word(self, user_id: str, word: str) -> bool:
+        return word in self.store["users"][user_id]["highlighted_words"]
+
+    def get_words(self, user_id: str) -> List[str]:
+        return self.store["users"][user_id]["highlighted_words"].to_list()
+
+    def get_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        with self._lock:
+            return self.store["users"][user_id]["highlighted_words"].page(after, limit)
+
+    def count_words(self, user_id: str) -> int:
+        return len(self.store["users"][user_id]["highlighted_words"])
+
+    def get_all_users(self) -> Dict:
+        return {user_id: self.get_user(user_id) for user_id in self.store["users"]}
+
+    def get_stats(self) -> Dict:
+        return {**self.stats.summary(), **self.phrases.get_stats()}
+
+    def get_analytics(self, top_n: int = 10) -> Dict:
+        with self._lock:
+            return self.stats.analytics(top_n)
+
+def load_users(store: Dict, phrases: Optional[PhraseTable] = None) -> Dict:
+    """
+    Turn the users of a parsed JSON store into HighlightSets, in place, and
+    return the store. Reads both layouts: phrase IDs with a "phrases" table,
+    or the strings inline. With `phrases`, words are held as IDs in that table.
+    """
+    saved = store.pop("phrases", None)
+    if saved is not None and phrases is not None:
+        phrases.load(saved)
+    for user in store["users"].values():
+        words = user["highlighted_words"]
+        if saved is not None:
+            words = [saved[phrase_id] for phrase_id in words]
+        user["highlighted_words"] = HighlightSet(words, phrases)
+    if phrases is not None:
+        phrases.drop_unreferenced()
+    return store
+
+def read_json_users(store_file: str) -> Dict:
+    """Users of a JSON store file with their words as strings, whichever layout it uses."""
+    with open(store_file, 'r', encoding='utf-8') as f:
+        store = json.load(f)
+    phrases = store.get("phrases")
+    users = store.get("users", {})
+    if phrases is not None:
+        for user in users.values():
+            user["highlighted_words"] = [phrases[phrase_id] for phrase_id in user.get("highlighted_words", [])]
+    return users
+
+class SQLiteStorage(StorageBackend):
+    """
+    SQLite store in WAL mode with one row per user and one row per highlighted word.
+
+    Nothing is loaded into memory up front; each call is an indexed query.
+    """
+
+    blocking_io = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id TEXT PRIMARY KEY,
+        source_language TEXT NOT NULL DEFAULT 'auto',
+        target_language TEXT NOT NULL DEFAULT 'Spanish',
+        password TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS highlighted_words (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL REFERENCES users(user_id) ON DELETE CASCADE,
+        word TEXT NOT NULL,
+        word_key TEXT NOT NULL,
+        UNIQUE (user_id, word_key)
+    );
+    CREATE INDEX IF NOT EXISTS idx_highlighted_words_user_id ON highlighted_words (user_id, id);
+    """
+
+    # Counters maintained by triggers in the same transaction as each change
+    STATS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS store_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS word_counts (
+        word_key TEXT PRIMARY KEY,
+        users INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_word_counts_users ON word_counts (users);
+    CREATE TABLE IF NOT EXISTS language_pair_counts (
+        source_language TEXT NOT NULL,
+        target_language TEXT NOT NULL,
+        users INTEGER NOT NULL,
+        PRIMARY KEY (source_language, target_language)
+    );
+    CREATE TRIGGER IF NOT EXISTS count_word_insert AFTER INSERT ON highlighted_words BEGIN
+        UPDATE store_counters SET value = value + 1 WHERE name = 'words';
+        INSERT INTO word_counts VALUES (NEW.word_key, 1)
+            ON CONFLICT (word_key) DO UPDATE SET users = users + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS count_word_delete AFTER DELETE ON highlighted_words BEGIN
+        UPDATE store_counters SET value = value - 1 WHERE name = 'words';
+        UPDATE word_counts SET users = users - 1 WHERE word_key = OLD.word_key;
+        DELETE FROM word_counts WHERE word_key = OLD.word_key AND users <= 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS count_user_insert AFTER INSERT ON users BEGIN
+        UPDATE store_counters SET value = value + 1 WHERE name = 'users';
+        INSERT INTO language_pair_counts VALUES (NEW.source_language, NEW.target_language, 1)
+            ON CONFLICT (source_language, target_language) DO UPDATE SET users = users + 1;
+    END;
+    CREATE TRIGGER IF NOT EXISTS count_user_delete AFTER DELETE ON users BEGIN
+        UPDATE store_counters SET value = value - 1 WHERE name = 'users';
+        UPDATE language_pair_counts SET users = users - 1
+            WHERE source_language = OLD.source_language AND target_language = OLD.target_language;
+        DELETE FROM language_pair_counts WHERE users <= 0;
+    END;
+    CREATE TRIGGER IF NOT EXISTS count_user_languages AFTER UPDATE OF source_language, target_language ON users
+    WHEN OLD.source_language IS NOT NEW.source_language OR OLD.target_language IS NOT NEW.target_language BEGIN
+        UPDATE language_pair_counts SET users = users - 1
+            WHERE source_language = OLD.source_language AND target_language = OLD.target_language;
+        DELETE FROM language_pair_counts WHERE users <= 0;
+        INSERT INTO language_pair_counts VALUES (NEW.source_language, NEW.target_language, 1)
+            ON CONFLICT (source_language, target_language) DO UPDATE SET users = users + 1;
+    END;
+    """
+
+    def __init__(self, db_file: str = "store.db", import_file: Optional[str] = None):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        # So the row deleted by INSERT OR REPLACE also goes through the counting triggers
+        self.conn.execute("PRAGMA recursive_triggers=ON")
+        self.conn.executescript(self.SCHEMA)
+        self._add_column("users", "version INTEGER NOT NULL DEFAULT 0")
+        self._init_counters()
+        logger.info("SQLite store opened at %s", db_file)
+        if import_file and os.path.exists(import_file) and not self._has_users():
+            self.import_json(import_file)
+
+    def _add_column(self, table: str, column: str) -> None:
+        """Add a column missing from a database created by an older version."""
+        if column.split()[0] in {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}:
+            return
+        try:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        except sqlite3.OperationalError as e:
+            # Another worker added it first
+            if "duplicate column" not in str(e):
+                raise
+
+    def _init_counters(self) -> None:
+        """Create the counter tables and triggers, backfilling them once for a database that predates them."""
+        # One transaction, so another worker starting at the same time cannot count anything twice
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in _split_sql(self.STATS_SCHEMA):
+                self.conn.execute(statement)
+            if self.conn.execute("SELECT 1 FROM store_counters LIMIT 1").fetchone() is None:
+                self.conn.execute(
+                    "INSERT INTO store_counters VALUES ('users', (SELECT COUNT(*) FROM users)), "
+                    "('words', (SELECT COUNT(*) FROM highlighted_words))"
+                )
+                self.conn.execute(
+                    "INSERT INTO word_counts SELECT word_key, COUNT(*) FROM highlighted_words GROUP BY word_key"
+                )
+                self.conn.execute(
+                    "INSERT INTO language_pair_counts SELECT source_language, target_language, COUNT(*) "
+                    "FROM users GROUP BY source_language, target_language"
+                )
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _has_users(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None
+
+    def import_json(self, store_file: str) -> None:
+        """One-time migration of users from a JSON store file."""
+        users = read_json_users(store_file)
+        with self._lock:
+            self.conn.execute("BEGIN")
+            for user_id, data in users.items():
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO users (user_id, source_language, target_language, password, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (user_id, data.get("source_language", "auto"), data.get("target_language", "Spanish"),
+                     data.get("password"), data.get("version", 0))
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO highlighted_words (user_id, word, word_key) VALUES (?, ?, ?)",
+                    ((user_id, word, normalize_word(word)) for word in data.get("highlighted_words", []))
+                )
+            self.conn.execute("COMMIT")
+        logger.info("Imported %d users from %s", len(users), store_file)
+
+    def user_exists(self, user_id: str) -> bool:
+        with self._lock:
+            row = self.conn.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row is not None
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Optional[Dict]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT source_language, target_language, password, version FROM users WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        user = {
+            "source_language": row[0],
+            "target_language": row[1],
+            "version": row[3]
+        }
+        if include_words:
+            user["highlighted_words"] = self.get_words(user_id)
+        else:
+            user["word_count"] = self.count_words(user_id)
+        if row[2] is not None:
+            user["password"] = row[2]
+        return user
+
+    def create_user(self, user_id: str, data: Dict) -> None:
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, source_language, target_language, password, version) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (user_id, data["source_language"], data["target_language"], data.get("password"),
+                     data.get("version", 0))
+                )
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO highlighted_words (user_id, word, word_key) VALUES (?, ?, ?)",
+                    ((user_id, word, normalize_word(word)) for word in data.get("highlighted_words", []))
+                )
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def delete_user(self, user_id: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+
+    def get_version(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            row = self.conn.execute("SELECT version FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return None if row is None else row[0]
+
+    def bump_version(self, user_id: str) -> int:
+        # One statement, so workers bumping the same user each get a distinct version
+        with self._lock:
+            rows = self.conn.execute(
+                "UPDATE users SET version = version + 1 WHERE user_id = ? RETURNING version", (user_id,)
+            ).fetchall()
+        return rows[0][0]
+
+    def update_languages(self, user_id: str, source_language: Optional[str], target_language: Optional[str]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "UPDATE users SET source_language = COALESCE(?, source_language), "
+                "target_language = COALESCE(?, target_language) WHERE user_id = ?",
+                (source_language or None, target_language or None, user_id)
+            )
+
+    def add_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO highlighted_words (user_id, word, word_key) VALUES (?, ?, ?)",
+                (user_id, word, normalize_word(word))
+            )
+        return cursor.rowcount > 0
+
+    def remove_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            cursor = self.conn.execute(
+                "DELETE FROM highlighted_words WHERE user_id = ? AND word_key = ?",
+                (user_id, normalize_word(word))
+            )
+        return cursor.rowcount > 0
+
+    def has_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM highlighted_words WHERE user_id = ? AND word_key = ?",
+                (user_id, normalize_word(word))
+            ).fetchone()
+        return row is not None
+
+    def get_words(self, user_id: str) -> List[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT word FROM highlighted_words WHERE user_id = ? ORDER BY id",
+                (user_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, word FROM highlighted_words WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (user_id, after, limit + 1)
+            ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [row[1] for row in rows[:limit]], next_cursor
+
+    def count_words(self, user_id: str) -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM highlighted_words WHERE user_id = ?", (user_id,)
+            ).fetchone()[0]
+
+    def get_all_users(self) -> Dict:
+        with self._lock:
+            user_ids = [row[0] for row in self.conn.execute("SELECT user_id FROM users")]
+        return {user_id: self.get_user(user_id) for user_id in user_ids}
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.conn.execute("SELECT name, value FROM store_counters"))
+        return {"total_users": counters.get("users", 0), "total_highlighted_words": counters.get("words", 0)}
+
+    def get_analytics(self, top_n: int = 10) -> Dict:
+        with self._lock:
+            top_words = self.conn.execute(
+                "SELECT word_key, users FROM word_counts ORDER BY users DESC LIMIT ?", (top_n,)
+            ).fetchall()
+            pairs = self.conn.execute("SELECT source_language, target_language, users FROM language_pair_counts").fetchall()
+        return {
+            "top_words": [{"word": word, "users": users, "max_overcount": 0} for word, users in top_words],
+            "top_words_exact": True,
+            "language_pairs": language_pair_rows(((source, target), users) for source, target, users in pairs)
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self.conn.close()
+
+class RedisStorage(StorageBackend):
+    """
+    Users in Redis (or any server speaking its protocol), shared by every
+    server process and host. Requires the `redis` package.
+
+    Per user: a hash of settings, a hash of normalized word key -> first
+    spelling, and a sorted set ordering the keys by an insertion counter,
+    which doubles as the page cursor. Store-wide: a counters hash, a sorted
+    set of users per word key and a hash of users per language pair, all
+    updated by the same scripts that change a user.
+    """
+
+    blocking_io = True
+
+    # Insert a word only if its normalized key is new, in one atomic step
+    ADD_WORD_SCRIPT = """
+    if redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+        return 0
+    end
+    local id = redis.call('INCR', KEYS[2])
+    redis.call('ZADD', KEYS[3], id, ARGV[1])
+    redis.call('HINCRBY', KEYS[4], 'words', 1)
+    redis.call('ZINCRBY', KEYS[5], 1, ARGV[1])
+    return 1
+    """
+
+    REMOVE_WORD_SCRIPT = """
+    if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+        return 0
+    end
+    redis.call('ZREM', KEYS[2], ARGV[1])
+    redis.call('HINCRBY', KEYS[3], 'words', -1)
+    if tonumber(redis.call('ZINCRBY', KEYS[4], -1, ARGV[1])) <= 0 then
+        redis.call('ZREM', KEYS[4], ARGV[1])
+    end
+    return 1
+    """
+
+    DELETE_USER_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local languages = redis.call('HMGET', KEYS[1], 'source_language', 'target_language')
+    local words = redis.call('HKEYS', KEYS[2])
+    for _, key in ipairs(words) do
+        if tonumber(redis.call('ZINCRBY', KEYS[6], -1, key)) <= 0 then
+            redis.call('ZREM', KEYS[6], key)
+        end
+    end
+    redis.call('HINCRBY', KEYS[5], 'words', -#words)
+    redis.call('HINCRBY', KEYS[5], 'users', -1)
+    local pair = (languages[1] or 'auto') .. '\t' .. (languages[2] or 'Spanish')
+    if redis.call('HINCRBY', KEYS[7], pair, -1) <= 0 then
+        redis.call('HDEL', KEYS[7], pair)
+    end
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[4])
+    redis.call('SREM', KEYS[8], ARGV[1])
+    return 1
+    """
+
+    # Only bump an existing user, so a concurrent delete cannot leave a half-created one behind
+    BUMP_VERSION_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    return redis.call('HINCRBY', KEYS[1], 'version', 1)
+    """
+
+    SET_LANGUAGES_SCRIPT = """
+    local old = redis.call('HMGET', KEYS[1], 'source_language', 'target_language')
+    local old_source, old_target = old[1] or 'auto', old[2] or 'Spanish'
+    local source = ARGV[1] ~= '' and ARGV[1] or old_source
+    local target = ARGV[2] ~= '' and ARGV[2] or old_target
+    redis.call('HSET', KEYS[1], 'source_language', source, 'target_language', target)
+    local old_pair, new_pair = old_source .. '\t' .. old_target, source .. '\t' .. target
+    if old_pair ~= new_pair then
+        if redis.call('HINCRBY', KEYS[2], old_pair, -1) <= 0 then
+            redis.call('HDEL', KEYS[2], old_pair)
+        end
+        redis.call('HINCRBY', KEYS[2], new_pair, 1)
+    end
+    return 1
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "highlight:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("STORE_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.url = url
+        self.prefix = prefix
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._add_word = self.client.register_script(self.ADD_WORD_SCRIPT)
+        self._remove_word = self.client.register_script(self.REMOVE_WORD_SCRIPT)
+        self._delete_user = self.client.register_script(self.DELETE_USER_SCRIPT)
+        self._set_languages = self.client.register_script(self.SET_LANGUAGES_SCRIPT)
+        self._bump_version = self.client.register_script(self.BUMP_VERSION_SCRIPT)
+        self.stats_key = f"{prefix}stats"
+        self.word_counts_key = f"{prefix}word_counts"
+        self.language_pairs_key = f"{prefix}language_pairs"
+        logger.info("Redis store connected at %s", url)
+        # Data written before the counters existed is counted once, by whichever process gets here first
+        if self.client.set(f"{prefix}stats:initialized", 1, nx=True) and self.client.scard(f"{prefix}users"):
+            self._backfill_stats()
+
+    def _keys(self, user_id: str) -> Tuple[str, str, str, str]:
+        """(settings hash, word hash, insertion counter, order zset) for a user."""
+        base = f"{self.prefix}user:{user_id}"
+        return base, f"{base}:words", f"{base}:seq", f"{base}:order"
+
+    def _backfill_stats(self) -> None:
+        user_ids = list(self.client.smembers(f"{self.prefix}users"))
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(self.stats_key, self.word_counts_key, self.language_pairs_key)
+        total_words = 0
+        for user_id in user_ids:
+            settings_key, words_key, _, _ = self._keys(user_id)
+            source, target = self.client.hmget(settings_key, "source_language", "target_language")
+            pipe.hincrby(self.language_pairs_key, f"{source or 'auto'}\t{target or 'Spanish'}", 1)
+            words = self.client.hkeys(words_key)
+            total_words += len(words)
+            for key in words:
+                pipe.zincrby(self.word_counts_key, 1, key)
+        pipe.hset(self.stats_key, mapping={"users": len(user_ids), "words": total_words})
+        pipe.execute()
+        logger.info("Counted %d users and %d words for store stats", len(user_ids), total_words)
+
+    def user_exists(self, user_id: str) -> bool:
+        return bool(self.client.sismember(f"{self.prefix}users", user_id))
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Optional[Dict]:
+        settings = self.client.hgetall(self._keys(user_id)[0])
+        if not settings:
+            return None
+        user = {
+            "source_language": settings.get("source_language", "auto"),
+            "target_language": settings.get("target_language", "Spanish"),
+            "version": int(settings.get("version", 0))
+        }
+        if include_words:
+            user["highlighted_words"] = self.get_words(user_id)
+        else:
+            user["word_count"] = self.count_words(user_id)
+        if "password" in settings:
+            user["password"] = settings["password"]
+        return user
+
+    def create_user(self, user_id: str, data: Dict) -> None:
+        settings_key = self._keys(user_id)[0]
+        fields = {
+            "source_language": data["source_language"],
+            "target_language": data["target_language"],
+            "version": data.get("version", 0)
+        }
+        if data.get("password") is not None:
+            fields["password"] = data["password"]
+        # Replacing a user first takes the old one out of the counters
+        self.delete_user(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(settings_key, mapping=fields)
+        pipe.sadd(f"{self.prefix}users", user_id)
+        pipe.hincrby(self.stats_key, "users", 1)
+        pipe.hincrby(self.language_pairs_key, f"{fields['source_language']}\t{fields['target_language']}", 1)
+        pipe.execute()
+        for word in data.get("highlighted_words", []):
+            self.add_word(user_id, word)
+
+    def delete_user(self, user_id: str) -> None:
+        self._delete_user(
+            keys=[*self._keys(user_id), self.stats_key, self.word_counts_key, self.language_pairs_key,
+                  f"{self.prefix}users"],
+            args=[user_id]
+        )
+
+    def get_version(self, user_id: str) -> Optional[int]:
+        settings_key = self._keys(user_id)[0]
+        pipe = self.client.pipeline(transaction=False)
+        pipe.exists(settings_key)
+        pipe.hget(settings_key, "version")
+        exists, version = pipe.execute()
+        return int(version or 0) if exists else None
+
+    def bump_version(self, user_id: str) -> int:
+        return int(self._bump_version(keys=[self._keys(user_id)[0]]))
+
+    def update_languages(self, user_id: str, source_language: Optional[str], target_language: Optional[str]) -> None:
+        if source_language or target_language:
+            self._set_languages(
+                keys=[self._keys(user_id)[0], self.language_pairs_key],
+                args=[source_language or "", target_language or ""]
+            )
+
+    def add_word(self, user_id: str, word: str) -> bool:
+        _, words_key, seq_key, order_key = self._keys(user_id)
+        return bool(self._add_word(
+            keys=[words_key, seq_key, order_key, self.stats_key, self.word_counts_key],
+            args=[normalize_word(word), word]
+        ))
+
+    def remove_word(self, user_id: str, word: str) -> bool:
+        _, words_key, _, order_key = self._keys(user_id)
+        return bool(self._remove_word(
+            keys=[words_key, order_key, self.stats_key, self.word_counts_key],
+            args=[normalize_word(word)]
+        ))
+
+    def has_word(self, user_id: str, word: str) -> bool:
+        return bool(self.client.hexists(self._keys(user_id)[1], normalize_word(word)))
+
+    def _spellings(self, user_id: str, keys: List[str]) -> List[str]:
+        if not keys:
+            return []
+        return [word for word in self.client.hmget(self._keys(user_id)[1], keys) if word is not None]
+
+    def get_words(self, user_id: str) -> List[str]:
+        return self._spellings(user_id, self.client.zrange(self._keys(user_id)[3], 0, -1))
+
+    def get_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        rows = self.client.zrangebyscore(
+            self._keys(user_id)[3], f"({after}", "+inf", start=0, num=limit + 1, withscores=True
+        )
+        next_cursor = int(rows[limit - 1][1]) if len(rows) > limit else None
+        return self._spellings(user_id, [key for key, _ in rows[:limit]]), next_cursor
+
+    def count_words(self, user_id: str) -> int:
+        return self.client.hlen(self._keys(user_id)[1])
+
+    def get_all_users(self) -> Dict:
+        return {user_id: self.get_user(user_id) for user_id in self.client.smembers(f"{self.prefix}users")}
+
+    def get_stats(self) -> Dict:
+        users, words = self.client.hmget(self.stats_key, "users", "words")
+        return {"total_users": int(users or 0), "total_highlighted_words": int(words or 0)}
+
+    def get_analytics(self, top_n: int = 10) -> Dict:
+        top_words = self.client.zrevrange(self.word_counts_key, 0, top_n - 1, withscores=True)
+        pairs = self.client.hgetall(self.language_pairs_key)
+        return {
+            "top_words": [{"word": word, "users": int(users), "max_overcount": 0} for word, users in top_words],
+            "top_words_exact": True,
+            "language_pairs": language_pair_rows((tuple(pair.split("\t", 1)), int(users)) for pair, users in pairs.items())
+        }
+
+    def close(self) -> None:
+        self.client.close()
+
+class ShardedStorage(StorageBackend):
+    """
+    One JSON document per user under hash-sharded directories
+    (`root_dir/ab/<sha1 of user id>.json`), loaded on demand into an LRU of at
+    most `cache_size` hot users.
+
+    Mutations go to the write-ahead journal and the cached document. Changed
+    documents are written back when they are evicted and at each compaction,
+    which then trims the journal. Each document records the last journal
+    sequence applied to it, so replay after a crash skips what it already has.
+    Store statistics are kept in a `StoreStats` persisted in `_meta.json`;
+    they are only rebuilt by a scan after an unclean shutdown.
+    """
+
+    blocking_io = True
+
+    def __init__(self, root_dir: str = "store_users", cache_size: int = 10000, import_file: Optional[str] = None,
+                 flush_interval: float = 0.05, flush_batch_size: int = 256, compact_every: int = 5000,
+                 top_capacity: int = 1000):
+        self.root_dir = root_dir
+        self.top_capacity = top_capacity
+        self.cache_size = max(1, cache_size)
+        self.meta_file = os.path.join(root_dir, "_meta.json")
+        os.makedirs(root_dir, exist_ok=True)
+        self.journal = StoreJournal(
+            os.path.join(root_dir, "_journal"),
+            flush_interval=flush_interval,
+            batch_size=flush_batch_size,
+            compact_every=compact_every
+        )
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self._dirty: Set[str] = set()
+        # Files renamed into place since the last checkpoint, by directory, whose renames still need an fsync
+        self._unsynced: Dict[str, str] = {}
+        self.loads = 0
+        self.evictions = 0
+        self.write_backs = 0
+
+        meta = self._read_meta()
+        if meta is None and import_file and os.path.exists(import_file):
+            self.import_json(import_file)
+            meta = self._read_meta()
+        meta = meta or {"journal_seq": 0, "stats": StoreStats().to_dict(), "clean": True}
+        # Stores written before the statistics existed are counted once by a scan
+        clean = meta.get("clean") and "stats" in meta
+        self.stats = StoreStats.from_dict(meta["stats"], top_capacity) if "stats" in meta else StoreStats(top_capacity)
+        last_seq = meta["journal_seq"]
+        entries = self.journal.read_entries(after_seq=last_seq)
+        with self._lock:
+            for entry in entries:
+                self._apply(entry)
+                last_seq = entry["seq"]
+        if entries:
+            logger.info("Replayed %d journal entries from %s", len(entries), self.journal.journal_file)
+        self.journal.start(last_seq, self.checkpoint)
+        if entries or not clean:
+            self.checkpoint()
+            self._rebuild_counters()
+        # Marked clean again by close(); a crash in between forces a recount on the next start
+        self.checkpoint()
+        logger.info("Sharded store opened at %s (%d users)", root_dir, self.stats.total_users)
+
+    def _path(self, user_id: str) -> str:
+        digest = hashlib.sha1(user_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.root_dir, digest[:2], f"{digest}.json")
+
+    def _read_meta(self) -> Optional[Dict]:
+        try:
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, path: str, data: str) -> None:
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, path)
+
+    def _iter_stored(self):
+        """Yield every user document on disk (not including unwritten changes)."""
+        for shard in sorted(os.scandir(self.root_dir), key=lambda entry: entry.name):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".json"):
+                    with open(entry.path, 'r', encoding='utf-8') as f:
+                        yield json.load(f)
+
+    def import_json(self, store_file: str) -> None:
+        """One-time migration of users from a JSON store file."""
+        users = read_json_users(store_file)
+        stats = StoreStats(self.top_capacity)
+        for user_id, data in users.items():
+            words = HighlightSet(data.get("highlighted_words", [])).to_list()
+            stats.add_user(dict(data, highlighted_words=words))
+            path = self._path(user_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_file(path, json.dumps(
+                dict(data, user_id=user_id, seq=0, highlighted_words=words), ensure_ascii=False
+            ))
+        self._write_file(self.meta_file, json.dumps(
+            {"journal_seq": 0, "stats": stats.to_dict(), "clean": True}
+        ))
+        logger.info("Imported %d users from %s", len(users), store_file)
+
+    def _rebuild_counters(self) -> None:
+        stats = StoreStats(self.top_capacity)
+        for stored in self._iter_stored():
+            stats.add_user(stored)
+        with self._lock:
+            self.stats = stats
+        logger.info("Recounted %d users and %d words", stats.total_users, stats.total_words)
+
+    def _load(self, user_id: str) -> Optional[Dict]:
+        """Return the cached document (None if absent or deleted), reading it from disk on a miss."""
+        if user_id in self._cache:
+            self._cache.move_to_end(user_id)
+            return self._cache[user_id]
+        try:
+            with open(self._path(user_id), 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        stored.pop("user_id", None)
+        stored["highlighted_words"] = HighlightSet(stored["highlighted_words"])
+        self.loads += 1
+        self._cache[user_id] = stored
+        self._evict_overflow()
+        return stored
+
+    def _write_back(self, user_id: str) -> None:
+        path = self._path(user_id)
+        user = self._cache.get(user_id)
+        if user is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_file(path, json.dumps(
+                dict(user, user_id=user_id, highlighted_words=user["highlighted_words"].to_list()),
+                ensure_ascii=False
+            ))
+        self._unsynced[os.path.dirname(path)] = path
+        self._dirty.discard(user_id)
+        self.write_backs += 1
+
+    def _evict_overflow(self) -> None:
+        while len(self._cache) > self.cache_size:
+            user_id = next(iter(self._cache))
+            if user_id in self._dirty:
+                self._write_back(user_id)
+            del self._cache[user_id]
+            self.evictions += 1
+
+    def checkpoint(self, clean: bool = False) -> bool:
+        """Write back every changed user, persist the counters and trim the journal."""
+        started_at = time.perf_counter()
+        try:
+            with self._lock:
+                seq = self.journal.seq
+                for user_id in list(self._dirty):
+                    self._write_back(user_id)
+                # Tombstones are on disk now; deleted users no longer need a cache slot
+                for user_id in [user_id for user_id, user in self._cache.items() if user is None]:
+                    del self._cache[user_id]
+                unsynced, self._unsynced = list(self._unsynced.values()), {}
+                meta = {
+                    "journal_seq": seq,
+                    "stats": self.stats.to_dict(),
+                    "clean": clean
+                }
+            for path in unsynced:
+                _fsync_dir(path)
+            self._write_file(self.meta_file, json.dumps(meta))
+            _fsync_dir(self.meta_file)
+            self.journal.truncate(seq)
+            SNAPSHOT_SECONDS.observe(time.perf_counter() - started_at)
+            return True
+        except Exception as e:
+            logger.error("Error checkpointing sharded store: %s", e)
+            return False
+
+    def close(self) -> None:
+        """Flush the journal, write back every changed user and mark the store clean."""
+        self.journal.close()
+        self.checkpoint(clean=True)
+
+    def _record(self, op: Dict) -> None:
+        with self._lock:
+            self.journal.append(op)
+            self._apply(op)
+            self._evict_overflow()
+
+    def _apply(self, op: Dict) -> None:
+        user_id = op["user_id"]
+        user = self._load(user_id)
+        if user is not None and user["seq"] >= op["seq"]:
+            # Replaying an entry this document was written back with
+            return
+        kind = op["op"]
+        if kind == "create_user":
+            if user is not None:
+                self.stats.remove_user(user)
+            user = dict(op["data"], highlighted_words=HighlightSet(op["data"]["highlighted_words"]))
+            self.stats.add_user(user)
+            self._cache[user_id] = user
+        elif user is None:
+            # A change to a user deleted again later in the journal
+            return
+        elif kind == "delete_user":
+            self.stats.remove_user(user)
+            self._cache[user_id] = None
+            self._dirty.add(user_id)
+            return
+        elif kind == "set_languages":
+            old_pair = (user["source_language"], user["target_language"])
+            if op.get("source_language"):
+                user["source_language"] = op["source_language"]
+            if op.get("target_language"):
+                user["target_language"] = op["target_language"]
+            self.stats.change_languages(old_pair, (user["source_language"], user["target_language"]))
+        elif kind == "add_word":
+            if user["highlighted_words"].add(op["word"]):
+                self.stats.add_word(op["word"])
+        elif kind == "remove_word":
+            if user["highlighted_words"].discard(op["word"]):
+                self.stats.remove_word(op["word"])
+        elif kind == "bump_version":
+            user["version"] = user.get("version", 0) + 1
+        user["seq"] = op["seq"]
+        self._dirty.add(user_id)
+
+    def _words(self, user_id: str) -> HighlightSet:
+        return self._load(user_id)["highlighted_words"]
+
+    def user_exists(self, user_id: str) -> bool:
+        with self._lock:
+            if user_id in self._cache:
+                return self._cache[user_id] is not None
+            return os.path.exists(self._path(user_id))
+
+    def get_user(self, user_id: str, include_words: bool = True) -> Optional[Dict]:
+        with self._lock:
+            user = self._load(user_id)
+            if user is None:
+                return None
+            user = dict(user)
+            user.pop("seq", None)
+            user.setdefault("version", 0)
+            words = user.pop("highlighted_words")
+            if include_words:
+                user["highlighted_words"] = words.to_list()
+            else:
+                user["word_count"] = len(words)
+            return user
+
+    def get_version(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            user = self._load(user_id)
+            return None if user is None else user.get("version", 0)
+
+    def bump_version(self, user_id: str) -> int:
+        with self._lock:
+            self._record({"op": "bump_version", "user_id": user_id})
+            return self._load(user_id)["version"]
+
+    def create_user(self, user_id: str, data: Dict) -> None:
+        self._record({"op": "create_user", "user_id": user_id, "data": data})
+
+    def delete_user(self, user_id: str) -> None:
+        self._record({"op": "delete_user", "user_id": user_id})
+
+    def update_languages(self, user_id: str, source_language: Optional[str], target_language: Optional[str]) -> None:
+        self._record({
+            "op": "set_languages",
+            "user_id": user_id,
+            "source_language": source_language,
+            "target_language": target_language
+        })
+
+    def add_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            if word in self._words(user_id):
+                return False
+            self._record({"op": "add_word", "user_id": user_id, "word": word})
+            return True
+
+    def remove_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            if word not in self._words(user_id):
+                return False
+            self._record({"op": "remove_word", "user_id": user_id, "word": word})
+            return True
+
+    def has_word(self, user_id: str, word: str) -> bool:
+        with self._lock:
+            return word in self._words(user_id)
+
+    def get_words(self, user_id: str) -> List[str]:
+        with self._lock:
+            return self._words(user_id).to_list()
+
+    def get_words_page(self, user_id: str, after: int = 0, limit: int = 100) -> Tuple[List[str], Optional[int]]:
+        with self._lock:
+            return self._words(user_id).page(after, limit)
+
+    def count_words(self, user_id: str) -> int:
+        with self._lock:
+            return len(self._words(user_id))
+
+    def get_all_users(self) -> Dict:
+        # A full scan by nature: write back pending changes, then read every document
+        self.checkpoint()
+        users = {}
+        for stored in self._iter_stored():
+            user_id = stored.pop("user_id")
+            stored.pop("seq", None)
+            users[user_id] = stored
+        return users
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats.summary(),
+                "cached_users": len(self._cache),
+                "cache_size": self.cache_size,
+                "dirty_users": len(self._dirty),
+                "cache_loads": self.loads,
+                "cache_evictions": self.evictions,
+                "write_backs": self.write_backs
+            }
+
+    def get_analytics(self, top_n: int = 10) -> Dict:
+        with self._lock:
+            return self.stats.analytics(top_n)
+
+def _fsync_dir(path: str) -> None:
+    """Persist a rename by syncing the containing directory (no-op where unsupported)."""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _split_sql(script: str) -> List[str]:
+    """Split a schema script into statements (trigger bodies contain semicolons of their own)."""
+    statements, current = [], ""
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    return statements
+
+def create_storage(backend: str = "json", **options) -> StorageBackend:
+    """Build a storage backend by name ("json", "sharded", "sqlite" or "redis")."""
+    if backend == "json":
+        return JsonStorage(**options)
+    if backend == "sharded":
+        return ShardedStorage(**options)
+    if backend == "sqlite":
+        return SQLiteStorage(**options)
+    if backend == "redis":
+        return RedisStorage(**options)
+    raise ValueError(f"Unknown storage backend: {backend}")
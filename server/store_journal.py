@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = REGISTRY.histogram("store_journal_flush_seconds", "Time to append and fsync one journal batch")
+FLUSH_ENTRIES = REGISTRY.histogram(
+    "store_journal_flush_entries", "Journal entries written per batch", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+)
+
+class StoreJournal:
+    """
+    Append-only log of store mutations with batched group-commit.
+
+    Mutations are queued in memory and written by a background thread either
+    every `flush_interval` seconds or as soon as `batch_size` entries are
+    pending, so callers never wait on disk I/O. Each entry carries a
+    monotonically increasing sequence number; a snapshot records the last
+    sequence it contains, so replay after a crash only applies newer entries.
+    """
+
+    def __init__(self, journal_file: str, flush_interval: float = 0.05,
+                 batch_size: int = 256, compact_every: int = 5000):
+        self.journal_file = journal_file
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_every = compact_every
+        self.seq = 0
+        self.entries_since_snapshot = 0
+        self._pending: List[Dict] = []
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        self._on_compact: Optional[Callable[[], None]] = None
+
+    def read_entries(self, after_seq: int = 0) -> List[Dict]:
+        """Read journal entries newer than `after_seq`, stopping at a torn tail."""
+        entries = []
+        if not os.path.exists(self.journal_file):
+            return entries
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A partially written last line from a crash; nothing after it is valid.
+                # Lines are only fsynced with their newline, so one without it was never acknowledged.
+                if not line.endswith("\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if entry["seq"] > after_seq:
+                    entries.append(entry)
+        return entries
+
+    def repair(self) -> int:
+        """
+        Cut a torn tail left by a crash back to the end of the last complete
+        entry, so new entries are not appended onto the partial line (which
+        would hide them from every later replay). Returns the bytes dropped.
+        """
+        if not os.path.exists(self.journal_file):
+            return 0
+        with self._io_lock:
+            valid = 0
+            with open(self.journal_file, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        break
+                    valid += len(line)
+                size = f.seek(0, os.SEEK_END)
+            if size > valid:
+                with open(self.journal_file, 'r+b') as f:
+                    f.truncate(valid)
+                    f.flush()
+                    os.fsync(f.fileno())
+                logger.warning("Dropped a torn tail of %d bytes from %s", size - valid, self.journal_file)
+        return size - valid
+
+    def start(self, start_seq: int, on_compact: Callable[[], None]) -> None:
+        """Start the group-commit thread; `on_compact` writes a fresh snapshot."""
+        self.repair()
+        self.seq = start_seq
+        self._on_compact = on_compact
+        self._thread = threading.Thread(target=self._run, name="store-journal", daemon=True)
+        self._thread.start()
+
+    def append(self, op: Dict) -> int:
+        """Queue a mutation for the next group commit and return its sequence number."""
+        with self._cond:
+            self.seq += 1
+            op["seq"] = self.seq
+            self._pending.append(op)
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+            return self.seq
+
+    def flush(self) -> None:
+        """Synchronously write every pending entry to disk."""
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._write(batch)
+
+    def truncate(self, upto_seq: int) -> None:
+        """Drop entries already covered by a snapshot containing `upto_seq`."""
+        with self._io_lock:
+            remaining = self.read_entries(after_seq=upto_seq)
+            tmp_file = f"{self.journal_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                for entry in remaining:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.journal_file)
+            self.entries_since_snapshot = len(remaining)
+
+    def close(self) -> None:
+        """Stop the background thread after a final flush."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _write(self, batch: List[Dict]) -> None:
+        # Caller holds _io_lock so batches reach the file in sequence order
+        started_at = time.perf_counter()
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in batch)
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries_since_snapshot += len(batch)
+        FLUSH_SECONDS.observe(time.perf_counter() - started_at)
+        FLUSH_ENTRIES.observe(len(batch))
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval
+                )
+                closed = self._closed
+            try:
+                self.flush()
+                if self.entries_since_snapshot >= self.compact_every and self._on_compact:
+                    self._on_compact()
+            except Exception as e:
+                logger.error("Error flushing store journal: %s", e)
+            if closed:
+                return
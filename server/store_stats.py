@@ -0,0 +1,173 @@
+import heapq
+from typing import Dict, Iterable, List, Tuple
+from highlight_set import normalize_word
+
+LanguagePair = Tuple[str, str]
+
+class HeavyHitters:
+    """
+    Space-Saving top-k sketch: tracks at most `capacity` keys, so memory does
+    not grow with the number of distinct words.
+
+    A new key arriving when the sketch is full replaces the key with the
+    smallest count and inherits that count as its possible overcount
+    (`error`). Any key whose true count exceeds total/capacity is guaranteed
+    to be tracked. Decrements only apply to keys still being tracked.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = max(1, capacity)
+        self._counts: Dict[str, List[int]] = {}
+        # False once a key has been evicted, after which counts may be overestimates
+        self.exact = True
+        # Lazy min-heap of (count, key); entries whose count is stale are skipped on pop
+        self._heap: List[Tuple[int, str]] = []
+
+    def _push(self, key: str, count: int) -> None:
+        heapq.heappush(self._heap, (count, key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(entry[0], key) for key, entry in self._counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[str, int]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self._counts.get(key)
+            if entry is not None and entry[0] == count:
+                return key, count
+
+    def add(self, key: str, amount: int = 1) -> None:
+        entry = self._counts.get(key)
+        if entry is None:
+            error = 0
+            if len(self._counts) >= self.capacity:
+                evicted, error = self._pop_min()
+                del self._counts[evicted]
+                self.exact = False
+            entry = self._counts[key] = [error, error]
+        entry[0] += amount
+        self._push(key, entry[0])
+
+    def remove(self, key: str, amount: int = 1) -> None:
+        entry = self._counts.get(key)
+        if entry is None:
+            return
+        entry[0] -= amount
+        if entry[0] <= 0:
+            del self._counts[key]
+        else:
+            entry[1] = min(entry[1], entry[0])
+            self._push(key, entry[0])
+
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        """The `n` largest (key, count, error) entries, most frequent first."""
+        return [
+            (key, entry[0], entry[1])
+            for key, entry in heapq.nlargest(n, self._counts.items(), key=lambda item: item[1][0])
+        ]
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def to_list(self) -> List[List]:
+        return [[key, count, error] for key, (count, error) in self._counts.items()]
+
+    @classmethod
+    def from_list(cls, capacity: int, entries: List[List], exact: bool = True) -> "HeavyHitters":
+        sketch = cls(capacity)
+        # Keep the largest entries if the capacity was lowered since they were saved
+        kept = heapq.nlargest(sketch.capacity, entries, key=lambda entry: entry[1])
+        sketch.exact = exact and len(kept) == len(entries)
+        for key, count, error in kept:
+            sketch._counts[key] = [count, error]
+        sketch._heap = [(entry[0], key) for key, entry in sketch._counts.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+class StoreStats:
+    """
+    Store-wide counters kept up to date on every change instead of being
+    recomputed by a scan: users, highlighted words, users per language pair
+    and the most highlighted words (counted once per user, by normalized key).
+    Used by the in-memory backends; SQLite and Redis keep the same figures in
+    their own tables and keys.
+    """
+
+    def __init__(self, top_capacity: int = 1000):
+        self.total_users = 0
+        self.total_words = 0
+        self.language_pairs: Dict[LanguagePair, int] = {}
+        self.words = HeavyHitters(top_capacity)
+
+    def add_user(self, user: Dict) -> None:
+        self.total_users += 1
+        self._count_pair(_pair(user), 1)
+        for word in user.get("highlighted_words", ()):
+            self.add_word(word)
+
+    def remove_user(self, user: Dict) -> None:
+        self.total_users -= 1
+        self._count_pair(_pair(user), -1)
+        for word in user.get("highlighted_words", ()):
+            self.remove_word(word)
+
+    def change_languages(self, old: LanguagePair, new: LanguagePair) -> None:
+        if old != new:
+            self._count_pair(old, -1)
+            self._count_pair(new, 1)
+
+    def add_word(self, word: str) -> None:
+        self.total_words += 1
+        self.words.add(normalize_word(word))
+
+    def remove_word(self, word: str) -> None:
+        self.total_words -= 1
+        self.words.remove(normalize_word(word))
+
+    def _count_pair(self, pair: LanguagePair, delta: int) -> None:
+        users = self.language_pairs.get(pair, 0) + delta
+        if users > 0:
+            self.language_pairs[pair] = users
+        else:
+            self.language_pairs.pop(pair, None)
+
+    def summary(self) -> Dict:
+        return {"total_users": self.total_users, "total_highlighted_words": self.total_words}
+
+    def analytics(self, top_n: int = 10) -> Dict:
+        return {
+            "top_words": [
+                {"word": word, "users": count, "max_overcount": error}
+                for word, count, error in self.words.top(top_n)
+            ],
+            "top_words_exact": self.words.exact,
+            "language_pairs": language_pair_rows(self.language_pairs.items())
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "total_users": self.total_users,
+            "total_words": self.total_words,
+            "language_pairs": [[source, target, users] for (source, target), users in self.language_pairs.items()],
+            "words": self.words.to_list(),
+            "words_exact": self.words.exact
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, top_capacity: int = 1000) -> "StoreStats":
+        stats = cls(top_capacity)
+        stats.total_users = data["total_users"]
+        stats.total_words = data["total_words"]
+        stats.language_pairs = {(source, target): users for source, target, users in data["language_pairs"]}
+        stats.words = HeavyHitters.from_list(top_capacity, data["words"], data.get("words_exact", True))
+        return stats
+
+def _pair(user: Dict) -> LanguagePair:
+    return user.get("source_language", "auto"), user.get("target_language", "Spanish")
+
+def language_pair_rows(pairs: Iterable[Tuple[LanguagePair, int]]) -> List[Dict]:
+    """Language pair counts as response rows, most common first."""
+    return [
+        {"source_language": source, "target_language": target, "users": users}
+        for (source, target), users in sorted(pairs, key=lambda item: -item[1])
+    ]
@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram("stt_queue_wait_seconds", "Time a transcription waited before inference")
+INFERENCE_SECONDS = REGISTRY.histogram("stt_inference_seconds", "Whisper inference time per utterance")
+JOBS = REGISTRY.counter("stt_jobs_total", "Transcription jobs by outcome", ["outcome"])
+BATCH_SIZE = REGISTRY.histogram("stt_batch_size", "Utterances decoded per batched Whisper call", buckets=(1, 2, 4, 8, 16, 32))
+
+# Whisper's encoder works on fixed 30-second windows at 16 kHz
+BATCH_MAX_SAMPLES = 30 * 16000
+
+# Same no-speech filter whisper.transcribe() applies to each window
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+
+BACKENDS = ("whisper", "whisper-int8")
+
+# Per-worker model cache: each pool thread/process loads its own copy, since
+# Whisper installs decoding hooks on the model and is not safe to share.
+_local = threading.local()
+
+# Model loaded in the parent before a fork-started process pool; children
+# inherit its weights copy-on-write instead of each loading their own.
+_shared_model = None
+
+def _rss_mb() -> float:
+    """Resident set size of this process in MB (Linux /proc, else peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def _quantize_int8(model):
+    """Dynamic int8 quantization of every Linear layer for faster, smaller CPU inference."""
+    import torch
+    import whisper
+
+    for module in model.modules():
+        # whisper.model.Linear only adds fp16 casting, which the CPU path never uses
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _build_model(model_name: str, backend: str):
+    import whisper
+
+    if backend == "whisper-int8":
+        return _quantize_int8(whisper.load_model(model_name, device="cpu"))
+    return whisper.load_model(model_name)
+
+def _get_model(model_name: str, backend: str = "whisper"):
+    if _shared_model is not None:
+        return _shared_model
+    model = getattr(_local, "model", None)
+    if model is None:
+        logger.info("Loading Whisper model %r (%s) in worker", model_name, backend)
+        model = _build_model(model_name, backend)
+        _local.model = model
+    return model
+
+def _load_model(model_name: str, backend: str = "whisper", warm_up: bool = True) -> Dict:
+    """Load (if needed) and optionally run one inference on silence; returns timings and memory growth."""
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    model = _get_model(model_name, backend)
+    loaded = time.perf_counter()
+    if warm_up:
+        model.transcribe(np.zeros(16000, dtype=np.float32), fp16=False, temperature=0.0)
+    return {
+        "load_seconds": loaded - started,
+        "warmup_seconds": time.perf_counter() - loaded if warm_up else 0.0,
+        "rss_delta_mb": _rss_mb() - rss_before
+    }
+
+def _transcribe(model_name: str, backend: str, audio: Union[str, np.ndarray], options: Dict) -> Dict:
+    """Runs inside a pool worker."""
+    started = time.perf_counter()
+    result = _get_model(model_name, backend).transcribe(audio, **options)
+    return {"text": result["text"].strip(), "inference_seconds": time.perf_counter() - started}
+
+def _transcribe_batch(model_name: str, backend: str, audios: List[np.ndarray], options: Dict) -> List[Dict]:
+    """
+    Runs inside a pool worker: pad each utterance to 30 seconds, stack the log-mel
+    spectrograms and run them through the encoder and decoder as one batch.
+    """
+    import dataclasses
+    import torch
+    import whisper
+
+    started = time.perf_counter()
+    model = _get_model(model_name, backend)
+    mel = torch.stack([
+        whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), model.dims.n_mels) for audio in audios
+    ]).to(model.device)
+    # transcribe() options such as condition_on_previous_text do not apply to a single decode pass
+    fields = {field.name for field in dataclasses.fields(whisper.DecodingOptions)}
+    decoding_options = whisper.DecodingOptions(
+        without_timestamps=True,
+        **{key: value for key, value in options.items() if key in fields}
+    )
+    results = whisper.decode(model, mel, decoding_options)
+    elapsed = time.perf_counter() - started
+
+    outputs = []
+    for result in results:
+        silent = result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD
+        outputs.append({
+            "text": "" if silent else result.text.strip(),
+            "inference_seconds": elapsed,
+            "batch_size": len(audios)
+        })
+    return outputs
+
+class QueueFullError(Exception):
+    """The inference queue is at capacity; the caller should shed or retry the job."""
+
+class InferenceExecutor:
+    """
+    Runs speech-to-text jobs in a thread or process pool so transcription never
+    blocks the event loop.
+
+    At most `max_queue` jobs may be queued or running at once; further
+    submissions raise QueueFullError so the WebSocket can signal backpressure.
+    Each job is bounded by `job_timeout` seconds (a timed-out job keeps its
+    worker busy until it finishes, but the caller is released).
+
+    With `max_batch_size` > 1, utterances of up to 30 seconds from every
+    connection are held for up to `batch_window` seconds and decoded together
+    in one batched encoder/decoder pass; each caller still gets its own result.
+    Longer audio is transcribed on its own.
+
+    The model is loaded lazily by `load()` (on the first audio connection or
+    job) unless it is called at startup. `backend` is "whisper" or
+    "whisper-int8" (dynamically quantized Linear layers, CPU only). In process
+    mode with `share_model`, the model is loaded once in the server process and
+    the pool is forked afterwards so workers share its weights copy-on-write.
+    """
+
+    def __init__(self, model_name: str = "base", mode: str = "thread", workers: int = 1,
+                 max_queue: int = 8, job_timeout: float = 60.0, max_batch_size: int = 1,
+                 batch_window: float = 0.05, backend: str = "whisper", share_model: bool = True):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown speech-to-text backend: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        self.share_model = share_model and mode == "process" and "fork" in multiprocessing.get_all_start_methods()
+        self.mode = mode
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.pool: Optional[Executor] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self.load_report: Optional[Dict] = None
+        self._pending: Dict[Tuple, List[Tuple[np.ndarray, asyncio.Future]]] = {}
+        self._flush_tasks: Dict[Tuple, asyncio.Task] = {}
+        self.depth = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_seconds_total = 0.0
+        self.inference_seconds_total = 0.0
+        self.inference_seconds_max = 0.0
+        self.batches = 0
+        self.batched_jobs = 0
+        self.batch_size_max = 0
+
+    def start(self) -> None:
+        """Create the worker pool; cheap, the model is not loaded here."""
+        if self.share_model:
+            # Forked once the parent has loaded the model (see load())
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("fork"))
+        elif self.mode == "process":
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stt")
+        logger.info("Speech-to-text executor started (%s pool, %d workers, queue %d, model %r via %s, loaded on first use)",
+                    self.mode, self.workers, self.max_queue, self.model_name, self.backend)
+
+    def load(self) -> "asyncio.Task":
+        """Start loading and warming up the model once; later calls return the same task."""
+        failed = self._load_task is not None and self._load_task.done() and (
+            self._load_task.cancelled() or self._load_task.exception() is not None
+        )
+        if self._load_task is None or failed:
+            self._load_task = asyncio.create_task(self._load())
+        return self._load_task
+
+    async def _load(self) -> None:
+        global _shared_model
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        rss_before = _rss_mb()
+        if self.share_model:
+            # Runs in the event loop thread's process before any worker is forked
+            _shared_model = await asyncio.to_thread(_build_model, self.model_name, self.backend)
+        # Best effort: one load-and-warm-up job per worker
+        reports = await asyncio.gather(*(
+            loop.run_in_executor(self.pool, _load_model, self.model_name, self.backend) for _ in range(self.workers)
+        ))
+        self.load_report = {
+            "model": self.model_name,
+            "backend": self.backend,
+            "shared": self.share_model,
+            "startup_seconds": round(time.perf_counter() - started, 2),
+            "worker_load_seconds": round(max(report["load_seconds"] for report in reports), 2),
+            "warmup_inference_seconds": round(max(report["warmup_seconds"] for report in reports), 2),
+            "server_rss_delta_mb": round(_rss_mb() - rss_before, 1),
+            "worker_rss_delta_mb": [round(report["rss_delta_mb"], 1) for report in reports]
+        }
+        logger.info("Whisper model ready", extra=self.load_report)
+
+    def shutdown(self) -> None:
+        if self._load_task is not None and not self._load_task.done():
+            self._load_task.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    async def transcribe(self, audio: Union[str, np.ndarray], **options) -> Dict:
+        """
+        Transcribe an audio file path or 16 kHz float32 array off the event loop;
+        returns {"text", "inference_seconds"}. `options` go to whisper's transcribe().
+        """
+        if self.pool is None:
+            raise RuntimeError("Speech-to-text executor not started")
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            JOBS.inc(outcome="rejected")
+            raise QueueFullError(f"Transcription queue full ({self.depth} jobs)")
+
+        self.depth += 1
+        self.submitted += 1
+        queued_at = time.perf_counter()
+        try:
+            # Jobs arriving while the model loads wait for it (and count against the queue)
+            await asyncio.shield(self.load())
+            if self.max_batch_size > 1 and isinstance(audio, np.ndarray) and len(audio) <= BATCH_MAX_SAMPLES:
+                future = self._submit(audio, options)
+            else:
+                future = asyncio.get_running_loop().run_in_executor(
+                    self.pool, _transcribe, self.model_name, self.backend, audio, options
+                )
+            result = await asyncio.wait_for(future, timeout=self.job_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            JOBS.inc(outcome="timed_out")
+            raise
+        except Exception:
+            self.failed += 1
+            JOBS.inc(outcome="failed")
+            raise
+        finally:
+            self.depth -= 1
+
+        self.completed += 1
+        inference = result["inference_seconds"]
+        self.inference_seconds_total += inference
+        self.inference_seconds_max = max(self.inference_seconds_max, inference)
+        wait = max(0.0, time.perf_counter() - queued_at - inference)
+        self.wait_seconds_total += wait
+        JOBS.inc(outcome="completed")
+        INFERENCE_SECONDS.observe(inference)
+        QUEUE_WAIT_SECONDS.observe(wait)
+        return result
+
+    def _submit(self, audio: np.ndarray, options: Dict) -> asyncio.Future:
+        """Queue an utterance for the next batch with the same decoding options."""
+        key = tuple(sorted(options.items()))
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((audio, future))
+        if len(pending) >= self.max_batch_size:
+            task = self._flush_tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+            self._flush(key)
+        elif key not in self._flush_tasks:
+            self._flush_tasks[key] = asyncio.create_task(self._flush_later(key))
+        return future
+
+    async def _flush_later(self, key: Tuple) -> None:
+        await asyncio.sleep(self.batch_window)
+        self._flush_tasks.pop(key, None)
+        self._flush(key)
+
+    def _flush(self, key: Tuple) -> None:
+        # Callers that already timed out are not worth decoding
+        pending = [(audio, future) for audio, future in self._pending.pop(key, []) if not future.done()]
+        if pending:
+            asyncio.create_task(self._run_batch(dict(key), pending))
+
+    async def _run_batch(self, options: Dict, pending: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.batched_jobs += len(pending)
+        self.batch_size_max = max(self.batch_size_max, len(pending))
+        BATCH_SIZE.observe(len(pending))
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.pool, _transcribe_batch, self.model_name, self.backend, [audio for audio, _ in pending], options
+            )
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "backend": self.backend,
+            "model_loaded": self.load_report is not None,
+            "load_report": self.load_report,
+            "mode": self.mode,
+            "workers": self.workers,
+            "queue_depth": self.depth,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "avg_queue_wait_ms": round(self.wait_seconds_total / self.completed * 1000, 1) if self.completed else 0.0,
+            "avg_inference_ms": round(self.inference_seconds_total / self.completed * 1000, 1) if self.completed else 0.0,
+            "max_inference_ms": round(self.inference_seconds_max * 1000, 1),
+            "max_batch_size": self.max_batch_size,
+            "batch_window_ms": self.batch_window * 1000,
+            "batches": self.batches,
+            "avg_batch_size": round(self.batched_jobs / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.batch_size_max
+        }
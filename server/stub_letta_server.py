@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Letta agent messages API.
+
+Point the server at it with LETTA_BASE_URL=http://localhost:8002/v1 and any
+LETTA_API_KEY / LETTA_AGENT_ID. Each message is applied to a per-user
+vocab_log, and messages repeating an Idempotency-Key are acknowledged without
+being applied again. Failure modes can be injected to exercise the outbox
+retries:
+
+    STUB_LATENCY_MS   delay before every response (default 0)
+    STUB_FAIL_RATE    fraction of requests answered with STUB_FAIL_STATUS (default 0)
+    STUB_FAIL_STATUS  status code for injected failures (default 503)
+    STUB_RETRY_AFTER  Retry-After header sent with injected failures (default unset)
+"""
+import asyncio
+import json
+import os
+import random
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Stub Letta API")
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0"))
+FAIL_STATUS = int(os.getenv("STUB_FAIL_STATUS", "503"))
+RETRY_AFTER = os.getenv("STUB_RETRY_AFTER")
+
+request_count = 0
+duplicates = 0
+seen_keys = set()
+# user_id -> {normalized word: word} in vocab_log, in the order they were first added
+vocab_logs = {}
+
+def apply_update(content: str) -> None:
+    """Apply a message written by LettaOutbox (changes as JSON on its last line) to the user's vocab_log."""
+    try:
+        changes = json.loads(content.rsplit("\n", 1)[-1])
+    except json.JSONDecodeError:
+        return
+    vocab_log = vocab_logs.setdefault(changes["user_id"], {})
+    # Same matching as the server's store: case and whitespace are ignored
+    for word in changes.get("highlighted", []):
+        vocab_log.setdefault(" ".join(word.split()).casefold(), word)
+    for word in changes.get("removed", []):
+        vocab_log.pop(" ".join(word.split()).casefold(), None)
+
+@app.post("/v1/agents/{agent_id}/messages")
+async def send_messages(agent_id: str, request: Request):
+    global request_count, duplicates
+    request_count += 1
+    body = await request.json()
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        headers = {"Retry-After": RETRY_AFTER} if RETRY_AFTER else None
+        return JSONResponse({"detail": "injected failure"}, status_code=FAIL_STATUS, headers=headers)
+
+    key = request.headers.get("Idempotency-Key")
+    if key is not None and key in seen_keys:
+        duplicates += 1
+    else:
+        if key is not None:
+            seen_keys.add(key)
+        for message in body["messages"]:
+            apply_update(message["content"])
+    return {
+        "messages": [
+            {"message_type": "assistant_message", "content": "vocab_log updated"}
+        ],
+        "usage": {"step_count": 1}
+    }
+
+@app.get("/stats")
+async def stats():
+    return {
+        "requests": request_count,
+        "duplicates": duplicates,
+        "vocab_logs": {user_id: list(vocab_log.values()) for user_id, vocab_log in vocab_logs.items()}
+    }
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8002")))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Groq (OpenAI-compatible) chat-completions API.
+
+Point the server at it with GROQ_BASE_URL=http://localhost:8001 and any
+GROQ_API_KEY. Failure modes can be injected to exercise retries and the
+circuit breaker:
+
+    STUB_LATENCY_MS   delay before every response (default 0)
+    STUB_FAIL_RATE    fraction of requests answered with STUB_FAIL_STATUS (default 0)
+    STUB_FAIL_STATUS  status code for injected failures (default 503)
+    STUB_RETRY_AFTER  Retry-After header sent with injected failures (default unset)
+    STUB_TOKEN_MS     delay between streamed chunks when "stream": true (default 20)
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Stub LLM API")
+
+LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+FAIL_RATE = float(os.getenv("STUB_FAIL_RATE", "0"))
+FAIL_STATUS = int(os.getenv("STUB_FAIL_STATUS", "503"))
+RETRY_AFTER = os.getenv("STUB_RETRY_AFTER")
+TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", "20"))
+
+request_count = 0
+
+def fake_translation(text: str) -> str:
+    """Deterministic, recognizable output: the input reversed word by word."""
+    return " ".join(reversed(text.split()))
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    global request_count
+    request_count += 1
+    body = await request.json()
+    if LATENCY_MS:
+        await asyncio.sleep(LATENCY_MS / 1000)
+    if FAIL_RATE and random.random() < FAIL_RATE:
+        headers = {"Retry-After": RETRY_AFTER} if RETRY_AFTER else None
+        return JSONResponse({"error": {"message": "injected failure"}}, status_code=FAIL_STATUS, headers=headers)
+
+    user_text = next((m["content"] for m in reversed(body["messages"]) if m["role"] == "user"), "")
+    if body.get("response_format", {}).get("type") == "json_object":
+        # Packed batch prompt: {"items": [{"id", "text"}]} -> {"translations": [{"id", "text"}]}
+        items = json.loads(user_text)["items"]
+        content = json.dumps({"translations": [{"id": item["id"], "text": fake_translation(item["text"])} for item in items]})
+    else:
+        content = fake_translation(user_text)
+
+    if body.get("stream"):
+        async def chunks():
+            for i, word in enumerate(content.split(" ")):
+                delta = word if i == 0 else " " + word
+                chunk = {
+                    "id": f"stub-{request_count}",
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(TOKEN_MS / 1000)
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+    return {
+        "id": f"stub-{request_count}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {
+            "prompt_tokens": sum(len(m["content"].split()) for m in body["messages"]),
+            "completion_tokens": len(content.split()),
+            "total_tokens": sum(len(m["content"].split()) for m in body["messages"]) + len(content.split())
+        }
+    }
+
+@app.get("/stats")
+async def stats():
+    return {"requests": request_count}
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8001")))
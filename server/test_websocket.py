@@ -3,6 +3,7 @@
 Test script for WebSocket audio endpoint
 """
 import asyncio
+import json
 import websockets
 import wave
 import numpy as np
@@ -39,12 +40,21 @@ async def test_websocket():
                 await websocket.send(wav_buffer.getvalue())
                 print("Sent test audio data")
             
-            # Wait for response
+            # Ask the server to finalize the utterance instead of waiting for silence
+            await websocket.send("flush")
+            
+            # Print partial results until the final transcript (or an error) arrives
             try:
-                response = await asyncio.wait_for(websocket.recv(), timeout=10.0)
-                print(f"Received response: {response}")
+                while True:
+                    response = json.loads(await asyncio.wait_for(websocket.recv(), timeout=10.0))
+                    if response["type"] == "ping":
+                        await websocket.send(json.dumps({"type": "pong"}))
+                        continue
+                    print(f"Received {response['type']}: {response.get('text', response.get('message'))}")
+                    if response["type"] != "partial":
+                        break
             except asyncio.TimeoutError:
-                print("No response received within 10 seconds")
+                print("No final transcript received within 10 seconds")
                 
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,46 @@
+import asyncio
+import io
+import wave
+import numpy as np
+import pytest
+from audio_decode import AudioDecodeError, AudioDecoder, decode_wav, resample
+
+def wav_bytes(samples: np.ndarray, rate: int, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+def test_decodes_16bit_wav():
+    audio = decode_wav(wav_bytes(np.array([0, 16384, -32768], dtype=np.int16), 16000))
+    assert audio.dtype == np.float32
+    assert audio.tolist() == [0.0, 0.5, -1.0]
+
+def test_stereo_is_mixed_down_and_resampled():
+    stereo = np.array([[16384, 0]] * 8000, dtype=np.int16).ravel()
+    audio = decode_wav(wav_bytes(stereo, 8000, channels=2))
+    assert len(audio) == 16000
+    assert np.allclose(audio, 0.25)
+
+def test_truncated_data_chunk_is_clamped():
+    data = wav_bytes(np.arange(100, dtype=np.int16), 16000)
+    assert len(decode_wav(data[:-10])) == 95
+
+def test_rejects_non_wav():
+    with pytest.raises(AudioDecodeError):
+        decode_wav(b"not audio at all")
+
+def test_resample_keeps_duration():
+    assert len(resample(np.zeros(44100, dtype=np.float32), 44100)) == 16000
+
+def test_configured_raw_pcm():
+    decoder = AudioDecoder()
+    decoder.configure("pcm_f32le", sample_rate=16000, channels=1)
+    # A trailing partial sample is dropped
+    data = np.array([0.25, -0.5], dtype="<f4").tobytes() + b"\x00"
+    assert asyncio.run(decoder.decode(data)).tolist() == [0.25, -0.5]
+    with pytest.raises(AudioDecodeError):
+        decoder.configure("mp3")
@@ -0,0 +1,41 @@
+import numpy as np
+from audio_stream import UtteranceSegmenter
+
+RATE = 16000
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * RATE), dtype=np.float32)
+
+def feed_in_chunks(segmenter: UtteranceSegmenter, audio: np.ndarray, chunk: int = 1000):
+    events = []
+    for start in range(0, len(audio), chunk):
+        events.extend(segmenter.feed(audio[start:start + chunk]))
+    return events
+
+def test_speech_between_silences_is_one_utterance():
+    segmenter = UtteranceSegmenter(partial_interval=10)
+    events = feed_in_chunks(segmenter, np.concatenate((silence(1), tone(1), silence(1))))
+    assert [kind for kind, _ in events] == ["final"]
+    # The tone, the pre-roll before it and the silence that closed it
+    assert RATE <= len(events[0][1]) <= RATE + int(0.3 * RATE) + int(0.8 * RATE)
+
+def test_short_blips_are_ignored():
+    segmenter = UtteranceSegmenter()
+    assert feed_in_chunks(segmenter, np.concatenate((tone(0.1), silence(1)))) == []
+
+def test_partials_are_emitted_while_speaking():
+    segmenter = UtteranceSegmenter(partial_interval=0.5)
+    events = feed_in_chunks(segmenter, tone(2))
+    assert [kind for kind, _ in events].count("partial") >= 2
+    kind, audio = segmenter.flush()
+    assert kind == "final" and len(audio) >= 2 * RATE - segmenter.frame_len
+
+def test_long_speech_is_split_at_the_buffer_size():
+    segmenter = UtteranceSegmenter(partial_interval=100, max_utterance_seconds=1)
+    events = feed_in_chunks(segmenter, tone(2.5))
+    finals = [audio for kind, audio in events if kind == "final"]
+    assert len(finals) == 2 and all(len(audio) <= RATE for audio in finals)
@@ -0,0 +1,79 @@
+import asyncio
+from connection_manager import ConnectionManager
+from coordination import LocalCoordinator
+
+class FakeWebSocket:
+    def __init__(self, stalled: bool = False):
+        self.sent = []
+        self.closed_with = None
+        self.stalled = stalled
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.stalled:
+            await asyncio.sleep(3600)
+        self.sent.append(message)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+def test_messages_reach_the_users_sockets_only():
+    async def scenario():
+        manager = ConnectionManager(LocalCoordinator(), heartbeat_interval=0)
+        alice, bob = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(alice, "alice")
+        await manager.connect(bob)
+        manager.bind_user(bob, "bob")
+        await manager.send_to_user("alice", "for alice")
+        await manager.broadcast("for everyone")
+        await asyncio.sleep(0.01)
+        await manager.close()
+        return alice.sent, bob.sent
+
+    assert asyncio.run(scenario()) == (["for alice", "for everyone"], ["for everyone"])
+
+def test_full_queue_evicts_the_slow_consumer():
+    async def scenario():
+        manager = ConnectionManager(LocalCoordinator(), queue_size=2, heartbeat_interval=0)
+        slow, fast = FakeWebSocket(stalled=True), FakeWebSocket()
+        await manager.connect(slow, "slow")
+        await manager.connect(fast, "fast")
+        for i in range(4):
+            await manager.broadcast(str(i))
+            await asyncio.sleep(0.005)
+        return manager, slow, fast
+
+    manager, slow, fast = asyncio.run(scenario())
+    assert fast.sent == ["0", "1", "2", "3"]
+    assert slow.closed_with == 1013 and slow not in manager.connections
+    assert manager.evicted_slow == 1 and "slow" not in manager.by_user
+
+def test_stalled_send_times_out():
+    async def scenario():
+        manager = ConnectionManager(LocalCoordinator(), send_timeout=0.02, heartbeat_interval=0)
+        socket = FakeWebSocket(stalled=True)
+        await manager.connect(socket)
+        manager.send_text(socket, "hello")
+        await asyncio.sleep(0.1)
+        return manager, socket
+
+    manager, socket = asyncio.run(scenario())
+    assert socket.closed_with == 1013 and not manager.connections
+
+def test_heartbeat_pings_quiet_sockets_and_closes_idle_ones():
+    async def scenario():
+        manager = ConnectionManager(LocalCoordinator(), heartbeat_interval=0.02, idle_timeout=0.1)
+        socket = FakeWebSocket()
+        await manager.connect(socket)
+        manager.start()
+        await asyncio.sleep(0.05)
+        pinged = list(socket.sent)
+        await asyncio.sleep(0.15)
+        await manager.close()
+        return manager, socket, pinged
+
+    manager, socket, pinged = asyncio.run(scenario())
+    assert '{"type": "ping"}' in pinged
+    assert socket.closed_with == 1001 and manager.evicted_idle == 1
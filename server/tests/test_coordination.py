@@ -0,0 +1,85 @@
+import asyncio
+from coordination import LocalCoordinator, create_coordinator
+from storage import create_storage
+from translation_cache import TranslationCache
+
+async def wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_local_delivers_despite_a_failing_handler():
+    coordinator = LocalCoordinator()
+    received = []
+
+    async def broken(message):
+        raise RuntimeError("boom")
+
+    async def record(message):
+        received.append(message)
+
+    coordinator.subscribe("events", broken)
+    coordinator.subscribe("events", record)
+    asyncio.run(coordinator.publish("events", {"n": 1}))
+    assert received == [{"n": 1}]
+
+def test_sqlite_fans_out_to_every_process(tmp_path):
+    db_file = str(tmp_path / "coordination.db")
+
+    async def scenario():
+        first = create_coordinator("sqlite", db_file=db_file, poll_interval=0.01)
+        await first.publish("events", {"n": 0})
+        second = create_coordinator("sqlite", db_file=db_file, poll_interval=0.01)
+        received = {"first": [], "second": []}
+        for name, coordinator in (("first", first), ("second", second)):
+            async def record(message, name=name):
+                received[name].append(message["n"])
+            coordinator.subscribe("events", record)
+            await coordinator.start()
+        await first.publish("events", {"n": 1})
+        await second.publish("other", {"n": 2})
+        await second.publish("events", {"n": 3})
+        await wait_for(lambda: len(received["first"]) == 2 and len(received["second"]) == 2)
+        await first.close()
+        await second.close()
+        return received
+
+    # Messages published before a process starts are not replayed to it
+    assert asyncio.run(scenario()) == {"first": [1, 3], "second": [1, 3]}
+
+def test_sqlite_kv_is_shared_and_expires(tmp_path):
+    db_file = str(tmp_path / "coordination.db")
+    first = create_coordinator("sqlite", db_file=db_file)
+    second = create_coordinator("sqlite", db_file=db_file)
+    first.kv_set("greeting", "hola", ttl=60)
+    first.kv_set("stale", "adiós", ttl=-1)
+    assert second.kv_get("greeting") == "hola"
+    assert second.kv_get("stale") is None
+
+def test_translation_cache_reads_the_shared_tier(tmp_path):
+    db_file = str(tmp_path / "coordination.db")
+    key = ("gato", "Spanish", "English")
+
+    async def compute():
+        return "cat"
+
+    async def scenario():
+        writer = TranslationCache(shared=create_coordinator("sqlite", db_file=db_file))
+        reader = TranslationCache(shared=create_coordinator("sqlite", db_file=db_file))
+        await writer.get_or_compute(key, compute)
+        return await reader.get_or_compute(key, compute), reader.shared_hits
+
+    assert asyncio.run(scenario()) == (("cat", True), 1)
+
+def test_sqlite_store_is_shared_between_processes(tmp_path):
+    db_file = str(tmp_path / "store.db")
+    first = create_storage("sqlite", db_file=db_file)
+    second = create_storage("sqlite", db_file=db_file)
+    first.create_user("alice", {"source_language": "en", "target_language": "es", "highlighted_words": []})
+    first.add_word("alice", "hola")
+    assert second.get_words("alice") == ["hola"]
+    assert not second.add_word("alice", "HOLA")
+    assert second.get_stats()["total_highlighted_words"] == 1
+    first.close()
+    second.close()
@@ -0,0 +1,41 @@
+import random
+from highlight_set import HighlightSet, normalize_word
+
+def test_normalize_word():
+    assert normalize_word("  Buenos \n DÍAS ") == "buenos días"
+    assert normalize_word("Straße") == "strasse"
+
+def test_keeps_first_spelling_in_insertion_order():
+    words = HighlightSet(["Hola", "gato", "hola ", "perro"])
+    assert words.to_list() == ["Hola", "gato", "perro"]
+    assert "HOLA" in words and len(words) == 3
+
+def test_discard_and_compaction_match_a_list():
+    rng = random.Random(3)
+    words, model = HighlightSet(), []
+    for _ in range(2000):
+        word = f"w{rng.randrange(60)}"
+        if rng.random() < 0.5:
+            assert words.add(word) == (word not in model)
+            if word not in model:
+                model.append(word)
+        else:
+            assert words.discard(word) == (word in model)
+            if word in model:
+                model.remove(word)
+        assert words.to_list() == model
+    # Tombstones never outnumber live words
+    assert words._tombstones * 2 <= len(words._values)
+
+def test_pages_skip_removed_words_and_stay_stable():
+    words = HighlightSet(f"w{i}" for i in range(10))
+    first, cursor = words.page(limit=4)
+    assert first == ["w0", "w1", "w2", "w3"]
+    # Removing already-listed and upcoming words does not shift the cursor
+    words.discard("w1")
+    words.discard("w4")
+    words.add("w10")
+    second, cursor = words.page(cursor, limit=4)
+    assert second == ["w5", "w6", "w7", "w8"]
+    third, cursor = words.page(cursor, limit=4)
+    assert third == ["w9", "w10"] and cursor is None
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import httpx
+from letta_outbox import LettaOutbox
+from state_manager import AsyncStateManager, StateManager
+from storage import JsonStorage
+import stub_letta_server
+
+def make_outbox(tmp_path, **options) -> LettaOutbox:
+    return LettaOutbox("http://letta.test/v1", "key", "agent-1", db_file=str(tmp_path / "outbox.db"),
+                       backoff_base=0, **options)
+
+async def deliver_due(outbox: LettaOutbox, handler) -> int:
+    """Persist, claim and deliver every due batch once; returns the number of batches."""
+    outbox._client = httpx.AsyncClient(base_url=outbox.base_url, transport=httpx.MockTransport(handler))
+    await asyncio.to_thread(outbox._persist)
+    batches = await asyncio.to_thread(outbox._claim, 10)
+    for batch in batches:
+        await outbox._deliver(batch)
+    await outbox._client.aclose()
+    return len(batches)
+
+def changes(request: httpx.Request) -> dict:
+    content = json.loads(request.content)["messages"][0]["content"]
+    return json.loads(content.rsplit("\n", 1)[-1])
+
+def test_message_keeps_words_with_separators(tmp_path):
+    outbox = make_outbox(tmp_path)
+    words = ["salt; pepper", "line one\nline two", 'say "hi"']
+    for word in words:
+        outbox.enqueue("alice", "add", word)
+    outbox.enqueue("alice", "remove", "salt; pepper")
+    sent = []
+
+    def handler(request):
+        sent.append(request)
+        stub_letta_server.apply_update(json.loads(request.content)["messages"][0]["content"])
+        return httpx.Response(200, json={})
+
+    assert asyncio.run(deliver_due(outbox, handler)) == 1
+    assert changes(sent[0]) == {"user_id": "alice", "highlighted": words[1:], "removed": ["salt; pepper"]}
+    assert list(stub_letta_server.vocab_logs["alice"].values()) == words[1:]
+    assert outbox.delivered == 4
+
+def test_retry_reuses_idempotency_key(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("alice", "add", "hola")
+    keys = []
+
+    def handler(request):
+        keys.append(request.headers["Idempotency-Key"])
+        return httpx.Response(503 if len(keys) == 1 else 200, json={})
+
+    asyncio.run(deliver_due(outbox, handler))
+    assert outbox.retries == 1 and outbox.delivered == 0
+    # Due again immediately with no backoff
+    asyncio.run(deliver_due(outbox, handler))
+    assert outbox.delivered == 1
+    assert len(keys) == 2 and keys[0] == keys[1]
+
+def test_client_error_marks_batch_dead(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("alice", "add", "hola")
+    asyncio.run(deliver_due(outbox, lambda request: httpx.Response(400, json={})))
+    assert outbox.dead == 1
+    assert asyncio.run(deliver_due(outbox, lambda request: httpx.Response(200, json={}))) == 0
+
+def test_one_batch_per_user_in_order(tmp_path):
+    outbox = make_outbox(tmp_path, batch_size=2)
+    for word in ["uno", "dos", "tres"]:
+        outbox.enqueue("alice", "add", word)
+    outbox._persist()
+    first = outbox._claim(10)
+    assert [[row[2] for row in batch.rows] for batch in first] == [["uno", "dos"]]
+    # The rest waits until the outstanding batch is delivered
+    assert outbox._claim(10) == []
+    outbox._finish(first[0])
+    assert [row[2] for row in outbox._claim(10)[0].rows] == ["tres"]
+
+def test_buffered_events_survive_restart(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("alice", "add", "hola")
+    asyncio.run(outbox.close())
+    reopened = make_outbox(tmp_path)
+    batches = reopened._claim(10)
+    assert [(batch.user_id, batch.rows[0][2]) for batch in batches] == [("alice", "hola")]
+
+def test_record_removal_reports_whether_word_was_there(tmp_path):
+    storage = JsonStorage(str(tmp_path / "store.json"))
+    state = AsyncStateManager(StateManager(storage))
+
+    async def scenario():
+        await state.record_highlight("alice", "hola")
+        return await state.record_removal("alice", "HOLA"), await state.record_removal("alice", "nunca")
+
+    assert asyncio.run(scenario()) == (True, False)
+    storage.close()
+
+def test_close_releases_deliveries_still_waiting_on_letta(tmp_path):
+    async def hang(request):
+        await asyncio.sleep(3600)
+
+    async def scenario():
+        outbox = make_outbox(tmp_path, flush_interval=0.01)
+        await outbox.start()
+        await outbox._client.aclose()
+        outbox._client = httpx.AsyncClient(base_url=outbox.base_url, transport=httpx.MockTransport(hang))
+        outbox.enqueue("alice", "add", "hola")
+        while not outbox._in_flight:
+            await asyncio.sleep(0.01)
+        await outbox.close(timeout=0.01)
+        assert not outbox._in_flight and not outbox._writes
+
+        reopened = make_outbox(tmp_path)
+        batches = await asyncio.to_thread(reopened._claim, 10)
+        reopened._db.close()
+        return batches
+
+    batches = asyncio.run(scenario())
+    assert [(batch.user_id, batch.rows[0][2], batch.attempts) for batch in batches] == [("alice", "hola", 0)]
@@ -0,0 +1,92 @@
+from lexicon import Lexicon
+
+def test_auto_source_does_not_borrow_from_other_pairs(tmp_path):
+    lexicon = Lexicon(str(tmp_path), min_count=1)
+    lexicon.learn("casa", "house", "English", "Spanish")
+    assert lexicon.lookup("casa", "English", "Spanish") == "house"
+    assert lexicon.lookup("casa", "auto", "Spanish") is None
+    lexicon.learn("casa", "casa", "auto", "Spanish")
+    assert lexicon.lookup("casa", "auto", "Spanish") == "casa"
+
+def test_learned_entry_needs_agreeing_replies(tmp_path):
+    lexicon = Lexicon(str(tmp_path))
+    lexicon.learn("gato", "cat", "Spanish", "English")
+    assert lexicon.lookup("gato", "Spanish", "English") is None
+    lexicon.learn("gato", "dog", "Spanish", "English")
+    assert lexicon.lookup("gato", "Spanish", "English") is None
+    lexicon.learn("gato", "dog", "Spanish", "English")
+    assert lexicon.lookup("Gato ", "Spanish", "English") == "dog"
+
+def test_dictionary_entries_win_and_survive_reopen(tmp_path):
+    dictionary = tmp_path / "es-en.tsv"
+    dictionary.write_text("# comment\nperro\tdog\nbuenos días\tgood morning\n", encoding="utf-8")
+    directory = str(tmp_path / "lexicon")
+    lexicon = Lexicon(directory)
+    assert lexicon.import_dictionary(str(dictionary), "Spanish", "English") == 2
+    lexicon.learn("perro", "hound", "Spanish", "English")
+    lexicon.learn("perro", "hound", "Spanish", "English")
+    lexicon.learn("pan", "bread", "Spanish", "English")
+    lexicon.learn("pan", "bread", "Spanish", "English")
+    lexicon.close()
+
+    reopened = Lexicon(directory)
+    assert reopened.lookup("perro", "Spanish", "English") == "dog"
+    assert reopened.lookup("pan", "Spanish", "English") == "bread"
+    assert [row["text"] for row in reopened.search("p", "Spanish", "English")] == ["pan", "perro"]
+    reopened.close()
+
+def test_long_texts_are_skipped(tmp_path):
+    lexicon = Lexicon(str(tmp_path), max_words=2, min_count=1)
+    lexicon.learn("una frase larga", "a long sentence", "Spanish", "English")
+    assert lexicon.lookup("una frase larga", "Spanish", "English") is None
+    assert lexicon.get_stats()["lexicon_skipped"] == 1
+
+def test_cached_repeats_confirm_an_entry_for_the_translator(tmp_path):
+    import asyncio
+    from test_translation import FakeLLM, make_translator
+
+    llm = FakeLLM()
+    translator = make_translator(llm, microbatch_window=0, lexicon=Lexicon(str(tmp_path)))
+
+    async def repeats():
+        return [await translator.translate("casa", "Spanish", "English") for _ in range(3)]
+
+    assert asyncio.run(repeats()) == [("CASA", "upstream"), ("CASA", "cache"), ("CASA", "lexicon")]
+    assert len(llm.calls) == 1
+
+def test_seeded_entries_are_confirmed_by_their_next_cache_hit(tmp_path):
+    import asyncio
+    from test_translation import FakeLLM, make_translator
+    from translation import make_cache_key
+
+    lexicon = Lexicon(str(tmp_path))
+    lexicon.seed([("casa", "Spanish", "English", "HOUSE")])
+    assert lexicon.lookup("casa", "Spanish", "English") is None
+    translator = make_translator(FakeLLM(), microbatch_window=0, lexicon=lexicon)
+    translator.cache.put(make_cache_key("casa", "Spanish", "English"), "HOUSE")
+
+    async def repeats():
+        return [await translator.translate("casa", "Spanish", "English") for _ in range(2)]
+
+    assert asyncio.run(repeats()) == [("HOUSE", "cache"), ("HOUSE", "lexicon")]
+
+def test_concurrent_merges_keep_each_others_entries(tmp_path):
+    import threading
+    # Separate instances stand in for server processes: each has its own in-process merge lock
+    lexicons = [Lexicon(str(tmp_path), min_count=1) for _ in range(2)]
+
+    def learn_and_merge(lexicon, name):
+        for i in range(30):
+            lexicon.learn(f"{name}{i}", f"{name.upper()}{i}", "Spanish", "English")
+            lexicon.merge()
+
+    threads = [threading.Thread(target=learn_and_merge, args=(lexicon, name)) for lexicon, name in zip(lexicons, "ab")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for lexicon in lexicons:
+        lexicon.close()
+    reopened = Lexicon(str(tmp_path), min_count=1)
+    assert all(reopened.lookup(f"{name}{i}", "Spanish", "English") == f"{name.upper()}{i}" for name in "ab" for i in range(30))
+    reopened.close()
@@ -0,0 +1,145 @@
+import asyncio
+import httpx
+import pytest
+from llm_client import CircuitBreaker, LLMClient, LLMError, parse_retry_after
+
+def make_client(handler, **options) -> LLMClient:
+    client = LLMClient("http://llm.test/v1", "key", backoff_base=0, **options)
+    client.client = httpx.AsyncClient(base_url=client.base_url, transport=httpx.MockTransport(handler))
+    return client
+
+def completion(text: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    # Pretend the reset timeout has passed
+    breaker.opened_at -= breaker.reset_timeout
+
+def test_breaker_opens_then_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    breaker.opened_at -= 30
+    assert breaker.state == "half_open"
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    breaker.opened_at -= 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+def test_retries_transient_errors():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503) if len(calls) < 3 else completion("hola")
+
+    client = make_client(handler)
+    body = asyncio.run(client.chat_completion([{"role": "user", "content": "hi"}]))
+    assert body["choices"][0]["message"]["content"] == "hola"
+    assert len(calls) == 3 and client.breaker.failures == 0
+
+def test_client_errors_are_not_retried_or_counted():
+    client = make_client(lambda request: httpx.Response(400, text="bad"))
+    with pytest.raises(LLMError) as raised:
+        asyncio.run(client.chat_completion([]))
+    assert raised.value.status_code == 400
+    assert client.breaker.failures == 0
+
+def test_cancelled_trial_counts_as_failure():
+    async def hang(request):
+        await asyncio.sleep(3600)
+
+    client = make_client(hang, breaker_threshold=1)
+    open_breaker(client.breaker)
+
+    async def cancel_trial():
+        task = asyncio.create_task(client.chat_completion([]))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert client.breaker.state == "open"
+    client.breaker.opened_at -= client.breaker.reset_timeout
+    assert client.breaker.allow()
+
+def test_malformed_trial_response_counts_as_failure():
+    client = make_client(lambda request: httpx.Response(200, text="not json"), breaker_threshold=1)
+    open_breaker(client.breaker)
+    with pytest.raises(LLMError):
+        asyncio.run(client.chat_completion([]))
+    assert client.breaker.state == "open"
+
+def test_cancelled_stream_trial_counts_as_failure():
+    async def hang(request):
+        await asyncio.sleep(3600)
+
+    client = make_client(hang, breaker_threshold=1)
+    open_breaker(client.breaker)
+
+    async def consume():
+        async for _ in client.stream_chat_completion([]):
+            pass
+
+    async def cancel_trial():
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert client.breaker.state == "open"
+
+def test_stream_yields_deltas():
+    sse = (
+        'data: {"choices": [{"delta": {"content": "ho"}}]}\n\n'
+        'data: {"choices": [{"delta": {"content": "la"}}]}\n\n'
+        "data: [DONE]\n\n"
+    )
+    client = make_client(lambda request: httpx.Response(200, text=sse))
+
+    async def collect():
+        return [delta async for delta in client.stream_chat_completion([])]
+
+    assert asyncio.run(collect()) == ["ho", "la"]
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+def test_malformed_success_body_is_an_upstream_failure():
+    client = make_client(lambda request: httpx.Response(200, text="<html>oops</html>"))
+    with pytest.raises(LLMError) as raised:
+        asyncio.run(client.chat_completion([]))
+    assert raised.value.status_code == 502
+    assert client.breaker.failures == 1
+
+def test_slow_stream_is_cut_off_at_the_total_timeout():
+    async def drip():
+        for word in ["uno", "dos", "tres", "cuatro", "cinco"]:
+            yield f'data: {{"choices": [{{"delta": {{"content": "{word} "}}}}]}}\n\n'.encode()
+            await asyncio.sleep(0.05)
+        yield b"data: [DONE]\n\n"
+
+    client = make_client(lambda request: httpx.Response(200, content=drip()), total_timeout=0.12)
+
+    async def consume(deltas):
+        async for delta in client.stream_chat_completion([]):
+            deltas.append(delta)
+
+    deltas = []
+    with pytest.raises(LLMError) as raised:
+        asyncio.run(consume(deltas))
+    assert raised.value.status_code == 504
+    assert 0 < len(deltas) < 5 and client.breaker.failures == 1
@@ -0,0 +1,43 @@
+import threading
+from metrics import Registry
+
+def test_counter_and_gauge_render_per_label_set():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    requests.inc(route="/a")
+    requests.inc(2, route="/a")
+    requests.inc(route='/b"\n')
+    registry.gauge("depth", "Queue depth").set_function(lambda: 1.5)
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'requests_total{route="/b\\"\\n"} 1' in text
+    assert "depth 1.5" in text
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value)
+    lines = registry.render().splitlines()
+    assert 'latency_seconds_bucket{le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_sum 2.65" in lines
+    assert "latency_seconds_count 4" in lines
+
+def test_registering_a_name_twice_returns_the_same_family():
+    registry = Registry()
+    first = registry.counter("hits_total", "Hits")
+    assert registry.counter("hits_total", "Hits") is first
+    assert registry.render().count("# TYPE hits_total") == 1
+
+def test_concurrent_increments_are_not_lost():
+    registry = Registry()
+    hits = registry.counter("hits_total", "Hits")
+    threads = [threading.Thread(target=lambda: [hits.inc() for _ in range(10000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "hits_total 40000" in registry.render()
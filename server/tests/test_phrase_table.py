@@ -0,0 +1,69 @@
+import json
+import os
+import random
+from highlight_set import HighlightSet
+from phrase_table import PhraseTable
+from storage import JsonStorage, read_json_users
+
+def test_references_match_a_model():
+    phrases = PhraseTable()
+    rng = random.Random(7)
+    pool = ["hola", "Hola", "gracias", "buenos días", "line\nbreak"]
+    sets = [HighlightSet(phrases=phrases) for _ in range(5)]
+    model = [set() for _ in sets]
+    for _ in range(500):
+        index, word = rng.randrange(len(sets)), rng.choice(pool)
+        if rng.random() < 0.6:
+            sets[index].add(word)
+            model[index].add(word.lower() if word == "Hola" else word)
+        else:
+            sets[index].discard(word)
+            model[index].discard(word.lower() if word == "Hola" else word)
+        references = sum(len(words) for words in model)
+        assert phrases.get_stats()["phrase_references"] == references
+        assert len(phrases) == len({text for words in sets for text in words.to_list()})
+    for words in sets:
+        words.clear()
+    assert phrases.get_stats() == {"unique_phrases": 0, "phrase_references": 0}
+
+def test_colliding_ids_are_rehashed(monkeypatch):
+    original = PhraseTable.phrase_id.__func__
+
+    def colliding(cls, text, attempt=0):
+        return "0" * 12 if attempt == 0 else original(cls, text, attempt)
+
+    monkeypatch.setattr(PhraseTable, "phrase_id", classmethod(colliding))
+    phrases = PhraseTable()
+    first, second = phrases.acquire("uno"), phrases.acquire("dos")
+    assert first != second
+    assert (phrases.text(first), phrases.text(second)) == ("uno", "dos")
+    phrases.release(first)
+    assert phrases.lookup(first) is None and phrases.text(second) == "dos"
+
+def test_inline_store_is_converted_and_kept(tmp_path):
+    store_file = str(tmp_path / "store.json")
+    users = {
+        "alice": {"password": None, "source_language": "en", "target_language": "es", "highlighted_words": ["hola", "gato"]},
+        "bob": {"password": None, "source_language": "en", "target_language": "es", "highlighted_words": ["hola"]}
+    }
+    with open(store_file, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f)
+
+    storage = JsonStorage(store_file)
+    assert os.path.exists(f"{store_file}.v1")
+    assert storage.get_words("alice") == ["hola", "gato"]
+    assert storage.get_stats()["unique_phrases"] == 2
+    assert storage.get_stats()["phrase_references"] == 3
+    storage.remove_word("bob", "hola")
+    storage.close()
+
+    with open(store_file, encoding="utf-8") as f:
+        saved = json.load(f)
+    assert sorted(saved["phrases"].values()) == ["gato", "hola"]
+    assert read_json_users(store_file)["alice"]["highlighted_words"] == ["hola", "gato"]
+    assert read_json_users(f"{store_file}.v1")["bob"]["highlighted_words"] == ["hola"]
+
+    reopened = JsonStorage(store_file)
+    assert reopened.get_words("bob") == []
+    assert reopened.get_stats()["phrase_references"] == 2
+    reopened.close()
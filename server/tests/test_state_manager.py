@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from state_manager import AsyncStateManager, StateManager
+from storage import create_storage
+
+@pytest.fixture(params=["json", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "json":
+        storage = create_storage("json", store_file=str(tmp_path / "store.json"))
+    else:
+        storage = create_storage("sqlite", db_file=str(tmp_path / "store.db"))
+    manager = StateManager(storage)
+    yield manager
+    manager.close()
+
+def test_concurrent_highlights_of_one_word_add_it_once(state):
+    facade = AsyncStateManager(state, stripes=4)
+
+    async def burst():
+        return await asyncio.gather(*(facade.record_highlight("alice", "Hola") for _ in range(20)))
+
+    results = asyncio.run(burst())
+    assert [added for added, _ in results].count(True) == 1
+    assert {count for _, count in results} == {1}
+
+def test_users_are_created_on_first_use(state):
+    facade = AsyncStateManager(state)
+
+    async def scenario():
+        user = await facade.get_user("bob")
+        registered = await facade.register_user("carol", "secret")
+        again = await facade.register_user("carol", "other")
+        return user, registered, again
+
+    user, registered, again = asyncio.run(scenario())
+    assert user["highlighted_words"] == [] and user["target_language"] == "Spanish"
+    assert registered is not None and again is None
+
+def test_concurrent_registrations_of_one_user_succeed_once(state):
+    facade = AsyncStateManager(state)
+
+    async def burst():
+        return await asyncio.gather(*(facade.register_user("dave", f"pw{i}") for i in range(10)))
+
+    assert sum(user is not None for user in asyncio.run(burst())) == 1
+
+def test_every_change_bumps_the_version(state):
+    state.create_user("alice")
+    versions = [state.get_user_version("alice")]
+    state.add_highlighted_word("alice", "hola")
+    versions.append(state.get_user_version("alice"))
+    state.add_highlighted_word("alice", "HOLA")
+    versions.append(state.get_user_version("alice"))
+    state.update_user_languages("alice", target_language="fr")
+    versions.append(state.get_user_version("alice"))
+    assert versions[0] < versions[1] == versions[2] < versions[3]
+    assert state.get_user_version("nobody") is None
+
+def test_word_changes_are_a_delta_within_the_log(state):
+    state.create_user("alice")
+    state.add_highlighted_word("alice", "hola")
+    since = state.get_user_version("alice")
+    state.add_highlighted_word("alice", "gato")
+    state.add_highlighted_word("alice", "perro")
+    state.remove_highlighted_word("alice", "hola")
+    state.remove_highlighted_word("alice", "perro")
+    state.update_user_languages("alice", target_language="fr")
+    changes = state.get_word_changes("alice", since)
+    assert changes == {
+        "version": state.get_user_version("alice"),
+        "full": False,
+        "added": ["gato"],
+        "removed": ["hola", "perro"]
+    }
+    assert state.get_word_changes("alice", changes["version"])["added"] == []
+
+def test_word_changes_fall_back_to_the_full_list(state):
+    state.change_log_size = 2
+    state.create_user("alice")
+    since = state.get_user_version("alice")
+    for word in ("uno", "dos", "tres"):
+        state.add_highlighted_word("alice", word)
+    # Older than the log reaches
+    assert state.get_word_changes("alice", since) == {
+        "version": state.get_user_version("alice"),
+        "full": True,
+        "highlighted_words": ["uno", "dos", "tres"]
+    }
+    # Nothing logged after a restart
+    restarted = StateManager(state.storage)
+    assert restarted.get_word_changes("alice", state.get_user_version("alice") - 1)["full"]
+    # A version from a user that has since been re-created
+    stale = state.get_user_version("alice") + 10 ** 9
+    state.create_user("alice")
+    assert state.get_word_changes("alice", stale) == {
+        "version": state.get_user_version("alice"),
+        "full": True,
+        "highlighted_words": []
+    }
+
+def test_search_index_follows_changes_from_here_and_elsewhere(state):
+    state.add_highlighted_word("alice", "gato")
+    version, results = state.search_words("alice", "gat")
+    assert [row["word"] for row in results] == ["gato"]
+    state.add_highlighted_word("alice", "gatito")
+    state.remove_highlighted_word("alice", "gato")
+    version, results = state.search_words("alice", "gat")
+    assert version == state.get_user_version("alice")
+    assert [row["word"] for row in results] == ["gatito"]
+    # Changed behind the manager's back, as by another process: the index is rebuilt
+    state.storage.add_word("alice", "gata")
+    state.storage.bump_version("alice")
+    assert [row["word"] for row in state.search_words("alice", "gat")[1]] == ["gata", "gatito"]
@@ -0,0 +1,145 @@
+import os
+import uuid
+import pytest
+from storage import ShardedStorage, create_storage
+
+BACKENDS = ["json", "sqlite", "sharded", "redis"]
+
+def user_data(words=(), source="en", target="es"):
+    return {"password": None, "source_language": source, "target_language": target, "highlighted_words": list(words)}
+
+def open_backend(backend: str, directory):
+    """A fresh store of the given backend in `directory`; redis needs REDIS_URL and the redis package."""
+    if backend == "json":
+        return create_storage("json", store_file=str(directory / "store.json"))
+    if backend == "sqlite":
+        return create_storage("sqlite", db_file=str(directory / "store.db"))
+    if backend == "sharded":
+        return create_storage("sharded", root_dir=str(directory / "store_users"), cache_size=2)
+    pytest.importorskip("redis")
+    if not os.getenv("REDIS_URL"):
+        pytest.skip("REDIS_URL not set")
+    # A prefix of its own per test directory, so reopening sees the same data
+    prefix = f"test-{uuid.uuid5(uuid.NAMESPACE_URL, str(directory)).hex}:"
+    return create_storage("redis", url=os.environ["REDIS_URL"], prefix=prefix)
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, tmp_path):
+    return request.param
+
+@pytest.fixture
+def store(backend, tmp_path):
+    storage = open_backend(backend, tmp_path)
+    yield storage
+    storage.close()
+
+def test_users_and_languages(store):
+    assert not store.user_exists("alice") and store.get_user("alice") is None
+    store.create_user("alice", user_data(["hola"]))
+    store.update_languages("alice", None, "fr")
+    user = store.get_user("alice")
+    assert (user["source_language"], user["target_language"]) == ("en", "fr")
+    assert user["highlighted_words"] == ["hola"]
+    assert store.get_user("alice", include_words=False)["word_count"] == 1
+    assert set(store.get_all_users()) == {"alice"}
+    store.delete_user("alice")
+    assert not store.user_exists("alice")
+
+def test_recreating_a_user_replaces_their_words(store):
+    store.create_user("alice", user_data(["hola"]))
+    store.create_user("alice", user_data(["gato"]))
+    assert store.get_words("alice") == ["gato"]
+
+def test_words_are_deduplicated_ignoring_case_and_whitespace(store):
+    store.create_user("alice", user_data())
+    assert store.add_word("alice", "Buenos  días")
+    assert not store.add_word("alice", "buenos días ")
+    assert store.add_word("alice", "gato")
+    assert store.has_word("alice", "BUENOS DÍAS")
+    assert store.get_words("alice") == ["Buenos  días", "gato"]
+    assert store.remove_word("alice", "GATO")
+    assert not store.remove_word("alice", "gato")
+    assert store.count_words("alice") == 1
+
+def test_data_survives_reopen(backend, tmp_path):
+    storage = open_backend(backend, tmp_path)
+    storage.create_user("alice", user_data(["hola", "gato"]))
+    storage.remove_word("alice", "hola")
+    storage.close()
+    reopened = open_backend(backend, tmp_path)
+    assert reopened.get_words("alice") == ["gato"]
+    reopened.close()
+
+def test_sqlite_imports_a_json_store(tmp_path):
+    source = open_backend("json", tmp_path)
+    source.create_user("alice", user_data(["hola", "gato"]))
+    source.close()
+    storage = create_storage("sqlite", db_file=str(tmp_path / "store.db"), import_file=str(tmp_path / "store.json"))
+    assert storage.get_words("alice") == ["hola", "gato"]
+    storage.close()
+
+def test_word_pages_cover_every_word_once(store):
+    store.create_user("alice", user_data())
+    for i in range(7):
+        store.add_word("alice", f"w{i}")
+    store.remove_word("alice", "w2")
+    pages, cursor = [], 0
+    while cursor is not None:
+        words, cursor = store.get_words_page("alice", after=cursor, limit=3)
+        pages.append(words)
+    assert pages == [["w0", "w1", "w3"], ["w4", "w5", "w6"]]
+
+def test_sharded_writes_back_users_evicted_from_the_cache(tmp_path):
+    storage = open_backend("sharded", tmp_path)
+    for name in ("alice", "bob", "carol", "dave"):
+        storage.create_user(name, user_data([f"{name}-word"]))
+    assert len(storage._cache) == 2 and storage.evictions == 2
+    assert storage.get_words("alice") == ["alice-word"]
+    assert storage.loads >= 1
+    storage.close()
+
+def test_sharded_crash_recovery_replays_the_journal(tmp_path):
+    root_dir = str(tmp_path / "store_users")
+    storage = ShardedStorage(root_dir, cache_size=2, flush_interval=60, compact_every=10 ** 6)
+    storage.create_user("alice", user_data(["hola"]))
+    storage.checkpoint()
+    storage.add_word("alice", "adiós")
+    storage.create_user("bob", user_data(["gato"]))
+    storage.remove_word("alice", "hola")
+    # Flushed to the journal but never written back, as after a crash
+    storage.journal.flush()
+
+    recovered = ShardedStorage(root_dir, cache_size=2, flush_interval=60)
+    assert recovered.get_words("alice") == ["adiós"]
+    assert recovered.get_words("bob") == ["gato"]
+    assert recovered.get_stats()["total_highlighted_words"] == 2
+    recovered.close()
+
+def test_sharded_imports_a_json_store(tmp_path):
+    source = open_backend("json", tmp_path)
+    source.create_user("alice", user_data(["hola", "gato"]))
+    source.close()
+    storage = create_storage("sharded", root_dir=str(tmp_path / "store_users"),
+                             import_file=str(tmp_path / "store.json"))
+    assert storage.get_words("alice") == ["hola", "gato"]
+    storage.close()
+
+def test_stats_and_analytics_follow_every_change(store):
+    store.create_user("alice", user_data(["Hola", "gato"]))
+    store.create_user("bob", user_data(["hola"], source="fr"))
+    store.add_word("bob", "perro")
+    store.remove_word("alice", "gato")
+    store.update_languages("bob", "en", None)
+    store.create_user("carol", user_data(["hola"]))
+    store.delete_user("carol")
+    stats = store.get_stats()
+    assert (stats["total_users"], stats["total_highlighted_words"]) == (2, 3)
+    analytics = store.get_analytics(top_n=1)
+    assert [(row["word"], row["users"]) for row in analytics["top_words"]] == [("hola", 2)]
+    assert analytics["language_pairs"] == [{"source_language": "en", "target_language": "es", "users": 2}]
+
+def test_versions_only_increase(store):
+    assert store.get_version("alice") is None
+    store.create_user("alice", {**user_data(), "version": 5})
+    assert [store.bump_version("alice") for _ in range(3)] == [6, 7, 8]
+    assert store.get_version("alice") == 8
@@ -0,0 +1,90 @@
+import json
+import os
+from storage import JsonStorage
+from store_journal import StoreJournal
+
+def user_data(words=()):
+    return {"password": None, "source_language": "en", "target_language": "es", "highlighted_words": list(words)}
+
+def test_entries_are_numbered_and_flushed_in_order(tmp_path):
+    journal = StoreJournal(str(tmp_path / "journal"), flush_interval=60)
+    journal.start(10, lambda: None)
+    assert [journal.append({"op": "add_word", "word": str(i)}) for i in range(3)] == [11, 12, 13]
+    journal.close()
+    assert [entry["seq"] for entry in journal.read_entries()] == [11, 12, 13]
+    assert [entry["seq"] for entry in journal.read_entries(after_seq=12)] == [13]
+
+def test_torn_tail_is_ignored(tmp_path):
+    path = tmp_path / "journal"
+    path.write_text(
+        json.dumps({"seq": 1, "op": "a"}) + "\n" + json.dumps({"seq": 2, "op": "b"}) + "\n" + '{"seq": 3, "op'
+    )
+    assert [entry["seq"] for entry in StoreJournal(str(path)).read_entries()] == [1, 2]
+
+def test_start_cuts_a_torn_tail_so_new_entries_stay_readable(tmp_path):
+    path = tmp_path / "journal"
+    path.write_text(json.dumps({"seq": 1, "op": "a"}) + "\n" + json.dumps({"seq": 2, "op": "b"}))
+    journal = StoreJournal(str(path), flush_interval=60)
+    journal.start(1, lambda: None)
+    journal.append({"op": "c"})
+    journal.close()
+    assert [entry["op"] for entry in journal.read_entries()] == ["a", "c"]
+
+def test_truncate_keeps_only_newer_entries(tmp_path):
+    journal = StoreJournal(str(tmp_path / "journal"), flush_interval=60)
+    journal.start(0, lambda: None)
+    for i in range(5):
+        journal.append({"op": "add_word", "word": str(i)})
+    journal.flush()
+    journal.truncate(3)
+    assert [entry["seq"] for entry in journal.read_entries()] == [4, 5]
+    assert journal.entries_since_snapshot == 2
+    journal.close()
+
+def test_crash_recovery_replays_journal_after_snapshot(tmp_path):
+    store_file = str(tmp_path / "store.json")
+    storage = JsonStorage(store_file, flush_interval=60, compact_every=10 ** 6)
+    storage.create_user("alice", user_data(["hola"]))
+    storage.save_store()
+    storage.add_word("alice", "adiós")
+    storage.create_user("bob", user_data())
+    storage.remove_word("alice", "hola")
+    # Flushed to the journal but never snapshotted, as after a crash
+    storage.journal.flush()
+
+    recovered = JsonStorage(store_file, flush_interval=60)
+    assert recovered.get_words("alice") == ["adiós"]
+    assert recovered.user_exists("bob")
+    assert recovered.get_stats()["total_highlighted_words"] == 1
+    recovered.close()
+
+def test_close_snapshots_and_empties_journal(tmp_path):
+    store_file = str(tmp_path / "store.json")
+    storage = JsonStorage(store_file, flush_interval=60)
+    storage.create_user("alice", user_data(["hola", "gato"]))
+    storage.close()
+    assert os.path.getsize(storage.journal.journal_file) == 0
+    reopened = JsonStorage(store_file)
+    assert reopened.get_words("alice") == ["hola", "gato"]
+    reopened.close()
+
+def test_writes_after_a_torn_tail_survive_the_next_crash(tmp_path):
+    store_file = str(tmp_path / "store.json")
+    storage = JsonStorage(store_file, flush_interval=60, compact_every=10 ** 6)
+    storage.create_user("u", user_data())
+    storage.save_store()
+    storage.add_word("u", "one")
+    storage.journal.flush()
+    # Crash part-way through writing the next entry
+    with open(storage.journal.journal_file, "a", encoding="utf-8") as f:
+        f.write('{"op": "add_word", "user_id": "u", "wo')
+
+    restarted = JsonStorage(store_file, flush_interval=60, compact_every=10 ** 6)
+    restarted.add_word("u", "two")
+    restarted.add_word("u", "three")
+    restarted.journal.flush()
+    # Crash again, before any snapshot
+
+    recovered = JsonStorage(store_file, flush_interval=60)
+    assert recovered.get_words("u") == ["one", "two", "three"]
+    recovered.close()
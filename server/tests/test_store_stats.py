@@ -0,0 +1,43 @@
+import random
+from collections import Counter
+from store_stats import HeavyHitters, StoreStats
+
+def test_heavy_hitters_are_exact_within_capacity():
+    sketch = HeavyHitters(capacity=10)
+    for key in "aabbbcd":
+        sketch.add(key)
+    sketch.remove("d")
+    sketch.remove("a")
+    assert sketch.top(1) == [("b", 3, 0)]
+    assert sorted(sketch.top(10)) == [("a", 1, 0), ("b", 3, 0), ("c", 1, 0)]
+    assert sketch.exact
+
+def test_heavy_hitters_keep_every_frequent_key_with_bounded_error():
+    rng = random.Random(7)
+    stream = [f"rare{rng.randrange(500)}" for _ in range(2000)] + ["hot"] * 400 + ["warm"] * 250
+    rng.shuffle(stream)
+    sketch = HeavyHitters(capacity=20)
+    for key in stream:
+        sketch.add(key)
+    truth = Counter(stream)
+    top = {key: (count, error) for key, count, error in sketch.top(20)}
+    assert not sketch.exact
+    # Any key counted more than total / capacity times is tracked
+    for key, count in truth.items():
+        if count > len(stream) / 20:
+            assert key in top
+    for key, (count, error) in top.items():
+        assert count - error <= truth[key] <= count
+
+def test_store_stats_follow_user_changes_and_round_trip():
+    stats = StoreStats()
+    stats.add_user({"source_language": "en", "target_language": "es", "highlighted_words": ["Hola", "gato"]})
+    stats.add_user({"source_language": "en", "target_language": "es", "highlighted_words": ["hola"]})
+    stats.add_user({"source_language": "fr", "target_language": "es", "highlighted_words": []})
+    stats.change_languages(("fr", "es"), ("en", "es"))
+    stats.remove_word("gato")
+    assert stats.summary() == {"total_users": 3, "total_highlighted_words": 2}
+    analytics = StoreStats.from_dict(stats.to_dict()).analytics()
+    assert analytics["top_words"] == [{"word": "hola", "users": 2, "max_overcount": 0}]
+    assert analytics["top_words_exact"]
+    assert analytics["language_pairs"] == [{"source_language": "en", "target_language": "es", "users": 3}]
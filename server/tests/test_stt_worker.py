@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import numpy as np
+import pytest
+import stt_worker
+from stt_worker import InferenceExecutor, QueueFullError
+
+class FakeModel:
+    """Whisper stand-in: the transcript is the number of samples."""
+
+    def __init__(self, gate: threading.Event = None):
+        self.gate = gate
+
+    def transcribe(self, audio, **options):
+        # The one-second warm-up at load time is never held up
+        if self.gate is not None and len(audio) != 16000:
+            self.gate.wait(5)
+        return {"text": f" {len(audio)} "}
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Patch model loading; returns the list of (model, backend) builds."""
+    calls = []
+
+    def build(model_name, backend):
+        calls.append((model_name, backend))
+        return FakeModel()
+
+    monkeypatch.setattr(stt_worker, "_build_model", build)
+    return calls
+
+def run(executor: InferenceExecutor, scenario):
+    async def main():
+        executor.start()
+        try:
+            return await scenario()
+        finally:
+            executor.shutdown()
+    return asyncio.run(main())
+
+def test_transcribes_in_the_pool(builds):
+    executor = InferenceExecutor(workers=2)
+    result = run(executor, lambda: executor.transcribe(np.zeros(1600, dtype=np.float32)))
+    assert result["text"] == "1600"
+    assert executor.completed == 1 and executor.depth == 0
+
+def test_full_queue_rejects_jobs(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(stt_worker, "_build_model", lambda model_name, backend: FakeModel(gate))
+    executor = InferenceExecutor(max_queue=1)
+
+    async def scenario():
+        first = asyncio.create_task(executor.transcribe(np.zeros(10, dtype=np.float32)))
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueueFullError):
+            await executor.transcribe(np.zeros(10, dtype=np.float32))
+        gate.set()
+        return await first
+
+    assert run(executor, scenario)["text"] == "10"
+    assert executor.rejected == 1
+
+def test_slow_job_times_out(monkeypatch):
+    gate = threading.Event()
+    monkeypatch.setattr(stt_worker, "_build_model", lambda model_name, backend: FakeModel(gate))
+    executor = InferenceExecutor(job_timeout=0.05)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await executor.transcribe(np.zeros(10, dtype=np.float32))
+        gate.set()
+
+    run(executor, scenario)
+    assert executor.timed_out == 1 and executor.depth == 0
+
+@pytest.fixture
+def batches(monkeypatch, builds):
+    """Patch the batched decode; returns the size of every batch decoded."""
+    sizes = []
+
+    def transcribe_batch(model_name, backend, audios, options):
+        sizes.append(len(audios))
+        return [{"text": str(len(audio)), "inference_seconds": 0.0, "batch_size": len(audios)} for audio in audios]
+
+    monkeypatch.setattr(stt_worker, "_transcribe_batch", transcribe_batch)
+    return sizes
+
+def test_concurrent_utterances_are_decoded_together(batches):
+    executor = InferenceExecutor(max_batch_size=4, batch_window=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            executor.transcribe(np.zeros(length, dtype=np.float32), language="es") for length in (100, 200, 300)
+        ))
+
+    assert [result["text"] for result in run(executor, scenario)] == ["100", "200", "300"]
+    assert batches == [3]
+
+def test_batches_split_by_size_and_options(batches):
+    executor = InferenceExecutor(max_batch_size=2, batch_window=0.05)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(executor.transcribe(np.zeros(10, dtype=np.float32), language="es") for _ in range(3)),
+            executor.transcribe(np.zeros(10, dtype=np.float32), language="fr")
+        )
+
+    run(executor, scenario)
+    assert sorted(batches) == [1, 1, 2]
+
+def test_long_audio_is_not_batched(batches):
+    executor = InferenceExecutor(max_batch_size=4)
+    long_audio = np.zeros(stt_worker.BATCH_MAX_SAMPLES + 1, dtype=np.float32)
+    result = run(executor, lambda: executor.transcribe(long_audio))
+    assert result["text"] == str(len(long_audio)) and batches == []
+
+def test_model_loads_on_first_use_only(builds):
+    executor = InferenceExecutor(workers=2, backend="whisper-int8")
+
+    async def scenario():
+        assert builds == []
+        assert executor.load() is executor.load()
+        await executor.transcribe(np.zeros(10, dtype=np.float32))
+        await executor.transcribe(np.zeros(10, dtype=np.float32))
+
+    run(executor, scenario)
+    # One build per pool thread at most, all with the configured backend
+    assert 1 <= len(builds) <= 2 and set(builds) == {("base", "whisper-int8")}
+    assert executor.get_stats()["model_loaded"]
+
+def test_failed_load_is_retried(monkeypatch):
+    attempts = []
+
+    def build(model_name, backend):
+        attempts.append(backend)
+        if len(attempts) == 1:
+            raise RuntimeError("download failed")
+        return FakeModel()
+
+    monkeypatch.setattr(stt_worker, "_build_model", build)
+    executor = InferenceExecutor()
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await executor.transcribe(np.zeros(10, dtype=np.float32))
+        return await executor.transcribe(np.zeros(10, dtype=np.float32))
+
+    assert run(executor, scenario)["text"] == "10"
+    assert executor.failed == 1
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        InferenceExecutor(backend="tensorrt")
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import pytest
+from llm_client import LLMError
+from translation import Translator, expand_language_code, parse_batch_response
+from translation_cache import TranslationCache
+
+class FakeLLM:
+    """Chat-completions stand-in that "translates" by upper-casing."""
+
+    def __init__(self, malformed_batches: bool = False):
+        self.calls = []
+        self.malformed_batches = malformed_batches
+
+    async def chat_completion(self, messages, **params):
+        self.calls.append(messages[1]["content"])
+        await asyncio.sleep(0)
+        if "response_format" in params:
+            items = json.loads(messages[1]["content"])["items"]
+            translations = [{"id": item["id"], "text": item["text"].upper()} for item in items]
+            content = "not json" if self.malformed_batches else json.dumps({"translations": translations})
+        else:
+            content = messages[1]["content"].upper()
+        return {"choices": [{"message": {"content": content}}]}
+
+    async def stream_chat_completion(self, messages, **params):
+        self.calls.append(messages[1]["content"])
+        for word in messages[1]["content"].upper().split(" "):
+            await asyncio.sleep(0)
+            yield word + " "
+
+def make_translator(llm, **options) -> Translator:
+    return Translator(llm, TranslationCache(), **options)
+
+def test_expand_language_code():
+    assert expand_language_code("es") == "Spanish"
+    assert expand_language_code("Klingon") == "Klingon"
+    assert expand_language_code("") == "auto"
+
+def test_parse_batch_response_requires_every_id():
+    assert parse_batch_response('{"translations": [{"id": 0, "text": " a "}]}', [0]) == {0: "a"}
+    assert parse_batch_response('{"translations": [{"id": 0, "text": "a"}]}', [0, 1]) is None
+    assert parse_batch_response("nope", [0]) is None
+
+def test_concurrent_requests_share_one_packed_call():
+    llm = FakeLLM()
+    translator = make_translator(llm, microbatch_window=0.01)
+
+    async def burst():
+        return await asyncio.gather(*(translator.translate(text, "auto", "English") for text in ["uno", "dos", "tres"]))
+
+    results = asyncio.run(burst())
+    assert results == [("UNO", "upstream"), ("DOS", "upstream"), ("TRES", "upstream")]
+    assert len(llm.calls) == 1 and translator.batch_calls == 1
+    assert asyncio.run(translator.translate("dos", "auto", "English")) == ("DOS", "cache")
+
+def test_full_microbatch_is_sent_without_waiting():
+    llm = FakeLLM()
+    translator = make_translator(llm, microbatch_window=60, max_batch_items=2)
+
+    async def burst():
+        return await asyncio.wait_for(asyncio.gather(
+            translator.translate("uno", "auto", "English"), translator.translate("dos", "auto", "English")
+        ), timeout=5)
+
+    assert [text for text, _ in asyncio.run(burst())] == ["UNO", "DOS"]
+
+def test_malformed_batch_falls_back_to_single_calls():
+    llm = FakeLLM(malformed_batches=True)
+    translator = make_translator(llm)
+    results = asyncio.run(translator.translate_batch([
+        ("uno", "auto", "English"), ("dos", "auto", "English"), ("uno", "auto", "English")
+    ]))
+    assert [result["translated_text"] for result in results] == ["UNO", "DOS", "UNO"]
+    assert translator.batch_fallbacks == 1
+    # One packed call, then one call per distinct text
+    assert len(llm.calls) == 3
+
+class SlowLLM(FakeLLM):
+    async def chat_completion(self, messages, **params):
+        await asyncio.sleep(0.05)
+        return await super().chat_completion(messages, **params)
+
+def test_batch_reads_the_disk_tier(tmp_path):
+    from translation import make_cache_key
+    disk_file = str(tmp_path / "cache.db")
+    previous_run = TranslationCache(disk_file=disk_file)
+    asyncio.run(previous_run.set(make_cache_key("uno", "auto", "English"), "ONE"))
+    previous_run.close()
+    llm = FakeLLM()
+    translator = Translator(llm, TranslationCache(disk_file=disk_file))
+    results = asyncio.run(translator.translate_batch([("uno", "auto", "English"), ("dos", "auto", "English")]))
+    assert [(result["translated_text"], result["served_by"]) for result in results] == [
+        ("ONE", "cache"), ("DOS", "upstream")
+    ]
+    assert llm.calls == ["dos"] and translator.cache.disk_hits == 1
+    translator.cache.close()
+
+def test_batch_and_single_requests_share_translations_in_flight():
+    llm = SlowLLM()
+    translator = make_translator(llm, microbatch_window=0)
+
+    async def overlap():
+        single = asyncio.create_task(translator.translate("uno", "auto", "English"))
+        await asyncio.sleep(0.01)
+        batch = await translator.translate_batch([("uno", "auto", "English"), ("dos", "auto", "English")])
+        late = await translator.translate("dos", "auto", "English")
+        return await single, batch, late
+
+    single, batch, late = asyncio.run(overlap())
+    assert single == ("UNO", "upstream") and late == ("DOS", "cache")
+    assert [(result["translated_text"], result["cached"]) for result in batch] == [("UNO", True), ("DOS", False)]
+    # "uno" was joined rather than sent again
+    assert llm.calls == ["uno", "dos"]
+
+def test_single_request_waits_on_a_batch_in_flight():
+    llm = SlowLLM()
+    translator = make_translator(llm, microbatch_window=0)
+
+    async def overlap():
+        batch = asyncio.create_task(translator.translate_batch([("uno", "auto", "English"), ("dos", "auto", "English")]))
+        await asyncio.sleep(0.01)
+        return await translator.translate("dos", "auto", "English"), await batch
+
+    single, batch = asyncio.run(overlap())
+    assert single == ("DOS", "cache") and translator.cache.coalesced == 1
+    assert len(llm.calls) == 1 and translator.batch_calls == 1
+
+def test_stream_caches_completed_translation():
+    llm = FakeLLM()
+    translator = make_translator(llm)
+
+    async def collect():
+        return [event async for event in translator.translate_stream("buenos días", "auto", "English")]
+
+    events = asyncio.run(collect())
+    assert [event["delta"] for event in events[:-1]] == ["BUENOS ", "DÍAS "]
+    assert events[-1]["translated_text"] == "BUENOS DÍAS" and events[-1]["served_by"] == "upstream"
+    again = asyncio.run(collect())
+    assert again[-1]["served_by"] == "cache" and len(llm.calls) == 1
+
+def test_closed_stream_is_counted_and_not_cached():
+    translator = make_translator(FakeLLM())
+
+    async def first_delta():
+        stream = translator.translate_stream("buenos días", "auto", "English")
+        event = await stream.__anext__()
+        await stream.aclose()
+        return event
+
+    assert asyncio.run(first_delta()) == {"delta": "BUENOS "}
+    assert translator.streams_cancelled == 1 and translator.streams_completed == 0
+    assert translator.cache.get(("buenos días", "auto", "English")) is None
+
+def test_upstream_failure_mid_stream_is_counted_apart_from_cancellations():
+    class FailingLLM(FakeLLM):
+        async def stream_chat_completion(self, messages, **params):
+            yield "BUENOS "
+            raise LLMError(504, "Groq API timed out")
+
+    translator = make_translator(FailingLLM())
+
+    async def consume():
+        return [event async for event in translator.translate_stream("buenos días", "auto", "English")]
+
+    with pytest.raises(LLMError):
+        asyncio.run(consume())
+    stats = translator.get_stats()
+    assert (stats["streams_failed"], stats["streams_cancelled"], stats["streams_completed"]) == (1, 0, 0)
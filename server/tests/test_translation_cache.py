@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+from translation_cache import TranslationCache, make_cache_key
+
+KEY = make_cache_key("  buenos   días ", "Spanish", "English")
+
+def test_key_normalizes_whitespace():
+    assert KEY == ("buenos días", "Spanish", "English")
+
+def test_lru_eviction_and_ttl():
+    cache = TranslationCache(max_entries=2, ttl=60)
+    cache.put(("a", "x", "y"), "A")
+    cache.put(("b", "x", "y"), "B")
+    cache.get(("a", "x", "y"))
+    cache.put(("c", "x", "y"), "C")
+    assert cache.get(("b", "x", "y")) is None
+    assert cache.get(("a", "x", "y")) == "A"
+    assert cache.evictions == 1
+    cache.put(("old", "x", "y"), "OLD", created_at=0)
+    assert cache.get(("old", "x", "y")) is None
+
+def test_disk_tier_survives_reopen(tmp_path):
+    disk_file = str(tmp_path / "cache.db")
+
+    async def compute():
+        return "good morning"
+
+    cache = TranslationCache(disk_file=disk_file)
+    assert asyncio.run(cache.get_or_compute(KEY, compute)) == ("good morning", False)
+    cache.close()
+
+    reopened = TranslationCache(disk_file=disk_file)
+    assert asyncio.run(reopened.get_or_compute(KEY, compute)) == ("good morning", True)
+    assert reopened.disk_hits == 1
+    assert reopened.disk_entries() == [("buenos días", "Spanish", "English", "good morning")]
+    reopened.close()
+
+def test_concurrent_misses_share_one_call():
+    cache = TranslationCache()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "good morning"
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_compute(KEY, compute) for _ in range(5)))
+
+    results = asyncio.run(burst())
+    assert calls == 1
+    assert results[0] == ("good morning", False)
+    assert results[1:] == [("good morning", True)] * 4
+    assert cache.coalesced == 4
+
+def test_cancelled_leader_hands_over_to_a_waiting_caller():
+    cache = TranslationCache()
+    started = []
+
+    async def compute():
+        started.append(len(started))
+        await asyncio.sleep(0.05)
+        return "good morning"
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_compute(KEY, compute))
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(cache.get_or_compute(KEY, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(scenario())
+    assert sorted(results) == [("good morning", False)] + [("good morning", True)] * 2
+    # The leader's call and one call by the caller that took over
+    assert len(started) == 2
+
+def test_leader_failure_reaches_waiting_callers():
+    cache = TranslationCache()
+
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_compute(KEY, compute) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(burst())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not cache._inflight
+
+def test_cancelled_batch_hands_its_keys_over_to_waiting_callers():
+    cache = TranslationCache()
+    other = make_cache_key("good night", "English", "Spanish")
+
+    async def compute_many(keys):
+        await asyncio.sleep(0.05)
+        return {key: key[0].upper() for key in keys}
+
+    async def compute():
+        return "buenos días"
+
+    async def scenario():
+        batch = asyncio.create_task(cache.get_or_compute_many([KEY, other], compute_many))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_compute(KEY, compute))
+        await asyncio.sleep(0.01)
+        batch.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await batch
+        return await follower
+
+    assert asyncio.run(scenario()) == ("buenos días", False)
+    assert not cache._inflight
+
+def test_batch_reports_failures_per_key():
+    cache = TranslationCache()
+    other = make_cache_key("good night", "English", "Spanish")
+    cache.put(other, "buenas noches")
+
+    async def compute_many(keys):
+        return {key: RuntimeError("upstream down") for key in keys}
+
+    results = asyncio.run(cache.get_or_compute_many([KEY, other, KEY], compute_many))
+    assert isinstance(results[KEY], RuntimeError)
+    assert results[other] == ("buenas noches", True)
+    assert cache.get(KEY) is None and not cache._inflight
@@ -0,0 +1,84 @@
+import random
+from highlight_set import normalize_word
+from word_index import MATCH_RANK, TOKEN, WordIndex, edit_distance, max_edits
+
+def osa_distance(a, b):
+    """Unbounded optimal string alignment distance, for checking the banded version."""
+    d = [[i + j if i * j == 0 else 0 for j in range(len(b) + 1)] for i in range(len(a) + 1)]
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[-1][-1]
+
+def brute_force_search(words, query, fuzzy=True):
+    """What `search` returns, computed by matching every word instead of using the postings."""
+    index = WordIndex()
+    query = normalize_word(query)
+    query_tokens = TOKEN.findall(query)
+    if not query:
+        return []
+    fuzzy = fuzzy and any(max_edits(token) for token in query_tokens)
+    ranked = []
+    for doc_id, word in enumerate(words):
+        match = index._match(normalize_word(word), query, query_tokens, fuzzy)
+        if match is not None:
+            ranked.append((MATCH_RANK[match[0]], match[1], len(word), doc_id, match[0], word))
+    ranked.sort()
+    return [{"word": word, "match": kind, "typos": typos} for _, typos, _, _, kind, word in ranked]
+
+def random_words(rng, count):
+    letters = "aábcdeéilmnorstu"
+    token = lambda: "".join(rng.choice(letters) for _ in range(rng.randint(1, 8)))
+    words = {}
+    while len(words) < count:
+        word = " ".join(token() for _ in range(rng.randint(1, 3)))
+        words.setdefault(normalize_word(word), word)
+    return list(words.values())
+
+def test_banded_edit_distance_matches_the_full_table():
+    rng = random.Random(1)
+    for _ in range(2000):
+        a, b = ("".join(rng.choice("abc") for _ in range(rng.randint(0, 7))) for _ in range(2))
+        limit = rng.randint(0, 3)
+        assert edit_distance(a, b, limit) == min(osa_distance(a, b), limit + 1)
+
+def test_ranking_puts_exact_then_prefix_then_substring_then_typos():
+    index = WordIndex(words=["gatito", "el gato", "gato", "perro gato", "gatp", "garrapata"])
+    results = index.search("gato")
+    assert [(row["word"], row["match"]) for row in results] == [
+        ("gato", "exact"), ("el gato", "prefix"), ("perro gato", "prefix"), ("gatp", "fuzzy")
+    ]
+    assert [row["word"] for row in index.search("atit")] == ["gatito"]
+    assert index.search("gato", fuzzy=False)[-1]["word"] == "perro gato"
+
+def test_search_matches_a_brute_force_scan():
+    rng = random.Random(2)
+    words = random_words(rng, 300)
+    index = WordIndex(words=words)
+    queries = [word[:rng.randint(1, len(word))] for word in rng.sample(words, 60)]
+    queries += ["".join(rng.choice("abcdelmorst ") for _ in range(rng.randint(1, 7))) for _ in range(60)]
+    queries += ["", "  ", "-", "B", "Á"]
+    for query in queries:
+        for fuzzy in (True, False):
+            assert index.search(query, fuzzy) == brute_force_search(words, query, fuzzy), query
+
+def test_incremental_updates_match_a_fresh_index():
+    rng = random.Random(3)
+    words = random_words(rng, 200)
+    index = WordIndex()
+    kept = []
+    for word in words:
+        index.add(word)
+        kept.append(word)
+        if rng.random() < 0.3:
+            removed = kept.pop(rng.randrange(len(kept)))
+            assert index.remove(removed.upper())
+    assert not index.remove("not there") and not index.add(kept[0].upper())
+    fresh = WordIndex(words=kept)
+    assert len(index) == len(fresh) == len(kept)
+    assert index._sorted_tokens == fresh._sorted_tokens
+    assert index._grams == fresh._grams
+    for query in ("a", "ab", "mar", "tes", "ordo", "sol e"):
+        assert [row["word"] for row in index.search(query)] == [row["word"] for row in brute_force_search(kept, query)]
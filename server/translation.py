@@ -0,0 +1,372 @@
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+from lexicon import Lexicon
+from llm_client import LLMClient, LLMError
+from translation_cache import CacheKey, TranslationCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Language code to full name mapping
+LANGUAGE_MAP = {
+    'en': 'English',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'ja': 'Japanese',
+    'zh': 'Chinese',
+    'ko': 'Korean',
+    'ru': 'Russian',
+    'ar': 'Arabic',
+    'hi': 'Hindi',
+    'auto': 'auto'
+}
+
+def expand_language_code(language_code: str) -> str:
+    """
+    Expand a language code to its full name.
+    If the code is not found, return the original code.
+    """
+    if not language_code:
+        return "auto"
+
+    # Convert to lowercase for case-insensitive matching
+    code_lower = language_code.lower()
+
+    # Check if it's already a full name (capitalized)
+    if language_code[0].isupper():
+        return language_code
+
+    # Look up in the language map
+    return LANGUAGE_MAP.get(code_lower, language_code)
+
+def build_system_prompt(source_language_full: str, target_language_full: str) -> str:
+    """Create the translator system prompt for a language pair."""
+    if source_language_full == "auto":
+        # If source is auto, just translate to target language
+        return f"You are a professional translator. Translate the given text to {target_language_full}. Only return the translated text, nothing else."
+    # If source is specified, check if text is in source or target language and translate accordingly
+    return f"""You are a professional translator.
+If the text is in {source_language_full}, translate it to {target_language_full}.
+If the text is in {target_language_full}, translate it to {source_language_full}.
+Only return the translated text, nothing else."""
+
+def build_batch_system_prompt(source_language_full: str, target_language_full: str) -> str:
+    """System prompt for translating a JSON-packed list of texts in one call."""
+    if source_language_full == "auto":
+        direction = f"Translate each item's text to {target_language_full}."
+    else:
+        direction = (f"For each item, if its text is in {source_language_full} translate it to {target_language_full}; "
+                     f"if it is in {target_language_full} translate it to {source_language_full}.")
+    return f"""You are a professional translator. {direction}
+The user message is a JSON object {{"items": [{{"id": <int>, "text": <string>}}, ...]}}.
+Respond with only a JSON object {{"translations": [{{"id": <int>, "text": <translated string>}}, ...]}}
+containing exactly one entry per input id. Translate each item independently."""
+
+def parse_batch_response(content: str, expected_ids: List[int]) -> Optional[Dict[int, str]]:
+    """Parse a batch translation response; None if it is malformed or incomplete."""
+    try:
+        data = json.loads(content)
+        translations = {int(item["id"]): str(item["text"]).strip() for item in data["translations"]}
+    except (ValueError, KeyError, TypeError):
+        return None
+    if set(translations) != set(expected_ids):
+        return None
+    return translations
+
+LanguagePair = Tuple[str, str]
+
+class Translator:
+    """
+    Translation service shared by /translate, /translate/batch and the streaming endpoints.
+
+    Short texts are first looked up in the local lexicon, when one is
+    configured. Everything else goes through the cache; misses are either sent
+    straight to the LLM or, with micro-batching enabled, held for up to
+    `microbatch_window` seconds so concurrent requests for the same language
+    pair share one call. Results report what served them: "lexicon", "cache"
+    or "upstream".
+    """
+
+    def __init__(self, llm_client: LLMClient, cache: TranslationCache,
+                 max_batch_items: int = 20, max_batch_chars: int = 6000,
+                 microbatch_window: float = 0.005, lexicon: Optional[Lexicon] = None):
+        self.llm_client = llm_client
+        self.cache = cache
+        self.lexicon = lexicon
+        self._merge_task: Optional[asyncio.Task] = None
+        self.max_batch_items = max_batch_items
+        self.max_batch_chars = max_batch_chars
+        self.microbatch_window = microbatch_window
+        self._pending: Dict[LanguagePair, List[Tuple[str, asyncio.Future]]] = {}
+        self._flush_tasks: Dict[LanguagePair, asyncio.Task] = {}
+        self.batch_calls = 0
+        self.batch_fallbacks = 0
+        self.streams_started = 0
+        self.streams_completed = 0
+        self.streams_cancelled = 0
+        self.streams_failed = 0
+        self.ttft_count = 0
+        self.ttft_total = 0.0
+        self.ttft_max = 0.0
+
+    async def translate_one_uncached(self, text: str, source_full: str, target_full: str) -> str:
+        result = await self.llm_client.chat_completion(
+            [
+                {
+                    "role": "system",
+                    "content": build_system_prompt(source_full, target_full)
+                },
+                {
+                    "role": "user",
+                    "content": text
+                }
+            ],
+            temperature=0.1,
+            max_tokens=1000
+        )
+        return result["choices"][0]["message"]["content"].strip()
+
+    async def _translate_chunk(self, texts: List[str], source_full: str, target_full: str) -> List[str]:
+        """One packed LLM call for several texts, falling back to per-item calls on a bad response."""
+        if len(texts) == 1:
+            return [await self.translate_one_uncached(texts[0], source_full, target_full)]
+
+        ids = list(range(len(texts)))
+        payload = json.dumps({"items": [{"id": i, "text": text} for i, text in zip(ids, texts)]}, ensure_ascii=False)
+        self.batch_calls += 1
+        try:
+            result = await self.llm_client.chat_completion(
+                [
+                    {"role": "system", "content": build_batch_system_prompt(source_full, target_full)},
+                    {"role": "user", "content": payload}
+                ],
+                temperature=0.1,
+                max_tokens=min(8000, 1000 + 2 * sum(len(text) for text in texts)),
+                response_format={"type": "json_object"}
+            )
+            translations = parse_batch_response(result["choices"][0]["message"]["content"], ids)
+        except LLMError as e:
+            if e.status_code not in (400, 422):
+                raise
+            # Some models reject JSON mode or the packed prompt; treat it like a parse failure
+            translations = None
+        if translations is not None:
+            return [translations[i] for i in ids]
+
+        self.batch_fallbacks += 1
+        logger.warning("Batch translation response unusable, falling back to %d single calls", len(texts))
+        return list(await asyncio.gather(*(
+            self.translate_one_uncached(text, source_full, target_full) for text in texts
+        )))
+
+    def _learn(self, text: str, source_full: str, target_full: str, translated_text: str) -> None:
+        """Feed an upstream translation to the lexicon, merging its files off the event loop when due."""
+        if self.lexicon is None:
+            return
+        self.lexicon.learn(text, translated_text, source_full, target_full)
+        if self.lexicon.needs_merge and (self._merge_task is None or self._merge_task.done()):
+            self._merge_task = asyncio.create_task(asyncio.to_thread(self.lexicon.merge))
+
+    def _chunks(self, texts: List[str]) -> List[List[str]]:
+        chunks, current, chars = [], [], 0
+        for text in texts:
+            if current and (len(current) >= self.max_batch_items or chars + len(text) > self.max_batch_chars):
+                chunks.append(current)
+                current, chars = [], 0
+            current.append(text)
+            chars += len(text)
+        if current:
+            chunks.append(current)
+        return chunks
+
+    async def translate(self, text: str, source_full: str, target_full: str) -> Tuple[str, str]:
+        """Translate one text; returns (translated_text, served_by)."""
+        if self.lexicon is not None:
+            translated_text = self.lexicon.lookup(text, source_full, target_full)
+            if translated_text is not None:
+                return translated_text, "lexicon"
+        if self.microbatch_window > 0:
+            compute = lambda: self._submit(text, source_full, target_full)
+        else:
+            compute = lambda: self.translate_one_uncached(text, source_full, target_full)
+        translated_text, cached = await self.cache.get_or_compute(make_cache_key(text, source_full, target_full), compute)
+        # A repeat served from the cache confirms the reply for the lexicon too
+        self._learn(text, source_full, target_full, translated_text)
+        return translated_text, "cache" if cached else "upstream"
+
+    async def translate_batch(self, items: List[Tuple[str, str, str]]) -> List[Dict]:
+        """
+        Translate (text, source_full, target_full) items, grouping them by language
+        pair into packed calls. Each result is {"translated_text", "cached", "served_by"}
+        or {"error"}. Items go through every cache tier and join translations
+        already in flight, like `translate`; only the rest are packed.
+        """
+        results: List[Optional[Dict]] = [None] * len(items)
+        # Identical texts in one batch are translated once
+        positions: Dict[CacheKey, List[int]] = {}
+        texts: Dict[CacheKey, str] = {}
+        for index, (text, source_full, target_full) in enumerate(items):
+            if self.lexicon is not None:
+                translated_text = self.lexicon.lookup(text, source_full, target_full)
+                if translated_text is not None:
+                    results[index] = {"translated_text": translated_text, "cached": True, "served_by": "lexicon"}
+                    continue
+            key = make_cache_key(text, source_full, target_full)
+            texts.setdefault(key, text)
+            positions.setdefault(key, []).append(index)
+
+        async def compute(missing: List[CacheKey]) -> Dict[CacheKey, Union[str, Exception]]:
+            groups: Dict[LanguagePair, List[CacheKey]] = {}
+            for key in missing:
+                groups.setdefault((key[1], key[2]), []).append(key)
+            translated: Dict[CacheKey, Union[str, Exception]] = {}
+
+            async def run_chunk(pair: LanguagePair, keys: List[CacheKey]):
+                try:
+                    translations = await self._translate_chunk([texts[key] for key in keys], *pair)
+                except LLMError as e:
+                    translations = [e] * len(keys)
+                translated.update(zip(keys, translations))
+
+            chunks = []
+            for pair, keys in groups.items():
+                by_text = {texts[key]: key for key in keys}
+                chunks.extend((pair, [by_text[text] for text in chunk]) for chunk in self._chunks(list(by_text)))
+            await asyncio.gather(*(run_chunk(pair, keys) for pair, keys in chunks))
+            return translated
+
+        for key, outcome in (await self.cache.get_or_compute_many(list(positions), compute)).items():
+            if isinstance(outcome, LLMError):
+                result = {"error": outcome.detail, "status_code": outcome.status_code}
+            elif isinstance(outcome, Exception):
+                raise outcome
+            else:
+                translation, cached = outcome
+                # A repeat served from the cache confirms the reply for the lexicon too
+                self._learn(texts[key], key[1], key[2], translation)
+                result = {"translated_text": translation, "cached": cached, "served_by": "cache" if cached else "upstream"}
+            for index in positions[key]:
+                results[index] = dict(result)
+        return results
+
+    async def translate_stream(self, text: str, source_full: str, target_full: str) -> AsyncIterator[Dict]:
+        """
+        Stream a translation as events: {"delta": str} for each chunk, then
+        {"done": True, "translated_text", "cached", "served_by", "ttft_ms"}. A
+        lexicon or cache hit is a single delta. The full text is cached once the
+        stream completes; closing the generator early cancels the upstream request.
+        """
+        if self.lexicon is not None:
+            translated_text = self.lexicon.lookup(text, source_full, target_full)
+            if translated_text is not None:
+                yield {"delta": translated_text}
+                yield {"done": True, "translated_text": translated_text, "cached": True, "served_by": "lexicon",
+                       "ttft_ms": 0.0}
+                return
+        key = make_cache_key(text, source_full, target_full)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.cache.hits += 1
+            self._learn(text, source_full, target_full, cached)
+            yield {"delta": cached}
+            yield {"done": True, "translated_text": cached, "cached": True, "served_by": "cache", "ttft_ms": 0.0}
+            return
+
+        self.streams_started += 1
+        started_at = time.perf_counter()
+        ttft = None
+        parts = []
+        try:
+            async for delta in self.llm_client.stream_chat_completion(
+                [
+                    {"role": "system", "content": build_system_prompt(source_full, target_full)},
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.1,
+                max_tokens=1000
+            ):
+                if ttft is None:
+                    ttft = time.perf_counter() - started_at
+                    self.ttft_count += 1
+                    self.ttft_total += ttft
+                    self.ttft_max = max(self.ttft_max, ttft)
+                parts.append(delta)
+                yield {"delta": delta}
+        except (GeneratorExit, asyncio.CancelledError):
+            # The client went away
+            self.streams_cancelled += 1
+            raise
+        except Exception:
+            # Upstream failed (LLMError) or sent something unusable
+            self.streams_failed += 1
+            raise
+
+        self.streams_completed += 1
+        translated_text = "".join(parts).strip()
+        self.cache.misses += 1
+        await self.cache.set(key, translated_text)
+        self._learn(text, source_full, target_full, translated_text)
+        yield {
+            "done": True,
+            "translated_text": translated_text,
+            "cached": False,
+            "served_by": "upstream",
+            "ttft_ms": round((ttft or 0.0) * 1000, 1)
+        }
+
+    async def _submit(self, text: str, source_full: str, target_full: str) -> str:
+        """Queue a text for the next micro-batch of its language pair."""
+        pair = (source_full, target_full)
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.setdefault(pair, [])
+        pending.append((text, future))
+        if len(pending) >= self.max_batch_items:
+            task = self._flush_tasks.pop(pair, None)
+            if task is not None:
+                task.cancel()
+            self._flush(pair)
+        elif pair not in self._flush_tasks:
+            self._flush_tasks[pair] = asyncio.create_task(self._flush_later(pair))
+        return await future
+
+    async def _flush_later(self, pair: LanguagePair) -> None:
+        await asyncio.sleep(self.microbatch_window)
+        self._flush_tasks.pop(pair, None)
+        self._flush(pair)
+
+    def _flush(self, pair: LanguagePair) -> None:
+        pending = self._pending.pop(pair, [])
+        if pending:
+            asyncio.create_task(self._run_microbatch(pair, pending))
+
+    async def _run_microbatch(self, pair: LanguagePair, pending: List[Tuple[str, asyncio.Future]]) -> None:
+        texts = [text for text, _ in pending]
+        try:
+            translated = await self._translate_chunk(texts, *pair)
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), translation in zip(pending, translated):
+            if not future.done():
+                future.set_result(translation)
+
+    def get_stats(self) -> Dict:
+        return {
+            **(self.lexicon.get_stats() if self.lexicon is not None else {}),
+            "batch_calls": self.batch_calls,
+            "batch_fallbacks": self.batch_fallbacks,
+            "microbatch_window_ms": self.microbatch_window * 1000,
+            "streams_started": self.streams_started,
+            "streams_completed": self.streams_completed,
+            "streams_cancelled": self.streams_cancelled,
+            "streams_failed": self.streams_failed,
+            "stream_ttft_avg_ms": round(self.ttft_total / self.ttft_count * 1000, 1) if self.ttft_count else 0.0,
+            "stream_ttft_max_ms": round(self.ttft_max * 1000, 1)
+        }
@@ -0,0 +1,276 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from coordination import Coordinator
+
+CacheKey = Tuple[str, str, str]
+
+class _LeaderCancelled(Exception):
+    """The caller computing a shared result was cancelled; a waiting caller takes over."""
+
+def make_cache_key(text: str, source_language: str, target_language: str) -> CacheKey:
+    """Cache key for a translation: whitespace-normalized text plus the expanded language pair."""
+    return (" ".join(text.split()), source_language, target_language)
+
+class TranslationCache:
+    """
+    Bounded LRU + TTL cache for translations with an optional SQLite disk tier
+    and an optional shared tier (a coordination backend's key-value cache) so
+    every server process benefits from translations made by the others.
+
+    Concurrent lookups for the same key share a single upstream call
+    (single-flight), so a burst of identical requests costs one translation.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 86400.0, disk_file: Optional[str] = None,
+                 shared: Optional[Coordinator] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared if shared is not None and shared.shared else None
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._disk = None
+        self._disk_lock = threading.Lock()
+        if disk_file:
+            self._disk = sqlite3.connect(disk_file, check_same_thread=False, isolation_level=None)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "text TEXT NOT NULL, source_language TEXT NOT NULL, target_language TEXT NOT NULL, "
+                "translated_text TEXT NOT NULL, created_at REAL NOT NULL, "
+                "PRIMARY KEY (text, source_language, target_language))"
+            )
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        """Look up the memory tier only."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created_at = entry
+        if time.time() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: CacheKey, value: str, created_at: Optional[float] = None) -> None:
+        """Insert into the memory tier, evicting least recently used entries."""
+        self._entries[key] = (value, created_at if created_at is not None else time.time())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def set(self, key: CacheKey, value: str) -> None:
+        """Insert into the memory tier and, when enabled, the disk and shared tiers."""
+        self.put(key, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk_put, key, value)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.kv_set, _shared_key(key), value, self.ttl)
+
+    def _disk_get(self, key: CacheKey) -> Optional[Tuple[str, float]]:
+        with self._disk_lock:
+            row = self._disk.execute(
+                "SELECT translated_text, created_at FROM translations "
+                "WHERE text = ? AND source_language = ? AND target_language = ?",
+                key
+            ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0], row[1]
+
+    def _disk_put(self, key: CacheKey, value: str) -> None:
+        with self._disk_lock:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                (*key, value, time.time())
+            )
+
+    async def _lookup_tiers(self, key: CacheKey) -> Optional[str]:
+        """Look up the disk and shared tiers, promoting a hit into memory."""
+        if self._disk is not None:
+            disk_entry = await asyncio.to_thread(self._disk_get, key)
+            if disk_entry is not None:
+                self.disk_hits += 1
+                self.put(key, disk_entry[0], disk_entry[1])
+                return disk_entry[0]
+        if self.shared is not None:
+            shared_value = await asyncio.to_thread(self.shared.kv_get, _shared_key(key))
+            if shared_value is not None:
+                self.shared_hits += 1
+                self.put(key, shared_value)
+                return shared_value
+        return None
+
+    async def get_or_compute(self, key: CacheKey, compute: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """
+        Return (translation, cached). On a miss `compute` is awaited once no
+        matter how many callers ask for the same key concurrently. If the
+        caller running it is cancelled, one of the waiting callers runs its own
+        `compute` instead and the rest wait on that.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value, True
+
+        inflight = self._inflight.get(key)
+        while inflight is not None:
+            try:
+                value = await asyncio.shield(inflight)
+            except _LeaderCancelled:
+                # Another waiting caller may have taken over already; otherwise this one does
+                inflight = self._inflight.get(key)
+                continue
+            self.coalesced += 1
+            return value, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._lookup_tiers(key)
+            if value is not None:
+                future.set_result(value)
+                return value, True
+
+            self.misses += 1
+            value = await compute()
+            await self.set(key, value)
+            future.set_result(value)
+            return value, False
+        except asyncio.CancelledError:
+            # Cancelling the future would cancel every waiting caller too
+            if not future.done():
+                future.set_exception(_LeaderCancelled())
+                future.exception()
+            raise
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so a failure nobody else awaited is not logged as unhandled
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def get_or_compute_many(
+        self, keys: List[CacheKey],
+        compute: Callable[[List[CacheKey]], Awaitable[Dict[CacheKey, Union[str, Exception]]]]
+    ) -> Dict[CacheKey, Union[Tuple[str, bool], Exception]]:
+        """
+        Batch form of `get_or_compute`, returning (translation, cached) or the
+        exception per key. Keys another caller is already computing are waited
+        on; the rest are looked up in every tier and the misses passed to one
+        `compute(missing)` call, which returns a translation or an exception
+        per key. Callers asking for those keys in the meantime wait on it.
+        """
+        loop = asyncio.get_running_loop()
+        results: Dict[CacheKey, Union[Tuple[str, bool], Exception]] = {}
+        waiting: List[CacheKey] = []
+        owned: Dict[CacheKey, asyncio.Future] = {}
+        for key in dict.fromkeys(keys):
+            value = self.get(key)
+            if value is not None:
+                self.hits += 1
+                results[key] = (value, True)
+            elif key in self._inflight:
+                waiting.append(key)
+            else:
+                owned[key] = self._inflight[key] = loop.create_future()
+
+        async def compute_one(key: CacheKey) -> str:
+            value = (await compute([key]))[key]
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        async def wait(key: CacheKey) -> None:
+            # Runs its own compute if the caller it waits on is cancelled
+            try:
+                results[key] = await self.get_or_compute(key, lambda: compute_one(key))
+            except Exception as e:
+                results[key] = e
+
+        async def run_owned() -> None:
+            found = await asyncio.gather(*(self._lookup_tiers(key) for key in owned))
+            missing = []
+            for key, value in zip(owned, found):
+                if value is None:
+                    missing.append(key)
+                else:
+                    results[key] = (value, True)
+                    owned[key].set_result(value)
+            if not missing:
+                return
+            self.misses += len(missing)
+            computed = await compute(missing)
+            for key in missing:
+                value = computed[key]
+                if isinstance(value, Exception):
+                    results[key] = value
+                    owned[key].set_exception(value)
+                    owned[key].exception()
+                else:
+                    await self.set(key, value)
+                    results[key] = (value, False)
+                    owned[key].set_result(value)
+
+        try:
+            await asyncio.gather(run_owned(), *(wait(key) for key in waiting))
+        except BaseException as e:
+            for future in owned.values():
+                if not future.done():
+                    # As in get_or_compute: a waiting caller takes over rather than being cancelled too
+                    future.set_exception(_LeaderCancelled() if isinstance(e, asyncio.CancelledError) else e)
+                    future.exception()
+            raise
+        finally:
+            for key in owned:
+                del self._inflight[key]
+        return results
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.disk_hits + self.shared_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "disk_tier": self._disk is not None,
+            "shared_tier": self.shared is not None
+        }
+
+    def disk_entries(self) -> List[Tuple[str, str, str, str]]:
+        """(text, source_language, target_language, translated_text) for every unexpired disk entry."""
+        if self._disk is None:
+            return []
+        with self._disk_lock:
+            return self._disk.execute(
+                "SELECT text, source_language, target_language, translated_text FROM translations WHERE created_at > ?",
+                (time.time() - self.ttl,)
+            ).fetchall()
+
+    def close(self) -> None:
+        if self._disk is not None:
+            with self._disk_lock:
+                self._disk.close()
+
+def _shared_key(key: CacheKey) -> str:
+    return "translation:" + json.dumps(key, ensure_ascii=False)
@@ -0,0 +1,231 @@
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from highlight_set import normalize_word
+
+TOKEN = re.compile(r"\w+")
+
+# Match kinds, best first
+EXACT, PREFIX, SUBSTRING, FUZZY = "exact", "prefix", "substring", "fuzzy"
+MATCH_RANK = {EXACT: 0, PREFIX: 1, SUBSTRING: 2, FUZZY: 3}
+
+def trigrams(token: str) -> Set[str]:
+    """Trigrams of a token padded like pg_trgm ("  " + token + " "), so short tokens and word starts have grams too."""
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def max_edits(token: str) -> int:
+    """Typos tolerated in a query token: none up to 2 characters, 1 up to 5, 2 beyond."""
+    return 0 if len(token) <= 2 else 1 if len(token) <= 5 else 2
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance between `a` and `b` counting a swap of adjacent characters
+    as one edit (optimal string alignment), or `limit + 1` once it is known
+    to exceed `limit`. Only cells within `limit` of the diagonal can stay
+    within it, so the rest are never computed.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    before: List[int] = []
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        char = a[i - 1]
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            other = b[j - 1]
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other))
+            if i > 1 and j > 1 and char == b[j - 2] and a[i - 2] == other:
+                cost = min(cost, before[j - 2] + 1)
+            current[j] = min(cost, over)
+        if min(current) > limit and min(previous) > limit:
+            return over
+        before, previous = previous, current
+    return previous[-1]
+
+class WordIndex:
+    """
+    Inverted index over one user's highlighted words, kept up to date with
+    `add` and `remove` as words change.
+
+    Words are matched by their normalized key (case-folded, whitespace
+    collapsed) and split into tokens. Token postings map each distinct token
+    to its words, and a sorted token list answers prefix queries. Trigram
+    postings map each padded trigram to the distinct tokens holding it; they
+    narrow down substring and typo-tolerant candidates, which are checked
+    once per token rather than once per word. `version` is the user version
+    the index reflects, so a change made elsewhere shows up as a mismatch.
+    """
+
+    def __init__(self, version: int = 0, words: Iterable[str] = ()):
+        self.version = version
+        self._words: Dict[int, str] = {}
+        self._keys: Dict[str, int] = {}
+        self._tokens: Dict[str, Set[int]] = {}
+        self._sorted_tokens: List[str] = []
+        self._grams: Dict[str, Set[str]] = {}
+        self._next_id = 0
+        for word in words:
+            self.add(word, keep_sorted=False)
+        self._sorted_tokens.sort()
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    def add(self, word: str, keep_sorted: bool = True) -> bool:
+        key = normalize_word(word)
+        if key in self._keys:
+            return False
+        # Ids increase with insertion, so equal matches rank in highlight order
+        doc_id = self._next_id
+        self._next_id += 1
+        self._words[doc_id] = word
+        self._keys[key] = doc_id
+        for token in set(TOKEN.findall(key)):
+            postings = self._tokens.get(token)
+            if postings is None:
+                postings = self._tokens[token] = set()
+                if keep_sorted:
+                    bisect.insort(self._sorted_tokens, token)
+                else:
+                    self._sorted_tokens.append(token)
+                for gram in trigrams(token):
+                    self._grams.setdefault(gram, set()).add(token)
+            postings.add(doc_id)
+        return True
+
+    def remove(self, word: str) -> bool:
+        key = normalize_word(word)
+        doc_id = self._keys.pop(key, None)
+        if doc_id is None:
+            return False
+        del self._words[doc_id]
+        for token in set(TOKEN.findall(key)):
+            postings = self._tokens[token]
+            postings.discard(doc_id)
+            if not postings:
+                del self._tokens[token]
+                del self._sorted_tokens[bisect.bisect_left(self._sorted_tokens, token)]
+                for gram in trigrams(token):
+                    tokens = self._grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._grams[gram]
+        return True
+
+    def _postings(self, tokens: Iterable[str]) -> Set[int]:
+        found: Set[int] = set()
+        for token in tokens:
+            found |= self._tokens[token]
+        return found
+
+    def _with_prefix(self, prefix: str) -> Set[int]:
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        tokens = []
+        for token in self._sorted_tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return self._postings(tokens)
+
+    def _containing(self, query_tokens: List[str]) -> Set[int]:
+        """Candidates for a substring query: words with a token containing each query token."""
+        candidates: Optional[Set[int]] = None
+        for query_token in query_tokens:
+            if len(query_token) >= 3:
+                grams = [self._grams.get(query_token[i:i + 3], set()) for i in range(len(query_token) - 2)]
+                tokens = set.intersection(*sorted(grams, key=len))
+            else:
+                # Too short for a trigram of its own; the distinct trigrams are far fewer than the words
+                tokens = set()
+                for gram, gram_tokens in self._grams.items():
+                    if query_token in gram:
+                        tokens |= gram_tokens
+            found = self._postings(token for token in tokens if query_token in token)
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                return set()
+        return candidates if candidates is not None else set()
+
+    def _similar(self, query_token: str) -> Set[int]:
+        """
+        Words with a token within `max_edits` of the query token. Tokens sharing
+        too few trigrams are skipped: each insertion, deletion or substitution
+        changes at most 3, so no such match is missed, while a swap can change 4.
+        """
+        limit = max_edits(query_token)
+        grams = trigrams(query_token)
+        needed = max(1, len(grams) - 3 * limit)
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for token in self._grams.get(gram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        return self._postings(
+            token for token, count in shared.items()
+            if count >= needed and edit_distance(query_token, token, limit) <= limit
+        )
+
+    def _match(self, key: str, query: str, query_tokens: List[str], fuzzy: bool) -> Optional[Tuple[str, int]]:
+        """Best (match kind, typo count) of one word for the query, or None."""
+        if key == query:
+            return EXACT, 0
+        position = key.find(query)
+        if position >= 0:
+            while position >= 0:
+                if position == 0 or not key[position - 1].isalnum():
+                    return PREFIX, 0
+                position = key.find(query, position + 1)
+            return SUBSTRING, 0
+        if not fuzzy:
+            return None
+        tokens = TOKEN.findall(key)
+        distance = 0
+        for query_token in query_tokens:
+            # A query token matches the start of a word token, or a whole one within a few typos
+            if any(token.startswith(query_token) for token in tokens):
+                continue
+            limit = max_edits(query_token)
+            best = min((edit_distance(query_token, token, limit) for token in tokens), default=limit + 1)
+            if best > limit:
+                return None
+            distance += best
+        return FUZZY, distance
+
+    def search(self, query: str, fuzzy: bool = True) -> List[Dict]:
+        """
+        All words matching `query`, best first: the whole word, then words with
+        a token starting with it, then words containing it, then (if `fuzzy`)
+        words where each query token starts a token or is within a few typos
+        of one.
+        """
+        query = normalize_word(query)
+        query_tokens = TOKEN.findall(query)
+        if not query:
+            return []
+        fuzzy = fuzzy and any(max_edits(token) for token in query_tokens)
+        if query_tokens:
+            # Prefix matches are substrings too
+            candidates = self._containing(query_tokens)
+            if fuzzy:
+                # Every query token has to match
+                candidates |= set.intersection(*(
+                    self._with_prefix(token) | (self._similar(token) if max_edits(token) else set())
+                    for token in query_tokens
+                ))
+        else:
+            # Only punctuation or symbols: no tokens to look up
+            candidates = set(self._words)
+        ranked = []
+        for doc_id in candidates:
+            word = self._words[doc_id]
+            match = self._match(normalize_word(word), query, query_tokens, fuzzy)
+            if match is not None:
+                kind, distance = match
+                ranked.append((MATCH_RANK[kind], distance, len(word), doc_id, kind, word))
+        ranked.sort()
+        return [
+            {"word": word, "match": kind, "typos": distance}
+            for _, distance, _, _, kind, word in ranked
+        ]